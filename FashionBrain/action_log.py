@@ -0,0 +1,209 @@
+import os
+import glob
+import json
+import zlib
+import fcntl
+import struct
+import threading
+from typing import List, Optional, Tuple
+
+# Directory for the local user-action log used by write-behind mode; empty string disables it
+ACTION_LOG_DIR = os.getenv("ACTION_LOG_DIR", "action_log")
+
+# A new segment file is started once the current one reaches this size
+ACTION_LOG_SEGMENT_BYTES = int(os.getenv("ACTION_LOG_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+
+# Per record: sequence number, payload length, CRC-32 of the payload
+_HEADER = struct.Struct("<QII")
+
+ACKED_NAME = "acked.json"
+LOCK_NAME = "lock"
+
+# Worker processes each claim their own slot directory, up to this many
+MAX_SLOTS = 64
+
+
+def _segment_path(directory: str, base: int) -> str:
+    return os.path.join(directory, f"{base:020d}.log")
+
+
+def _segment_base(path: str) -> int:
+    return int(os.path.basename(path).split(".")[0])
+
+
+class ActionLog:
+    """Crash-safe append-only log of user-action batches.
+
+    Each append() is one record (a JSON list of user_actions rows) with a
+    sequence number and CRC, written to the current segment file and
+    fsync'd before append() returns. Concurrent appenders share fsyncs:
+    whoever syncs covers every record written so far (group commit).
+
+    The flusher calls ack(seq) once everything up to seq is in the
+    database. The acked offset is persisted, and segments that only hold
+    acked records are deleted. On startup, replay() returns the records
+    that were never acked; a torn record at the end of a segment (a crash
+    mid-write) fails its CRC and is cut off.
+
+    Worker processes sharing ACTION_LOG_DIR each lock their own slot
+    subdirectory, so a restarted worker picks up the log of a dead one.
+    """
+
+    def __init__(self, directory: str = ACTION_LOG_DIR, segment_bytes: int = ACTION_LOG_SEGMENT_BYTES):
+        self.segment_bytes = segment_bytes
+        self.directory, self._lock_file = self._claim_slot(directory)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file = None
+        self._segment_size = 0
+        self._segments: List[int] = []
+        self.acked = self._read_acked()
+        self._unacked = self._recover()
+        self._next_seq = max([seq for seq, _ in self._unacked] + [self.acked]) + 1
+        self._written_seq = self._next_seq - 1
+        self._synced_seq = self._written_seq
+        self.appends = 0
+        self.fsyncs = 0
+
+    @staticmethod
+    def _claim_slot(directory: str):
+        for slot in range(MAX_SLOTS):
+            path = os.path.join(directory, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, LOCK_NAME), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            return path, lock_file
+        raise RuntimeError(f"All {MAX_SLOTS} action log slots in {directory} are in use")
+
+    def _read_acked(self) -> int:
+        try:
+            with open(os.path.join(self.directory, ACKED_NAME)) as f:
+                return int(json.load(f)["offset"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _recover(self) -> List[Tuple[int, list]]:
+        """Read every segment, cut off torn tails, drop fully acked segments"""
+        unacked = []
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.log")), key=_segment_base)
+        for path in paths:
+            records, good_bytes = self._read_segment(path)
+            if good_bytes < os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(good_bytes)
+                    os.fsync(f.fileno())
+            if not records or records[-1][0] <= self.acked:
+                os.remove(path)
+                continue
+            self._segments.append(_segment_base(path))
+            unacked.extend(record for record in records if record[0] > self.acked)
+        return unacked
+
+    @staticmethod
+    def _read_segment(path: str):
+        records, position = [], 0
+        with open(path, "rb") as f:
+            data = f.read()
+        while position + _HEADER.size <= len(data):
+            seq, length, crc = _HEADER.unpack_from(data, position)
+            start, end = position + _HEADER.size, position + _HEADER.size + length
+            if end > len(data) or zlib.crc32(data[start:end]) != crc:
+                break
+            records.append((seq, json.loads(data[start:end])))
+            position = end
+        return records, position
+
+    def replay(self) -> List[Tuple[int, list]]:
+        """(seq, rows) records that were logged but never acked, oldest first; returned once"""
+        unacked, self._unacked = self._unacked, []
+        return unacked
+
+    def append(self, rows: list) -> int:
+        """Durably log a batch of rows and return its sequence number"""
+        payload = json.dumps(rows, separators=(",", ":"), default=str).encode()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            if self._file is None or self._segment_size >= self.segment_bytes:
+                self._roll(seq)
+            self._file.write(_HEADER.pack(seq, len(payload), zlib.crc32(payload)) + payload)
+            self._segment_size += _HEADER.size + len(payload)
+            self._written_seq = seq
+            self.appends += 1
+        self._sync(seq)
+        return seq
+
+    def _roll(self, base: int):
+        """Start a new segment; the old one is synced and closed first. Called with _lock held"""
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._synced_seq = self._written_seq
+        self._file = open(_segment_path(self.directory, base), "ab", buffering=0)
+        self._segment_size = 0
+        self._segments.append(base)
+
+    def _sync(self, seq: int):
+        if self._synced_seq >= seq:
+            return
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                target = self._written_seq
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.fsyncs += 1
+            self._synced_seq = max(self._synced_seq, target)
+
+    def ack(self, seq: int):
+        """Record that everything up to seq is in the database and drop segments no longer needed"""
+        if seq <= self.acked:
+            return
+        tmp_path = os.path.join(self.directory, f"{ACKED_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": seq}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, ACKED_NAME))
+        self.acked = seq
+
+        with self._lock:
+            # A segment is done once the next one starts at or before seq + 1; the current one stays open
+            while len(self._segments) > 1 and self._segments[1] <= seq + 1:
+                try:
+                    os.remove(_segment_path(self.directory, self._segments.pop(0)))
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        self._lock_file.close()
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "segments": len(self._segments),
+            "written_offset": self._written_seq,
+            "acked_offset": self.acked,
+            "appends": self.appends,
+            "fsyncs": self.fsyncs
+        }
+
+
+def open_action_log(directory: str = ACTION_LOG_DIR) -> Optional[ActionLog]:
+    """The action log for this process, or None if ACTION_LOG_DIR is empty"""
+    if not directory:
+        return None
+    return ActionLog(directory)
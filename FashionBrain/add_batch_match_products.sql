@@ -0,0 +1,61 @@
+-- Several query vectors in one call (e.g. one per inspiration image): each
+-- query gets its own nearest match_count products, tagged with query_index
+-- (0-based position in query_embeddings), under the same optional filters
+-- as match_products_filtered. Results are fused by the caller.
+CREATE OR REPLACE FUNCTION match_products_batch(
+  query_embeddings vector(512)[],
+  match_count int DEFAULT 5,
+  categories text[] DEFAULT NULL,
+  min_price numeric DEFAULT NULL,
+  max_price numeric DEFAULT NULL,
+  exclude_ids uuid[] DEFAULT NULL,
+  include_embedding boolean DEFAULT true
+)
+RETURNS TABLE (
+  query_index int,
+  id uuid,
+  name text,
+  price numeric,
+  style text,
+  material text,
+  category text,
+  brand text,
+  image_url text,
+  cloudinary_public_id text,
+  affiliate_link text,
+  embedding vector(512),
+  distance float
+)
+LANGUAGE sql STABLE
+SET ivfflat.probes = 10
+AS $$
+  SELECT
+    (q.ordinality - 1)::int,
+    m.*
+  FROM unnest(query_embeddings) WITH ORDINALITY AS q(query_embedding, ordinality)
+  CROSS JOIN LATERAL (
+    SELECT
+      p.id,
+      p.name,
+      p.price,
+      p.style,
+      p.material,
+      p.category,
+      p.brand,
+      p.image_url,
+      p.cloudinary_public_id,
+      p.affiliate_link,
+      CASE WHEN include_embedding THEN p.embedding END,
+      (p.embedding <-> q.query_embedding) as distance
+    FROM products p
+    WHERE p.embedding IS NOT NULL
+      AND (categories IS NULL OR lower(p.category) = ANY(categories))
+      AND (min_price IS NULL OR p.price >= min_price)
+      AND (max_price IS NULL OR p.price <= max_price)
+      AND (exclude_ids IS NULL OR NOT (p.id = ANY(exclude_ids)))
+    ORDER BY p.embedding <-> q.query_embedding
+    LIMIT match_count
+  ) m;
+$$;
+
+GRANT EXECUTE ON FUNCTION match_products_batch TO authenticated;
@@ -0,0 +1,55 @@
+-- Similarity search with the caller's filters evaluated in the same query,
+-- so every returned row is usable, and an option to leave out the 512-float
+-- embedding column. NULL arguments leave that predicate off; categories are
+-- compared lowercased. Probing 10 of the 100 ivfflat lists keeps enough
+-- candidates after filtering to fill match_count for typical filters.
+CREATE OR REPLACE FUNCTION match_products_filtered(
+  query_embedding vector(512),
+  match_count int DEFAULT 5,
+  categories text[] DEFAULT NULL,
+  min_price numeric DEFAULT NULL,
+  max_price numeric DEFAULT NULL,
+  exclude_ids uuid[] DEFAULT NULL,
+  include_embedding boolean DEFAULT true
+)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  price numeric,
+  style text,
+  material text,
+  category text,
+  brand text,
+  image_url text,
+  cloudinary_public_id text,
+  affiliate_link text,
+  embedding vector(512),
+  distance float
+)
+LANGUAGE sql STABLE
+SET ivfflat.probes = 10
+AS $$
+  SELECT
+    p.id,
+    p.name,
+    p.price,
+    p.style,
+    p.material,
+    p.category,
+    p.brand,
+    p.image_url,
+    p.cloudinary_public_id,
+    p.affiliate_link,
+    CASE WHEN include_embedding THEN p.embedding END,
+    (p.embedding <-> query_embedding) as distance
+  FROM products p
+  WHERE p.embedding IS NOT NULL
+    AND (categories IS NULL OR lower(p.category) = ANY(categories))
+    AND (min_price IS NULL OR p.price >= min_price)
+    AND (max_price IS NULL OR p.price <= max_price)
+    AND (exclude_ids IS NULL OR NOT (p.id = ANY(exclude_ids)))
+  ORDER BY p.embedding <-> query_embedding
+  LIMIT match_count;
+$$;
+
+GRANT EXECUTE ON FUNCTION match_products_filtered TO authenticated;
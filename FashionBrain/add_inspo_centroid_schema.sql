@@ -0,0 +1,11 @@
+-- Running inspo centroid on the users table, so /feed reads one vector
+-- instead of every inspo image embedding.
+-- inspo_count stays NULL until the app first computes the centroid from
+-- inspo_images; after that it is updated on each upload and delete.
+ALTER TABLE public.users
+ADD COLUMN IF NOT EXISTS inspo_sum vector(512),
+ADD COLUMN IF NOT EXISTS inspo_count integer,
+ADD COLUMN IF NOT EXISTS inspo_decayed_sum vector(512),
+ADD COLUMN IF NOT EXISTS inspo_decayed_weight double precision,
+ADD COLUMN IF NOT EXISTS inspo_updated_at timestamp with time zone,
+ADD COLUMN IF NOT EXISTS inspo_version integer NOT NULL DEFAULT 0;
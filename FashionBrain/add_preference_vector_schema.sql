@@ -0,0 +1,6 @@
+-- Preference vector learned online from likes and skips (Rocchio updates),
+-- blended with the inspo centroid to query products for /feed.
+-- preference_version guards concurrent updates (compare-and-set).
+ALTER TABLE public.users
+ADD COLUMN IF NOT EXISTS preference_vector vector(512),
+ADD COLUMN IF NOT EXISTS preference_version integer NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+-- Keyset pagination for /list-products walks products in (created_at, id)
+-- order; this index keeps every page an index range scan at any depth.
+CREATE INDEX IF NOT EXISTS products_created_at_id_idx ON products(created_at DESC, id DESC);
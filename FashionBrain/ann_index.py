@@ -0,0 +1,199 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+# Number of inverted lists; 0 picks roughly sqrt(N) when the index is trained
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+
+# Lists scanned per query. Higher means better recall and slower queries.
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# Below this many vectors an exact scan is as fast as the index
+ANN_MIN_INDEX_SIZE = int(os.getenv("ANN_MIN_INDEX_SIZE", "10000"))
+
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLES_PER_LIST = 64
+KMEANS_SEED_SAMPLES_PER_LIST = 8
+ASSIGN_CHUNK_SIZE = 8192
+
+# Lists holding more than this many times the mean share of the training
+# sample are split in two after k-means
+MAX_LIST_FACTOR = 2.0
+
+
+def _squared_distances(vectors: np.ndarray, centroids: np.ndarray, centroid_sq_norms: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between each vector and each centroid, up to a per-row constant."""
+    return centroid_sq_norms[None, :] - 2.0 * (vectors @ centroids.T)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of each vector's nearest centroid, computed in chunks to bound memory."""
+    sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignment[start:start + ASSIGN_CHUNK_SIZE] = np.argmin(_squared_distances(chunk, centroids, sq_norms), axis=1)
+    return assignment
+
+
+def _kmeans_plus_plus(sample: np.ndarray, nlist: int, rng: np.random.Generator) -> np.ndarray:
+    """Initial centroids spread over the sample: each is drawn with probability proportional to its squared distance from the nearest one already picked."""
+    sample_sq_norms = np.einsum("ij,ij->i", sample, sample)
+    centroids = np.empty((nlist, sample.shape[1]), dtype=np.float32)
+    centroids[0] = sample[rng.integers(len(sample))]
+    closest = np.maximum(sample_sq_norms - 2.0 * (sample @ centroids[0]) + centroids[0] @ centroids[0], 0.0)
+    for i in range(1, nlist):
+        total = closest.sum()
+        pick = rng.choice(len(sample), p=closest / total) if total > 0 else rng.integers(len(sample))
+        centroids[i] = sample[pick]
+        distance = np.maximum(sample_sq_norms - 2.0 * (sample @ centroids[i]) + centroids[i] @ centroids[i], 0.0)
+        np.minimum(closest, distance, out=closest)
+    return centroids
+
+
+def _lloyd(sample: np.ndarray, centroids: np.ndarray, iterations: int) -> np.ndarray:
+    """Refine centroids in place with k-means iterations; returns the final assignment of the sample."""
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        list_ids, starts, counts = np.unique(assignment[order], return_index=True, return_counts=True)
+        # Empty clusters keep their previous centroid
+        centroids[list_ids] = np.add.reduceat(sample[order], starts, axis=0) / counts[:, None]
+    return _assign(sample, centroids)
+
+
+class _PositionList:
+    """Growable int64 buffer holding the snapshot positions of one inverted list."""
+
+    def __init__(self):
+        self._data = np.empty(16, dtype=np.int64)
+        self._size = 0
+
+    def extend(self, positions: np.ndarray):
+        needed = self._size + len(positions)
+        if needed > len(self._data):
+            data = np.empty(max(needed, 2 * len(self._data)), dtype=np.int64)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:needed] = positions
+        self._size = needed
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+
+class IVFIndex:
+    """Inverted-file (IVF-flat) index over rows of an embedding matrix.
+
+    Vectors are clustered with k-means once; afterwards inserts are assigned
+    to their nearest centroid and deletes are handled by the caller's
+    tombstone mask, so the index never needs a full rebuild. A query scans
+    only the nprobe lists whose centroids are closest to it.
+    """
+
+    def __init__(self, nlist: int = ANN_NLIST, nprobe: int = ANN_NPROBE):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self._centroid_sq_norms: Optional[np.ndarray] = None
+        self._lists = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, seed: int = 0):
+        """Cluster vectors with k-means to pick the list centroids.
+
+        Centroids start from k-means++ seeding. Afterwards any list holding
+        more than MAX_LIST_FACTOR times its share of the sample is split with
+        2-means, so nlist can end up somewhat above the requested count.
+        """
+        count = vectors.shape[0]
+        nlist = self.nlist or int(np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * KMEANS_SAMPLES_PER_LIST)
+        # Sorted so the gather reads the matrix front to back
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+
+        # k-means++ picks centroids one at a time, so it seeds from a smaller subsample
+        seed_rows = sample[rng.choice(sample_size, min(sample_size, nlist * KMEANS_SEED_SAMPLES_PER_LIST), replace=False)]
+        centroids = _kmeans_plus_plus(seed_rows, nlist, rng)
+        assignment = _lloyd(sample, centroids, KMEANS_ITERATIONS)
+        centroids = list(centroids)
+
+        limit = max(2, int(MAX_LIST_FACTOR * sample_size / nlist))
+        members = [np.flatnonzero(assignment == list_id) for list_id in range(nlist)]
+        oversized = [list_id for list_id in range(nlist) if len(members[list_id]) > limit]
+        while oversized:
+            list_id = oversized.pop()
+            rows = sample[members[list_id]]
+            halves = _kmeans_plus_plus(rows, 2, rng)
+            split = _lloyd(rows, halves, KMEANS_ITERATIONS)
+            if split.min() == split.max():
+                # Identical vectors cannot be separated
+                continue
+            centroids[list_id] = halves[0]
+            centroids.append(halves[1])
+            parts = members[list_id][split == 0], members[list_id][split == 1]
+            members[list_id] = parts[0]
+            members.append(parts[1])
+            oversized.extend(i for i in (list_id, len(centroids) - 1) if len(members[i]) > limit)
+        centroids = np.stack(centroids)
+        nlist = len(centroids)
+
+        self.nlist = nlist
+        self.centroids = centroids.astype(np.float32)
+        self._centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self._lists = [_PositionList() for _ in range(nlist)]
+
+    def add(self, positions: np.ndarray, vectors: np.ndarray):
+        """Assign vectors (stored at the given snapshot positions) to their nearest lists."""
+        positions = np.asarray(positions, dtype=np.int64)
+        for start in range(0, len(positions), ASSIGN_CHUNK_SIZE):
+            chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+            assignment = np.argmin(
+                _squared_distances(chunk, self.centroids, self._centroid_sq_norms), axis=1
+            )
+            chunk_positions = positions[start:start + ASSIGN_CHUNK_SIZE]
+            order = np.argsort(assignment, kind="stable")
+            list_ids, starts = np.unique(assignment[order], return_index=True)
+            for list_id, group in zip(list_ids, np.split(chunk_positions[order], starts[1:])):
+                self._lists[list_id].extend(group)
+
+    @classmethod
+    def from_assignments(cls, centroids: np.ndarray, assignments: np.ndarray, nprobe: int = ANN_NPROBE) -> "IVFIndex":
+        """Rebuild an index from saved centroids and per-position list ids without re-clustering."""
+        index = cls(nlist=centroids.shape[0], nprobe=nprobe)
+        index.centroids = np.asarray(centroids, dtype=np.float32)
+        index._centroid_sq_norms = np.einsum("ij,ij->i", index.centroids, index.centroids)
+        index._lists = [_PositionList() for _ in range(index.nlist)]
+
+        assignments = np.asarray(assignments)
+        positions = np.flatnonzero(assignments >= 0)
+        order = positions[np.argsort(assignments[positions], kind="stable")]
+        list_ids, starts = np.unique(assignments[order], return_index=True)
+        for list_id, group in zip(list_ids, np.split(order, starts[1:])):
+            index._lists[list_id].extend(group)
+        return index
+
+    def assignments(self, size: int) -> np.ndarray:
+        """Return the list id of every position below size (-1 if unassigned)."""
+        result = np.full(size, -1, dtype=np.int32)
+        for list_id, positions in enumerate(self._lists):
+            result[positions.view()] = list_id
+        return result
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Return the snapshot positions stored in the nprobe lists nearest to query, in ascending order."""
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        distances = self._centroid_sq_norms - 2.0 * (self.centroids @ query)
+        if nprobe < self.nlist:
+            probe = np.argpartition(distances, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        # Sorted so the caller's gather of these rows walks the matrix in order
+        return np.sort(np.concatenate([self._lists[list_id].view() for list_id in probe]))
@@ -1,24 +1,42 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Cookie, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import HTMLResponse
-from supabase import create_client
+from fastapi.responses import HTMLResponse, StreamingResponse
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
 import os
 from typing import Optional
 import io
+import time
+import asyncio
+import itertools
 from PIL import Image
 from itsdangerous import URLSafeTimedSerializer
 import secrets
 from cloudinary_config import *
-from clip_model import generate_embedding
-from vector_search import search_products
-from feedback import log_user_action
-from auth import JWTBearer
+import db
+from db import DatabaseConfigError, DatabaseConnectionError, DatabaseUnreachableError
+from clip_model import get_embedding_stats, warmup as warmup_embedding_model
+from vector_search import search_products, search_products_batch, has_local_embeddings, take_product_embeddings, index_product, remove_indexed_product, warm_start
+from feedback import log_user_actions, action_writer, start_action_writer
+from auth import JWTBearer, token_cache
+from executors import io_executor, run_io, run_cpu
+from embedding_batcher import embedding_batcher
+from embedding_cache import embedding_cache, text_cache_key, image_cache_key
 from pydantic import BaseModel
-from outfit_generator import generate_outfits, generate_outfits_with_advanced_filter
+from outfit_generator import iter_outfits, iter_outfits_with_advanced_filter, iter_ranked_outfits, generate_ranked_outfits, OUTFIT_CATEGORIES
+from cursors import InvalidCursorError
+from feed_sessions import feed_sessions, encode_cursor, decode_cursor
+from materialized_feed import materialized_feeds, MaterializedFeed, FEED_MATERIALIZED_SIZE, load_feed_inputs
+from seen_products import seen_products
+from inspo_centroid import INSPO_FEED_QUERIES, load_centroid, load_inspo_embeddings, update_centroid
+from saved_outfits import saved_outfits_cache, load_saved_outfits
+from product_cache import product_cache
+from product_listing import LIST_PRODUCTS_MAX_LIMIT, fetch_page, iter_pages, ndjson_lines, encode_keyset, decode_keyset
+from preference_vector import update_preference, combine_query, preference_from_row
+from embedding_index import row_embedding
+from embedding_codec import encode_embedding
 
 # Force-load .env from project root and allow overriding process env
 load_dotenv(dotenv_path=".env", override=True)
@@ -38,37 +56,84 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-supabase = None
+@app.on_event("startup")
+def load_embedding_store():
+    warm_start()
+
+@app.on_event("startup")
+def load_embedding_model():
+    # Opt-in so the hash backend and local runs don't pay for a model load
+    if os.getenv("EMBEDDING_WARMUP", "false").lower() in ("1", "true", "yes"):
+        warmup_embedding_model()
+
+@app.on_event("startup")
+def replay_user_actions():
+    start_action_writer()
+
+@app.on_event("shutdown")
+def flush_user_actions():
+    action_writer.close()
+
+def _invalidate_saved_outfits(rows):
+    # With write-behind, likes reach user_actions after /action returns
+    for user_id in {row["user_id"] for row in rows if row["action"] == "like"}:
+        saved_outfits_cache.invalidate(user_id)
+
+action_writer.add_listener(_invalidate_saved_outfits)
 
 def get_supabase_client():
-    global supabase
-    if supabase is None:
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_KEY")
-        if not supabase_url or not supabase_key:
-            raise HTTPException(
-                status_code=500,
-                detail="Supabase credentials not configured. Please set SUPABASE_URL and SUPABASE_KEY environment variables."
-            )
-        
-        # Ensure URL is properly formatted
-        if not supabase_url.startswith('http'):
-            supabase_url = f'https://{supabase_url}'
-        
-        try:
-            supabase = create_client(supabase_url, supabase_key)
-        except Exception as e:
-            error_str = str(e).lower()
-            if "nodename" in error_str or "servname" in error_str or "getaddrinfo" in error_str:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Database connection failed. Please check your SUPABASE_URL in .env file and internet connection."
-                )
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to initialize database connection: {str(e)}"
-            )
-    return supabase
+    """Shared pooled Supabase client, with configuration errors surfaced as HTTP errors"""
+    try:
+        return db.get_supabase_client()
+    except DatabaseConfigError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except DatabaseUnreachableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except DatabaseConnectionError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _decode_image(contents: bytes) -> Image.Image:
+    """Decode an uploaded image (CPU-bound, run on the CPU pool)"""
+    img = Image.open(io.BytesIO(contents))
+    img.load()
+    return img
+
+async def _cached_embedding(key: str):
+    """Embedding cache lookup; the SQLite tier is only touched on the I/O pool"""
+    cached = embedding_cache.get_memory(key)
+    if cached is None:
+        if embedding_cache.disk_tier:
+            cached = await run_io(embedding_cache.get_disk, key)
+        else:
+            cached = embedding_cache.get_disk(key)
+    return cached
+
+def _cache_embedding(key: str, embedding):
+    embedding_cache.put_memory(key, embedding)
+    if embedding_cache.disk_tier:
+        # Written in the background; the response doesn't wait for the commit
+        io_executor.submit(embedding_cache.put_disk, key, embedding)
+
+async def _embed_text(text: str) -> list:
+    """Embed a text query, served from the embedding cache when it was seen before"""
+    key = text_cache_key(text)
+    cached = await _cached_embedding(key)
+    if cached is not None:
+        return cached.tolist()
+    embedding = await embedding_batcher.embed_text(text)
+    _cache_embedding(key, embedding)
+    return embedding
+
+async def _embed_image_bytes(contents: bytes) -> list:
+    """Embed uploaded image bytes, cached by a hash of the bytes"""
+    key = image_cache_key(contents)
+    cached = await _cached_embedding(key)
+    if cached is not None:
+        return cached.tolist()
+    img = await run_cpu(_decode_image, contents)
+    embedding = await embedding_batcher.embed_image(img)
+    _cache_embedding(key, embedding)
+    return embedding
 
 def verify_admin(session_token: Optional[str] = Cookie(None)):
     if not session_token:
@@ -149,6 +214,36 @@ def debug_env():
         "SUPABASE_KEY_set": bool(os.getenv("SUPABASE_KEY"))
     }
 
+@app.get("/debug/embedding")
+def debug_embedding():
+    # Backend name plus per-text and per-image latency, for instance sizing
+    stats = get_embedding_stats()
+    stats["batching"] = embedding_batcher.stats()
+    stats["cache"] = embedding_cache.stats()
+    return stats
+
+@app.get("/debug/feed")
+def debug_feed():
+    # Precomputed feed hit ratio, freshness lag and /feed latency
+    stats = materialized_feeds.stats()
+    stats["sessions"] = feed_sessions.stats()
+    return stats
+
+@app.get("/debug/auth")
+def debug_auth():
+    # Verified-token cache hit ratio
+    return token_cache.stats()
+
+@app.get("/debug/catalog")
+def debug_catalog():
+    # Product metadata cache hit ratio
+    return product_cache.stats()
+
+@app.get("/debug/actions")
+def debug_actions():
+    # Write-behind queue depth and flush counts
+    return action_writer.stats()
+
 @app.post("/auth/signup")
 async def signup(credentials: AuthCredentials):
     try:
@@ -156,7 +251,7 @@ async def signup(credentials: AuthCredentials):
         
         # Try to sign up with Supabase Auth
         try:
-            res = supabase.auth.sign_up({
+            res = await run_io(supabase.auth.sign_up, {
                 "email": credentials.email,
                 "password": credentials.password
             })
@@ -200,7 +295,7 @@ async def signup(credentials: AuthCredentials):
         }
         
         try:
-            supabase.table("users").insert(user_data).execute()
+            await run_io(supabase.table("users").insert(user_data).execute)
         except Exception as db_error:
             print(f"Warning: Could not insert user data: {db_error}")
             # Continue anyway - user is created in auth, just not in our users table
@@ -248,7 +343,7 @@ async def signup(credentials: AuthCredentials):
 async def login(credentials: AuthCredentials):
     try:
         supabase = get_supabase_client()
-        res = supabase.auth.sign_in_with_password({
+        res = await run_io(supabase.auth.sign_in_with_password, {
             "email": credentials.email,
             "password": credentials.password
         })
@@ -256,7 +351,7 @@ async def login(credentials: AuthCredentials):
         if not res.user or not res.session:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        user_data = supabase.table("users").select("*").eq("id", res.user.id).execute()
+        user_data = await run_io(supabase.table("users").select("*").eq("id", res.user.id).execute)
         
         user = user_data.data[0] if user_data.data else {
             "id": res.user.id,
@@ -284,7 +379,7 @@ async def logout():
 async def get_current_user_info(user_id: str = Depends(JWTBearer())):
     try:
         supabase = get_supabase_client()
-        user_data = supabase.table("users").select("*").eq("id", user_id).execute()
+        user_data = await run_io(supabase.table("users").select("*").eq("id", user_id).execute)
         
         if user_data.data:
             return {"user": user_data.data[0]}
@@ -301,23 +396,32 @@ async def upload_inspo_image(
     try:
         contents = await image.read()
         
-        upload_result = cloudinary.uploader.upload(
+        upload_result = await run_io(
+            cloudinary.uploader.upload,
             contents,
             folder="inspo_images"
         )
         
-        img = Image.open(io.BytesIO(contents))
-        embedding = generate_embedding(image=img)
+        embedding = await _embed_image_bytes(contents)
 
         supabase = get_supabase_client()
         inspo_data = {
             "user_id": user_id,
             "image_url": upload_result["secure_url"],
             "cloudinary_public_id": upload_result["public_id"],
-            "embedding": embedding
+            # Sent in binary form; the database fills the vector column from it
+            "embedding_b64": encode_embedding(embedding) if embedding is not None else None
         }
         
-        result = supabase.table("inspo_images").insert(inspo_data).execute()
+        result = await run_io(supabase.table("inspo_images").insert(inspo_data).execute)
+        
+        # Keep the running centroid on the user in step, so /feed never refetches every image
+        try:
+            inserted = result.data[0] if result.data else {}
+            await run_io(update_centroid, supabase, user_id, embedding, inserted.get("created_at"))
+        except Exception as centroid_error:
+            print(f"Warning: Could not update inspo centroid: {centroid_error}")
+        _refresh_feed(user_id)
         
         return {
             "success": True,
@@ -326,6 +430,46 @@ async def upload_inspo_image(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/onboarding/inspo-image/{image_id}")
+async def delete_inspo_image(
+    image_id: str,
+    user_id: str = Depends(JWTBearer())
+):
+    try:
+        supabase = get_supabase_client()
+        
+        image = await run_io(supabase.table("inspo_images").select("id,embedding_b64,created_at,cloudinary_public_id").eq(
+            "id", image_id
+        ).eq("user_id", user_id).execute)
+        if not image.data:
+            raise HTTPException(status_code=404, detail="Inspiration image not found")
+        image = image.data[0]
+        
+        await run_io(supabase.table("inspo_images").delete().eq("id", image_id).eq("user_id", user_id).execute)
+        
+        embedding = row_embedding(image)
+        if embedding is not None:
+            try:
+                await run_io(update_centroid, supabase, user_id, embedding, image.get("created_at"), -1)
+            except Exception as centroid_error:
+                print(f"Warning: Could not update inspo centroid: {centroid_error}")
+        _refresh_feed(user_id)
+        
+        if image.get("cloudinary_public_id"):
+            try:
+                await run_io(cloudinary.uploader.destroy, image["cloudinary_public_id"])
+            except Exception as cloudinary_error:
+                print(f"Warning: Could not delete image from Cloudinary: {cloudinary_error}")
+        
+        return {
+            "success": True,
+            "message": "Inspiration image deleted"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/onboarding/budget")
 async def save_budget(
     budget: UserBudget,
@@ -334,19 +478,20 @@ async def save_budget(
     try:
         supabase = get_supabase_client()
         
-        user_check = supabase.table("users").select("id").eq("id", user_id).execute()
+        user_check = await run_io(supabase.table("users").select("id").eq("id", user_id).execute)
         
         if user_check.data:
-            result = supabase.table("users").update({
+            result = await run_io(supabase.table("users").update({
                 "min_price": budget.min_price,
                 "max_price": budget.max_price
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id).execute)
         else:
-            result = supabase.table("users").insert({
+            result = await run_io(supabase.table("users").insert({
                 "id": user_id,
                 "min_price": budget.min_price,
                 "max_price": budget.max_price
-            }).execute()
+            }).execute)
+        _refresh_feed(user_id)
         
         return {
             "success": True,
@@ -382,13 +527,13 @@ async def complete_onboarding(
             update_data["budget_range"] = data.budget_range
         
         # Check if user exists
-        user_check = supabase.table("users").select("id").eq("id", user_id).execute()
+        user_check = await run_io(supabase.table("users").select("id").eq("id", user_id).execute)
         
         if user_check.data:
-            result = supabase.table("users").update(update_data).eq("id", user_id).execute()
+            result = await run_io(supabase.table("users").update(update_data).eq("id", user_id).execute)
         else:
             update_data["id"] = user_id
-            result = supabase.table("users").insert(update_data).execute()
+            result = await run_io(supabase.table("users").insert(update_data).execute)
         
         return {
             "success": True,
@@ -420,9 +565,9 @@ async def recommend(
         if request.image_url is not None:
             # For now, we'll use a simple text-based approach
             # In production, you'd want to download and process the image
-            embedding = generate_embedding(text=f"outfit similar to image at {request.image_url}")
+            embedding = await _embed_text(f"outfit similar to image at {request.image_url}")
         elif request.query is not None:
-            embedding = generate_embedding(text=request.query)
+            embedding = await _embed_text(request.query)
         
         if embedding is None:
             raise HTTPException(
@@ -430,14 +575,20 @@ async def recommend(
                 detail="Failed to generate embedding"
             )
         
-        results = search_products(embedding, top_k=request.top_k)
+        results = await run_io(search_products, embedding, top_k=request.top_k)
         
         # Generate outfit recommendations from the products
         recommendations = []
         if results:
-            # Group products by category and create outfit combinations
-            outfits = generate_outfits(results, user_id)
-            recommendations = outfits[:request.top_k]
+            # Rank outfit combinations by compatibility and similarity to the query
+            embeddings, products = take_product_embeddings([r["product"] for r in results])
+            recommendations = await run_cpu(
+                generate_ranked_outfits,
+                products,
+                query_embedding=embedding,
+                num_outfits=request.top_k,
+                embeddings=embeddings
+            )
         
         return {
             "success": True,
@@ -448,116 +599,221 @@ async def recommend(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _build_feed(supabase, user_id: str, use_advanced_filter: bool):
+    """Lazily generated outfits for the user's feed (best first when an inspo vector is available) and their seen-set"""
+    # Get user budget
+    user_data = await run_io(supabase.table("users").select("*").eq("id", user_id).execute)
+    user_budget = None
+    if user_data.data and len(user_data.data) > 0:
+        user = user_data.data[0]
+        if user.get('min_price') is not None and user.get('max_price') is not None:
+            user_budget = {
+                'min_price': float(user['min_price']),
+                'max_price': float(user['max_price'])
+            }
+    
+    # Products the user already liked or skipped; loaded once, then kept current by /action
+    seen = await run_io(seen_products.get, user_id, supabase)
+    
+    # Mean of the user's inspiration images, blended with what their likes and skips taught us
+    user = user_data.data[0] if user_data.data else None
+    inspo_centroid = await run_io(load_centroid, supabase, user_id, user)
+    preference = preference_from_row(user)
+    combined_embedding = combine_query(inspo_centroid, preference)
+    if combined_embedding is not None:
+        # Only usable candidates come back: outfit categories, items that fit the
+        # budget, nothing already seen. Embeddings are only needed for ranking,
+        # and only fetched when the local snapshot cannot supply them
+        filters = {"categories": OUTFIT_CATEGORIES, "exclude_ids": list(seen)}
+        if user_budget is not None:
+            filters["max_price"] = user_budget["max_price"]
+        # Users with several inspo images get one query per image (each blended
+        # with their preference), fused into one candidate list in a single search
+        inspo_embeddings = []
+        if INSPO_FEED_QUERIES > 0 and ((user or {}).get("inspo_count") or 0) > 1:
+            inspo_embeddings = await run_io(load_inspo_embeddings, supabase, user_id)
+        queries = [combine_query(embedding, preference) for embedding in inspo_embeddings]
+        results = await run_io(
+            search_products_batch,
+            queries if len(queries) > 1 else [combined_embedding],
+            top_k=50,
+            filters=filters,
+            include_embedding=not use_advanced_filter and not has_local_embeddings()
+        )
+        # Outfits carry their items to the client, so the embeddings come off here
+        embeddings, products = take_product_embeddings([r["product"] for r in results])
+    else:
+        # Served from the catalog cache; only select necessary fields when it misses
+        products = await run_io(
+            product_cache.get_listing,
+            "feed",
+            lambda: supabase.table("products").select("id,name,price,image_url,category,brand,size,color,affiliate_link").limit(50).execute().data or []
+        )
+    
+    # Generate outfits based on filter type
+    if use_advanced_filter:
+        # Advanced filter with per-category budgets
+        category_budgets = None
+        if user_data.data and len(user_data.data) > 0:
+            user = user_data.data[0]
+            # Check if user has category-specific budgets set
+            if user.get('tops_max_price') or user.get('bottoms_max_price'):
+                category_budgets = {}
+                if user.get('tops_max_price'):
+                    category_budgets['tops'] = {'min': 0, 'max': float(user['tops_max_price'])}
+                if user.get('bottoms_max_price'):
+                    category_budgets['bottoms'] = {'min': 0, 'max': float(user['bottoms_max_price'])}
+                if user.get('shoes_max_price'):
+                    category_budgets['shoes'] = {'min': 0, 'max': float(user['shoes_max_price'])}
+                if user.get('accessories_max_price'):
+                    category_budgets['accessories'] = {'min': 0, 'max': float(user['accessories_max_price'])}
+        
+        outfits = await run_cpu(
+            iter_outfits_with_advanced_filter,
+            products,
+            total_budget=user_budget,
+            category_budgets=category_budgets,
+            exclude=seen
+        )
+    elif combined_embedding is not None:
+        # Best outfits by item compatibility and similarity to the user's inspiration
+        outfits = await run_cpu(
+            iter_ranked_outfits,
+            products,
+            query_embedding=combined_embedding,
+            user_budget=user_budget,
+            exclude=seen,
+            embeddings=embeddings
+        )
+    else:
+        # Simple total outfit price filter
+        outfits = await run_cpu(iter_outfits, products, user_budget=user_budget, exclude=seen)
+    
+    return outfits, seen
+
+def _unseen(outfits, seen):
+    # Checked as outfits are read, so products liked or skipped on an earlier page stay hidden too
+    return (
+        outfit for outfit in outfits
+        if not any(item.get('id') in seen for item in outfit['items'])
+    )
+
+def _first_unseen(outfits, seen, num_outfits: int) -> list:
+    return list(itertools.islice(_unseen(outfits, seen), num_outfits))
+
+async def _materialize_feed(user_id: str) -> MaterializedFeed:
+    supabase = get_supabase_client()
+    # Read before building, so a change made mid-build leaves the feed stamped as stale
+    inputs = await run_io(load_feed_inputs, supabase, user_id)
+    outfits, seen = await _build_feed(supabase, user_id, use_advanced_filter=False)
+    return MaterializedFeed(await run_cpu(_first_unseen, outfits, seen, FEED_MATERIALIZED_SIZE), seen, inputs)
+
+def _refresh_feed(user_id: str):
+    """Rebuild the user's precomputed feed in the background"""
+    materialized_feeds.invalidate(user_id, _materialize_feed)
+
+def _outfit_key(outfit) -> tuple:
+    return tuple(str(item.get('id')) for item in outfit['items'])
+
+def _live_continuation(user_id: str, feed: MaterializedFeed):
+    """Continues a feed past its precomputed outfits with a live build, skipping the outfits it held"""
+    served = {_outfit_key(outfit) for outfit in feed.outfits}
+    async def build():
+        outfits, seen = await _build_feed(get_supabase_client(), user_id, use_advanced_filter=False)
+        return (outfit for outfit in _unseen(outfits, seen) if _outfit_key(outfit) not in served)
+    return build
+
+# Preference updates running off the request path; the event loop only keeps weak references to tasks
+_background_tasks = set()
+
+async def _learn_preference(user_id: str, product_ids: list, action_type: str):
+    try:
+        await run_io(update_preference, get_supabase_client(), user_id, product_ids, action_type)
+    except Exception as e:
+        print(f"Warning: Could not update preference vector: {e}")
+    materialized_feeds.record_action(user_id, _materialize_feed)
+
 @app.get("/feed")
 async def get_personalized_feed(
     user_id: str = Depends(JWTBearer()),
     num_outfits: int = 10,
-    use_advanced_filter: bool = False
+    use_advanced_filter: bool = False,
+    cursor: Optional[str] = None
 ):
+    started = time.perf_counter()
     try:
-        supabase = get_supabase_client()
-        import numpy as np
+        offset = 0
+        session = None
+        if cursor:
+            try:
+                session_id, offset = decode_cursor(cursor)
+            except InvalidCursorError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            session = feed_sessions.get(session_id, user_id)
         
-        # Get user budget
-        user_data = supabase.table("users").select("*").eq("id", user_id).execute()
-        user_budget = None
-        if user_data.data and len(user_data.data) > 0:
-            user = user_data.data[0]
-            if user.get('min_price') is not None and user.get('max_price') is not None:
-                user_budget = {
-                    'min_price': float(user['min_price']),
-                    'max_price': float(user['max_price'])
-                }
+        if session is None and not cursor and not use_advanced_filter:
+            # First page: read the precomputed feed if it is still current, otherwise build it
+            # once through the store (joining a rebuild already running) and serve that
+            feed = materialized_feeds.get(user_id)
+            if feed is not None and feed.needs_check():
+                # Changes made through other workers only show up on the user row
+                if feed.inputs != await run_io(load_feed_inputs, get_supabase_client(), user_id):
+                    materialized_feeds.reject(user_id, feed)
+                    feed = None
+                else:
+                    feed.checked_at = time.monotonic()
+            if feed is None:
+                feed = await materialized_feeds.build_now(user_id, _materialize_feed)
+            if feed is not None:
+                continuation = _live_continuation(user_id, feed) if feed.truncated else None
+                session = feed_sessions.create(user_id, _unseen(iter(feed.outfits), feed.seen), continuation)
         
-        # Get inspiration images
-        inspo_images = supabase.table("inspo_images").select("embedding").eq("user_id", user_id).execute()
+        outfits = await run_cpu(session.page, offset, num_outfits) if session else None
+        if outfits is not None and session.exhausted and session.continuation is not None:
+            # The precomputed outfits ran out mid-page: carry on with the open-ended live stream
+            outfits = await run_cpu(session.continue_with, await session.continuation(), num_outfits)
+        if outfits is None:
+            # Advanced filter, a failed build, or the session expired: build the feed now and skip what was already served
+            supabase = get_supabase_client()
+            session = feed_sessions.create(user_id, _unseen(*await _build_feed(supabase, user_id, use_advanced_filter)))
+            if offset:
+                await run_cpu(session.skip, offset)
+            outfits = await run_cpu(session.page, session.offset, num_outfits)
         
-        if inspo_images.data and len(inspo_images.data) > 0:
-            embeddings = [np.array(img["embedding"]) for img in inspo_images.data]
-            combined_embedding = np.mean(embeddings, axis=0)
-            
-            results = search_products(combined_embedding, top_k=50)
-            products = [r["product"] for r in results]
-        else:
-            # Only select necessary fields for faster queries
-            all_products = supabase.table("products").select("id,name,price,image_url,category,brand,size,color,affiliate_link").limit(50).execute()
-            products = all_products.data
-        
-        # Generate outfits based on filter type
-        if use_advanced_filter:
-            # Advanced filter with per-category budgets
-            category_budgets = None
-            if user_data.data and len(user_data.data) > 0:
-                user = user_data.data[0]
-                # Check if user has category-specific budgets set
-                if user.get('tops_max_price') or user.get('bottoms_max_price'):
-                    category_budgets = {}
-                    if user.get('tops_max_price'):
-                        category_budgets['tops'] = {'min': 0, 'max': float(user['tops_max_price'])}
-                    if user.get('bottoms_max_price'):
-                        category_budgets['bottoms'] = {'min': 0, 'max': float(user['bottoms_max_price'])}
-                    if user.get('shoes_max_price'):
-                        category_budgets['shoes'] = {'min': 0, 'max': float(user['shoes_max_price'])}
-                    if user.get('accessories_max_price'):
-                        category_budgets['accessories'] = {'min': 0, 'max': float(user['accessories_max_price'])}
-            
-            outfits = generate_outfits_with_advanced_filter(
-                products, 
-                total_budget=user_budget,
-                category_budgets=category_budgets,
-                num_outfits=num_outfits
-            )
-        else:
-            # Simple total outfit price filter
-            outfits = generate_outfits(products, user_budget=user_budget, num_outfits=num_outfits)
+        next_cursor = None if session.exhausted else encode_cursor(session.id, session.offset)
+        if next_cursor is None:
+            feed_sessions.discard(session.id)
         
         return {
             "success": True,
             "outfits": outfits,
-            "count": len(outfits)
+            "count": len(outfits),
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        materialized_feeds.read_latency.record(time.perf_counter() - started)
 
 @app.get("/saved")
 async def get_saved_items(user_id: str = Depends(JWTBearer())):
     try:
-        supabase = get_supabase_client()
-        
-        saved_actions = supabase.table("user_actions").select("*").eq("user_id", user_id).eq("action", "like").execute()
-        
-        if not saved_actions.data:
-            return {"success": True, "saved_outfits": [], "count": 0}
-        
-        # Group by outfit_id
-        outfits_dict = {}
-        for action in saved_actions.data:
-            outfit_id = action.get("outfit_id", action["product_id"])  # Fallback to product_id if no outfit_id
-            
-            if outfit_id not in outfits_dict:
-                outfits_dict[outfit_id] = []
-            
-            outfits_dict[outfit_id].append(action["product_id"])
-        
-        # Fetch products for each outfit
-        saved_outfits = []
-        for outfit_id, product_ids in outfits_dict.items():
-            products = supabase.table("products").select("*").in_("id", product_ids).execute()
-            
-            total_price = sum(float(p.get('price', 0)) for p in products.data)
-            
-            saved_outfits.append({
-                "outfit_id": outfit_id,
-                "items": products.data,
-                "total_price": total_price,
-                "item_count": len(products.data)
-            })
+        saved_outfits = saved_outfits_cache.get(user_id)
+        if saved_outfits is None:
+            supabase = get_supabase_client()
+            # One user_actions query with the products embedded
+            saved_outfits = await run_io(load_saved_outfits, supabase, user_id)
+            saved_outfits_cache.put(user_id, saved_outfits)
         
         return {
             "success": True,
             "saved_outfits": saved_outfits,
             "count": len(saved_outfits)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -591,24 +847,31 @@ async def user_action(
             import uuid
             outfit_id = str(uuid.uuid4())
         
-        results = []
-        for pid in product_id_list:
-            pid = pid.strip()
-            result = log_user_action(user_id, pid, action_type, supabase)
-            
-            # Also store outfit_id for grouping (only for likes with multiple items)
-            if action_type == "like" and len(product_id_list) > 1:
-                supabase.table("user_actions").update({
-                    "outfit_id": outfit_id
-                }).eq("user_id", user_id).eq("product_id", pid).eq("action", "like").execute()
-            
-            results.append(result)
+        product_id_list = [pid.strip() for pid in product_id_list]
+        
+        # One insert for all products, with outfit_id for grouping multi-item outfits
+        result = await run_io(
+            log_user_actions,
+            user_id,
+            product_id_list,
+            action_type,
+            outfit_id if len(product_id_list) > 1 else None,
+            supabase
+        )
+        
+        seen_products.record(user_id, product_id_list, action_type)
+        if action_type == "like":
+            saved_outfits_cache.invalidate(user_id)
+        # Learn from the like/skip off the request path, then rebuild the feed with it
+        task = asyncio.ensure_future(_learn_preference(user_id, product_id_list, action_type))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
         
         return {
             "success": True,
             "message": f"{'Outfit' if len(product_id_list) > 1 else 'Item'} {action_type}d successfully",
             "outfit_id": outfit_id if len(product_id_list) > 1 else None,
-            "actions": results
+            "actions": result["data"]
         }
             
     except Exception as e:
@@ -630,13 +893,13 @@ async def add_product(
     try:
         contents = await image.read()
         
-        upload_result = cloudinary.uploader.upload(
+        upload_result = await run_io(
+            cloudinary.uploader.upload,
             contents,
             folder="fashion_app/products"
         )
         
-        img = Image.open(io.BytesIO(contents))
-        embedding = generate_embedding(image=img)  
+        embedding = await _embed_image_bytes(contents)
         
         if embedding is None:
             print("Warning: Embedding generation disabled due to disk space")
@@ -646,7 +909,7 @@ async def add_product(
             "price": price,
             "image_url": upload_result["secure_url"],
             "cloudinary_public_id": upload_result["public_id"],
-            "embedding": embedding,  
+            "embedding_b64": encode_embedding(embedding) if embedding is not None else None,
             "description": description,
             "category": category,
             "brand": brand,
@@ -656,7 +919,12 @@ async def add_product(
         }
         
         supabase_client = get_supabase_client()
-        response = supabase_client.table("products").insert(product_data).execute()
+        response = await run_io(supabase_client.table("products").insert(product_data).execute)
+        
+        if response.data:
+            index_product(response.data[0])
+            product_cache.invalidate(response.data[0].get("id"))
+            product_cache.put_many(response.data)
         
         return {
             "success": True,
@@ -668,17 +936,63 @@ async def add_product(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/list-products")
-async def list_products(admin_data: dict = Depends(verify_admin)):
+async def list_products(
+    admin_data: dict = Depends(verify_admin),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    format: str = "json"
+):
     try:
         supabase_client = get_supabase_client()
-        # Limit to 100 products and exclude embeddings for faster response
-        response = supabase_client.table("products").select("id,name,price,description,category,brand,size,color,image_url,affiliate_link,created_at").limit(100).execute()
+        filters = {"category": category, "brand": brand, "min_price": min_price, "max_price": max_price}
+        try:
+            after = decode_keyset(cursor) if cursor else None
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if format == "ndjson":
+            # Stream every matching product one database page at a time, so memory stays flat
+            pages = iter_pages(supabase_client, filters, after)
+            
+            async def stream():
+                while True:
+                    try:
+                        page = await run_io(next, pages, None)
+                    except Exception as e:
+                        # The 200 status is already sent; end with an error record so clients can't mistake this for the end
+                        print(f"Warning: Product export stopped early: {e}")
+                        yield ndjson_lines([{"error": str(e)}])
+                        return
+                    if page is None:
+                        return
+                    yield ndjson_lines(page)
+            
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+        
+        # Exclude embeddings and page by (created_at, id) for fast responses at any depth
+        limit = max(1, min(limit, LIST_PRODUCTS_MAX_LIMIT))
+        if after is None:
+            # First pages are what the dashboard opens with; serve them from the catalog cache
+            products = await run_io(
+                product_cache.get_listing,
+                f"admin:{limit}:{category}:{brand}:{min_price}:{max_price}",
+                lambda: fetch_page(supabase_client, filters, None, limit)
+            )
+        else:
+            products = await run_io(fetch_page, supabase_client, filters, after, limit)
         
         return {
             "success": True,
-            "products": response.data,
-            "count": len(response.data) if response.data else 0
+            "products": products,
+            "count": len(products),
+            "next_cursor": encode_keyset(products[-1]) if len(products) == limit else None
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -687,17 +1001,21 @@ async def delete_product(product_id: str, admin_data: dict = Depends(verify_admi
     try:
         supabase_client = get_supabase_client()
         
-        product_response = supabase_client.table("products").select("cloudinary_public_id").eq("id", product_id).execute()
+        product_response = await run_io(supabase_client.table("products").select("cloudinary_public_id").eq("id", product_id).execute)
         
         if product_response.data and len(product_response.data) > 0:
             public_id = product_response.data[0].get("cloudinary_public_id")
             if public_id:
                 try:
-                    cloudinary.uploader.destroy(public_id)
+                    await run_io(cloudinary.uploader.destroy, public_id)
                 except:
                     pass
         
-        response = supabase_client.table("products").delete().eq("id", product_id).execute()
+        response = await run_io(supabase_client.table("products").delete().eq("id", product_id).execute)
+        remove_indexed_product(product_id)
+        product_cache.invalidate(product_id)
+        saved_outfits_cache.clear()
+        materialized_feeds.discard_product(product_id)
         
         return {
             "success": True,
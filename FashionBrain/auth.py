@@ -2,6 +2,11 @@ from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +14,104 @@ load_dotenv()
 JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 ALGORITHM = "HS256"
 
+# Verified tokens remembered so repeat requests skip signature and claim checks (LRU)
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+# Longest a verified token is trusted from the cache, even if its exp is later (or missing)
+JWT_CACHE_MAX_SECONDS = float(os.getenv("JWT_CACHE_MAX_SECONDS", "3600"))
+
+
+def get_jwt_secret() -> Optional[str]:
+    """Current signing secret; read each time so a rotated secret takes effect without a restart"""
+    return os.getenv("SUPABASE_JWT_SECRET") or JWT_SECRET
+
+
+class VerifiedTokenCache:
+    """LRU of verified tokens: SHA-256 of the token -> (sub, expiry).
+
+    Entries are valid until the token's exp (capped at JWT_CACHE_MAX_SECONDS).
+    The cache remembers a fingerprint of the secret it was filled under and
+    empties itself when the secret changes, so a rotated secret never
+    accepts tokens that were only verified against the old one.
+    """
+
+    def __init__(self, max_size: int = JWT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._secret_fingerprint: Optional[bytes] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def _check_secret(self, secret: str):
+        fingerprint = hashlib.sha256(secret.encode()).digest()
+        if fingerprint != self._secret_fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._secret_fingerprint = fingerprint
+
+    def get(self, token: str, secret: str) -> Optional[str]:
+        key = self._key(token)
+        with self._lock:
+            self._check_secret(secret)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            sub, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sub
+
+    def put(self, token: str, secret: str, sub: str, exp=None):
+        expires_at = time.time() + JWT_CACHE_MAX_SECONDS
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        with self._lock:
+            self._check_secret(secret)
+            self._entries[key] = (sub, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+token_cache = VerifiedTokenCache()
+
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
@@ -26,27 +129,37 @@ class JWTBearer(HTTPBearer):
             raise HTTPException(status_code=403, detail="Invalid authorization code")
     
     def verify_jwt(self, jwtoken: str) -> str:
-        if not JWT_SECRET:
+        secret = get_jwt_secret()
+        if not secret:
             raise HTTPException(status_code=500, detail="JWT secret not configured")
         
+        sub = token_cache.get(jwtoken, secret)
+        if sub is not None:
+            return sub
+        
         try:
             payload = jwt.decode(
                 jwtoken, 
-                JWT_SECRET, 
+                secret, 
                 algorithms=[ALGORITHM],
                 audience="authenticated"
             )
-            return payload.get("sub")
         except JWTError:
             return None
+        
+        sub = payload.get("sub")
+        if sub:
+            token_cache.put(jwtoken, secret, sub, payload.get("exp"))
+        return sub
 
 def get_current_user(token: str):
     """Extract user ID from JWT token"""
-    if not JWT_SECRET:
+    secret = get_jwt_secret()
+    if not secret:
         raise HTTPException(status_code=500, detail="JWT secret not configured")
     
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM], audience="authenticated")
+        payload = jwt.decode(token, secret, algorithms=[ALGORITHM], audience="authenticated")
         return payload.get("sub")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the request path.
+
+Serves two copies of a typical request (a simulated Supabase round trip
+followed by an image embedding) from an in-process FastAPI app: one that
+makes the blocking calls directly on the event loop, the way the routes used
+to, and one that goes through executors.run_io / run_cpu. Throughput is
+reported for increasing numbers of in-flight requests.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--latency-ms 50] [--requests 200]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from PIL import Image
+
+from clip_model import generate_embedding
+from executors import run_io, run_cpu
+
+IMAGE = Image.new("RGB", (224, 224), color=(120, 40, 200))
+
+
+def build_app(latency: float) -> FastAPI:
+    app = FastAPI()
+
+    def database_call():
+        time.sleep(latency)
+        return {"data": []}
+
+    @app.get("/blocking")
+    async def blocking():
+        database_call()
+        generate_embedding(image=IMAGE)
+        return {"success": True}
+
+    @app.get("/offloaded")
+    async def offloaded():
+        await run_io(database_call)
+        await run_cpu(generate_embedding, image=IMAGE)
+        return {"success": True}
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, total: int, in_flight: int) -> float:
+    semaphore = asyncio.Semaphore(in_flight)
+
+    async def one():
+        async with semaphore:
+            response = await client.get(path)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(latency_ms: float, total: int):
+    app = build_app(latency_ms / 1000)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"Simulated database latency: {latency_ms:.0f} ms, {total} requests per run")
+        print(f"{'in-flight':>10} {'blocking req/s':>16} {'offloaded req/s':>17}")
+        for in_flight in (1, 2, 4, 8, 16, 32):
+            blocking = await measure(client, "/blocking", total, in_flight)
+            offloaded = await measure(client, "/offloaded", total, in_flight)
+            print(f"{in_flight:>10} {blocking:>16.1f} {offloaded:>17.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=50, help="simulated database round trip")
+    parser.add_argument("--requests", type=int, default=200, help="requests per measurement")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency_ms, args.requests))
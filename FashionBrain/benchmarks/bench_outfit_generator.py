@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Outfit generation benchmark.
+
+Times generate_outfits on synthetic catalogs from 50 to 50k products under a
+loose budget, a tight budget and a budget no outfit can meet (the worst case
+for the old nested loops, which had to walk every combination to find that
+out). For small catalogs the old nested-loop algorithm is run too, and its
+output is checked against the new one.
+
+Usage:
+    python benchmarks/bench_outfit_generator.py [--sizes 50 500 5000 50000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outfit_generator import generate_outfits, _categorize
+
+CATEGORIES = ['top', 'bottom', 'dress', 'shoes', 'accessory']
+
+BUDGETS = {
+    'loose': {'min_price': 0, 'max_price': 1000},
+    'tight': {'min_price': 99, 'max_price': 101},
+    'infeasible': {'min_price': 5000, 'max_price': 5001}
+}
+
+# The nested loops are cubic in the category sizes; only run them this far
+LEGACY_MAX_PRODUCTS = 500
+
+
+def make_catalog(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': str(i),
+            'category': rng.choice(CATEGORIES),
+            'price': round(rng.uniform(5, 300), 2)
+        }
+        for i in range(size)
+    ]
+
+
+def legacy_generate_outfits(products, user_budget=None, num_outfits=10):
+    """The nested-loop generator this module replaced, kept for comparison"""
+    categories = _categorize(products)
+    dresses, tops, bottoms = categories['dresses'], categories['tops'], categories['bottoms']
+    shoes, accessories = categories['shoes'], categories['accessories']
+    min_price = user_budget.get('min_price', 0) if user_budget else 0
+    max_price = user_budget.get('max_price', float('inf')) if user_budget else float('inf')
+    outfits = []
+
+    for dress in dresses:
+        if len(outfits) >= num_outfits:
+            break
+        for shoe in (shoes if shoes else [None]):
+            if len(outfits) >= num_outfits:
+                break
+            outfit_items = [dress] + ([shoe] if shoe else [])
+            outfit_price = float(dress.get('price', 0)) + (float(shoe.get('price', 0)) if shoe else 0)
+            for accessory in [None] + accessories[:3]:
+                temp_price = outfit_price + (float(accessory.get('price', 0)) if accessory else 0)
+                if min_price <= temp_price <= max_price:
+                    outfits.append({
+                        'items': outfit_items + ([accessory] if accessory else []),
+                        'total_price': temp_price,
+                        'outfit_type': 'dress'
+                    })
+                    break
+
+    for top in tops:
+        if len(outfits) >= num_outfits:
+            break
+        for bottom in bottoms:
+            if len(outfits) >= num_outfits:
+                break
+            base_price = float(top.get('price', 0)) + float(bottom.get('price', 0))
+            for shoe in (shoes if shoes else [None]):
+                if len(outfits) >= num_outfits:
+                    break
+                outfit_items = [top, bottom] + ([shoe] if shoe else [])
+                outfit_price = base_price + (float(shoe.get('price', 0)) if shoe else 0)
+                for accessory in [None] + accessories[:2]:
+                    temp_price = outfit_price + (float(accessory.get('price', 0)) if accessory else 0)
+                    if min_price <= temp_price <= max_price:
+                        outfits.append({
+                            'items': outfit_items + ([accessory] if accessory else []),
+                            'total_price': temp_price,
+                            'outfit_type': 'separates'
+                        })
+                        break
+
+    return outfits[:num_outfits]
+
+
+def timed(func, *args, repeat: int = 3, **kwargs):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes, num_outfits: int):
+    print(f"{'products':>9} {'budget':>11} {'outfits':>8} {'new ms':>10} {'legacy ms':>10}")
+    for size in sizes:
+        products = make_catalog(size)
+        for name, budget in BUDGETS.items():
+            new_time, outfits = timed(generate_outfits, products, user_budget=budget, num_outfits=num_outfits)
+            legacy = "skipped"
+            if size <= LEGACY_MAX_PRODUCTS:
+                legacy_time, legacy_outfits = timed(
+                    legacy_generate_outfits, products, user_budget=budget, num_outfits=num_outfits
+                )
+                assert legacy_outfits == outfits, f"outputs differ for {size} products, {name} budget"
+                legacy = f"{legacy_time * 1000:.2f}"
+            print(f"{size:>9} {name:>11} {len(outfits):>8} {new_time * 1000:>10.2f} {legacy:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000, 50000])
+    parser.add_argument("--num-outfits", type=int, default=10)
+    args = parser.parse_args()
+    main(args.sizes, args.num_outfits)
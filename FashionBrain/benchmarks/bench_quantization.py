@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Quantized local index benchmark.
+
+Builds a synthetic catalog (clustered 512-d embeddings, 1M products by
+default) and runs the same queries against CatalogSnapshot with each
+ANN_ENCODING: float32, float16 and int8. Every encoding shares one IVF index;
+the compressed encodings score candidates on their codes and re-rank the
+best top_k * ANN_RERANK_FACTOR exactly from the full-precision rows.
+
+The clusters overlap (--spread), so near neighbours are hard to tell apart
+and recall moves with nprobe. With the default ANN_RERANK_FACTOR the
+re-ranking hides the encodings' rounding; --rerank-factor 1 shows it.
+
+Each encoding is saved with embedding_store and then loaded and queried in
+a fresh process, as a worker would after a restart. That process reports
+how its resident set grew from just before the load to after the IVF
+queries:
+
+    index MB    CatalogSnapshot.memory_bytes()["resident"]: what the index
+                needs in memory (the codes, or the float32 matrix)
+    private MB  anonymous memory: product metadata (the same for every
+                encoding) and scoring temporaries
+    mapped MB   pages of the memory-mapped store in the resident set. They
+                are clean, shared by every worker and reclaimable; the
+                kernel maps about 64 KB around each re-ranked row, so on
+                small catalogs this approaches the whole matrix
+
+Recall@k is measured against an exact float32 scan. float16 QPS is expected
+to trail float32: numpy casts half precision in a scalar loop (see
+quantization.Float16Codec).
+
+Usage:
+    python benchmarks/bench_quantization.py [--size 1000000] [--queries 100] [--k 10] [--rerank-factor 4]
+
+Writes about three copies of the float32 matrix (2 GB each at 1M) under
+--workdir, which is removed afterwards.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from ann_index import IVFIndex
+from embedding_index import CatalogSnapshot, EMBEDDING_DIM
+from embedding_store import save_snapshot, load_snapshot
+
+ENCODINGS = ["float32", "float16", "int8"]
+
+# Products are drawn around this many style centres, like a real catalog
+CLUSTERS = 2000
+
+
+def make_catalog(size: int, spread: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((CLUSTERS, EMBEDDING_DIM)).astype(np.float32)
+    matrix = np.empty((size, EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, size, 65536):
+        stop = min(start + 65536, size)
+        labels = rng.integers(0, CLUSTERS, stop - start)
+        matrix[start:stop] = centres[labels] + spread * rng.standard_normal((stop - start, EMBEDDING_DIM), dtype=np.float32)
+    return matrix
+
+
+def make_queries(matrix: np.ndarray, count: int, spread: float, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = matrix[rng.choice(len(matrix), count, replace=False)]
+    return picks + 0.5 * spread * rng.standard_normal(picks.shape, dtype=np.float32)
+
+
+def exact_neighbours(matrix: np.ndarray, sq_norms: np.ndarray, queries: np.ndarray, k: int) -> list:
+    """Ids of each query's k nearest rows, by a chunked float32 scan"""
+    best_dist = np.full((len(queries), 0), np.inf, dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(matrix), 65536):
+        chunk = matrix[start:start + 65536]
+        dist = sq_norms[start:start + 65536][None, :] - 2.0 * (queries @ chunk.T)
+        rows = np.broadcast_to(np.arange(start, start + len(chunk)), dist.shape)
+        best_dist = np.concatenate([best_dist, dist], axis=1)
+        best_rows = np.concatenate([best_rows, rows], axis=1)
+        keep = np.argpartition(best_dist, k - 1, axis=1)[:, :k]
+        best_dist = np.take_along_axis(best_dist, keep, axis=1)
+        best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    return [[str(row) for row in rows] for rows in best_rows]
+
+
+def resident_bytes() -> dict:
+    """Anonymous and file-backed resident memory of this process (Linux)"""
+    with open("/proc/self/status") as f:
+        return {
+            line.split(":")[0]: int(line.split()[1]) * 1024
+            for line in f if line.startswith(("RssAnon:", "RssFile:"))
+        }
+
+
+def result_ids(results):
+    return [result["product"]["id"] for result in results]
+
+
+def measure(snapshot, queries, truth, k, exact, nprobe):
+    start = time.perf_counter()
+    found = [result_ids(snapshot.search(query, top_k=k, exact=exact, nprobe=nprobe)) for query in queries]
+    elapsed = time.perf_counter() - start
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+    return float(recall), len(queries) / elapsed
+
+
+def run_child(args):
+    """Load one encoding's store and query it; prints one JSON line"""
+    queries = np.load(os.path.join(args.workdir, "queries.npy"))
+    with open(os.path.join(args.workdir, "truth.json")) as f:
+        truth = json.load(f)
+
+    before = resident_bytes()
+    snapshot = CatalogSnapshot(encoding=args.child)
+    load_snapshot(snapshot, os.path.join(args.workdir, args.child))
+    report = {"index": snapshot.memory_bytes()["resident"], "ivf": {}}
+    for nprobe in args.nprobes:
+        report["ivf"][nprobe] = measure(snapshot, queries, truth, args.k, False, nprobe)
+    after = resident_bytes()
+    report["private"] = after["RssAnon"] - before["RssAnon"]
+    report["mapped"] = after["RssFile"] - before["RssFile"]
+    report["exact"] = measure(snapshot, queries[:args.exact_queries], truth[:args.exact_queries], args.k, True, None)
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--exact-queries", type=int, default=20, help="queries timed for the exact scan (slow at 1M)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--spread", type=float, default=1.0, help="noise around each centre, relative to the centres' own spread")
+    parser.add_argument("--rerank-factor", type=int, default=None, help="ANN_RERANK_FACTOR for the query processes")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--child", choices=ENCODINGS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_quantization-")
+    try:
+        print(f"Generating {args.size} x {EMBEDDING_DIM} catalog...")
+        matrix = make_catalog(args.size, args.spread)
+        sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        ids = [str(i) for i in range(args.size)]
+        products = [{"id": product_id} for product_id in ids]
+        queries = make_queries(matrix, args.queries, args.spread)
+
+        print("Exact float32 ground truth...")
+        truth = exact_neighbours(matrix, sq_norms, queries, args.k)
+        np.save(os.path.join(workdir, "queries.npy"), queries)
+        with open(os.path.join(workdir, "truth.json"), "w") as f:
+            json.dump(truth, f)
+
+        print("Training IVF index...")
+        start = time.perf_counter()
+        ivf = IVFIndex()
+        ivf.train(matrix)
+        ivf.add(np.arange(args.size), matrix)
+        centroids, assignments = ivf.centroids, ivf.assignments(args.size)
+        print(f"  {ivf.nlist} lists in {time.perf_counter() - start:.1f}s")
+        del ivf
+
+        print("Encoding and saving each store...")
+        for encoding in ENCODINGS:
+            snapshot = CatalogSnapshot(encoding=encoding)
+            snapshot.restore_state(matrix, sq_norms, ids, products, None, centroids=centroids, assignments=assignments)
+            save_snapshot(snapshot, os.path.join(workdir, encoding))
+            del snapshot
+        del matrix
+
+        reports = {}
+        for encoding in ENCODINGS:
+            child = [sys.executable, os.path.abspath(__file__), "--child", encoding, "--workdir", workdir,
+                     "--k", str(args.k), "--exact-queries", str(args.exact_queries),
+                     "--nprobes", *map(str, args.nprobes)]
+            env = dict(os.environ)
+            if args.rerank_factor is not None:
+                env["ANN_RERANK_FACTOR"] = str(args.rerank_factor)
+            output = subprocess.run(child, check=True, capture_output=True, text=True, env=env).stdout
+            reports[encoding] = json.loads(output.strip().splitlines()[-1])
+
+        header = f"{'encoding':<10}{'index MB':>10}{'private MB':>12}{'mapped MB':>11}{'exact recall':>14}{'exact QPS':>11}"
+        for nprobe in args.nprobes:
+            header += f"{f'ivf{nprobe} recall':>14}{f'ivf{nprobe} QPS':>11}"
+        print()
+        rerank_factor = args.rerank_factor if args.rerank_factor is not None else os.getenv("ANN_RERANK_FACTOR", "4")
+        print(f"recall@{args.k}, spread={args.spread}, rerank factor {rerank_factor}, {args.size} products")
+        print(header)
+        print("-" * len(header))
+        for encoding, report in reports.items():
+            line = f"{encoding:<10}{report['index'] / 2**20:>10.0f}{report['private'] / 2**20:>12.0f}{report['mapped'] / 2**20:>11.0f}"
+            line += f"{report['exact'][0]:>14.3f}{report['exact'][1]:>11.1f}"
+            for nprobe in args.nprobes:
+                recall, qps = report["ivf"][str(nprobe)]
+                line += f"{recall:>14.3f}{qps:>11.1f}"
+            print(line)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,42 @@
 import os
 import io
+import time
 import hashlib
-from typing import Union
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 from PIL import Image
 
+# "hash" is the fast deterministic test backend; "clip" runs a real CLIP model
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hash").lower()
 
-def _generate_simple_embedding(input_data: str, embedding_size: int = 512) -> list:
+# 512-dimensional CLIP model, matching the vector(512) columns
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+
+# Fixed intra-op thread count for CPU inference; 0 uses min(4, cpu count)
+CLIP_NUM_THREADS = int(os.getenv("CLIP_NUM_THREADS", "0"))
+
+# Apply dynamic int8 quantization to the model's Linear layers
+CLIP_QUANTIZE = os.getenv("CLIP_QUANTIZE", "true").lower() in ("1", "true", "yes")
+
+LATENCY_SAMPLES = 1000
+
+EMBEDDING_DIM = 512
+
+
+def _generate_simple_embedding(input_data: str, embedding_size: int = EMBEDDING_DIM) -> np.ndarray:
     """Generate a simple deterministic embedding for testing purposes.
-    
+
     This is a fallback when external APIs are not available.
     In production, you'd want to use a proper CLIP model.
     """
     # Create a deterministic hash-based embedding
-    hash_obj = hashlib.sha256(input_data.encode())
-    hash_bytes = hash_obj.digest()
-    
-    # Convert to float values between -1 and 1
-    embedding = []
-    for i in range(embedding_size):
-        byte_val = hash_bytes[i % len(hash_bytes)]
-        # Convert byte (0-255) to float (-1 to 1)
-        float_val = (byte_val / 127.5) - 1.0
-        embedding.append(float_val)
-    
-    return embedding
+    hash_bytes = np.frombuffer(hashlib.sha256(input_data.encode()).digest(), dtype=np.uint8)
+
+    # Repeat the 32 hash bytes to embedding_size and map each byte (0-255) to -1..1
+    return np.resize(hash_bytes, embedding_size).astype(np.float32) / np.float32(127.5) - np.float32(1.0)
 
 
 def _to_pil_image(image: Union[Image.Image, bytes, bytearray, str]) -> Image.Image:
@@ -39,12 +50,245 @@ def _to_pil_image(image: Union[Image.Image, bytes, bytearray, str]) -> Image.Ima
     raise TypeError("Unsupported image type. Provide PIL.Image, bytes, or path string.")
 
 
+class LatencyStats:
+    """Rolling latency samples for one kind of embedding call"""
+
+    def __init__(self, max_samples: int = LATENCY_SAMPLES):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+            count = self.count
+        if samples.size == 0:
+            return {"count": count}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {
+            "count": count,
+            "mean_ms": round(float(samples.mean()) * 1000, 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(samples.max()) * 1000, 3)
+        }
+
+
+class EmbeddingBackend:
+    """Interface for embedding models.
+
+    Backends embed batches of texts or images into float32 (n, 512) arrays.
+    Heavy backends should load their model lazily in warmup().
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.text_latency = LatencyStats()
+        self.image_latency = LatencyStats()
+
+    def warmup(self):
+        """Load the model ahead of the first request"""
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_images(self, images: List[Image.Image]) -> np.ndarray:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "text": self.text_latency.summary(),
+            "image": self.image_latency.summary()
+        }
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """Deterministic SHA-256 embeddings. Fast and dependency-free, for tests and local runs.
+
+    Image embeddings depend only on size and mode, so they carry no visual
+    similarity.
+    """
+
+    name = "hash"
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            embeddings[i] = _generate_simple_embedding(f"text:{text}")
+        return embeddings
+
+    def embed_images(self, images: List[Image.Image]) -> np.ndarray:
+        embeddings = np.empty((len(images), EMBEDDING_DIM), dtype=np.float32)
+        for i, image in enumerate(images):
+            # Create a simple representation based on image properties
+            embeddings[i] = _generate_simple_embedding(f"image:{image.size[0]}x{image.size[1]}:{image.mode}")
+        return embeddings
+
+
+class ClipEmbeddingBackend(EmbeddingBackend):
+    """CLIP embeddings from transformers, tuned for CPU-only hosts.
+
+    The model loads on first use (or warmup()), runs under torch.inference_mode
+    with a fixed thread count, and by default has its Linear layers dynamically
+    quantized to int8. Embeddings are L2-normalised.
+    """
+
+    name = "clip"
+
+    def __init__(self, model_name: str = CLIP_MODEL_NAME, num_threads: int = CLIP_NUM_THREADS,
+                 quantize: bool = CLIP_QUANTIZE):
+        super().__init__()
+        self.model_name = model_name
+        self.num_threads = num_threads or min(4, os.cpu_count() or 1)
+        self.quantize = quantize
+        self._model = None
+        self._processor = None
+        self._load_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    def _load(self):
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import CLIPModel, CLIPProcessor
+
+            start = time.perf_counter()
+            torch.set_num_threads(self.num_threads)
+            token = os.getenv("HF_TOKEN")
+            model = CLIPModel.from_pretrained(self.model_name, token=token)
+            model.eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._processor = CLIPProcessor.from_pretrained(self.model_name, token=token)
+            self._model = model
+            self.load_seconds = time.perf_counter() - start
+            print(f"Loaded CLIP model {self.model_name} in {self.load_seconds:.1f}s "
+                  f"({self.num_threads} threads, quantized={self.quantize})")
+
+    def warmup(self):
+        self._load()
+        # One forward pass of each kind so the first request doesn't pay for lazy init
+        self.embed_texts(["warmup"])
+        self.embed_images([Image.new("RGB", (224, 224))])
+
+    def _normalize(self, features) -> np.ndarray:
+        features = features / features.norm(dim=-1, keepdim=True)
+        return features.float().numpy()
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._load()
+        import torch
+
+        with torch.inference_mode():
+            inputs = self._processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+            return self._normalize(self._model.get_text_features(**inputs))
+
+    def embed_images(self, images: List[Image.Image]) -> np.ndarray:
+        if not images:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._load()
+        import torch
+
+        with torch.inference_mode():
+            inputs = self._processor(images=[image.convert("RGB") for image in images], return_tensors="pt")
+            return self._normalize(self._model.get_image_features(**inputs))
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update({
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+            "num_threads": self.num_threads,
+            "quantized": self.quantize
+        })
+        return stats
+
+
+BACKENDS = {
+    "hash": HashEmbeddingBackend,
+    "clip": ClipEmbeddingBackend
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    """Return the process-wide embedding backend selected by EMBEDDING_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if EMBEDDING_BACKEND not in BACKENDS:
+                    raise ValueError(
+                        f"Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'. Choose one of: {', '.join(BACKENDS)}"
+                    )
+                _backend = BACKENDS[EMBEDDING_BACKEND]()
+    return _backend
+
+
+def warmup():
+    """Load the embedding model now instead of on the first request"""
+    get_embedding_backend().warmup()
+
+
+def get_embedding_stats() -> Dict:
+    """Per-text and per-image latency of the active backend"""
+    return get_embedding_backend().stats()
+
+
+def generate_embeddings(images: Optional[list] = None, texts: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Embed many images and texts with one forward pass per kind.
+
+    - images: list of PIL.Image | bytes | path
+    - texts: list of str
+
+    Returns:
+        {"images": float32 (len(images), 512), "texts": float32 (len(texts), 512)}
+    """
+    backend = get_embedding_backend()
+    result = {}
+
+    texts = list(texts or [])
+    start = time.perf_counter()
+    result["texts"] = backend.embed_texts(texts)
+    if texts:
+        # Record the amortised per-text cost of the batch
+        per_item = (time.perf_counter() - start) / len(texts)
+        for _ in texts:
+            backend.text_latency.record(per_item)
+
+    pil_images = [_to_pil_image(image) for image in (images or [])]
+    start = time.perf_counter()
+    result["images"] = backend.embed_images(pil_images)
+    if pil_images:
+        per_item = (time.perf_counter() - start) / len(pil_images)
+        for _ in pil_images:
+            backend.image_latency.record(per_item)
+
+    return result
+
+
 def generate_embedding(image=None, text=None):
-    """Generate embeddings using a simple fallback method.
-    
-    This is a placeholder implementation that creates deterministic embeddings
-    based on input content. In production, replace with proper CLIP model.
-    
+    """Generate an embedding with the configured backend.
+
+    EMBEDDING_BACKEND=clip uses a real CLIP model; the default "hash" backend
+    creates deterministic placeholder embeddings based on input content.
+
     - text: str → returns text embedding (list[float])
     - image: PIL.Image | bytes | path → returns image embedding (list[float])
     """
@@ -52,14 +296,6 @@ def generate_embedding(image=None, text=None):
         return None
 
     if text is not None:
-        # Generate embedding based on text content
-        return _generate_simple_embedding(f"text:{text}")
-    
-    if image is not None:
-        # Generate embedding based on image properties
-        pil_image = _to_pil_image(image)
-        # Create a simple representation based on image properties
-        image_data = f"image:{pil_image.size[0]}x{pil_image.size[1]}:{pil_image.mode}"
-        return _generate_simple_embedding(image_data)
-    
-    return None
+        return generate_embeddings(texts=[text])["texts"][0].tolist()
+
+    return generate_embeddings(images=[image])["images"][0].tolist()
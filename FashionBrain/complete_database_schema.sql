@@ -17,6 +17,14 @@ CREATE TABLE IF NOT EXISTS public.users (
     bottoms_max_price numeric,
     shoes_max_price numeric,
     accessories_max_price numeric,
+    inspo_sum vector(512),
+    inspo_count integer,
+    inspo_decayed_sum vector(512),
+    inspo_decayed_weight double precision,
+    inspo_updated_at timestamp with time zone,
+    inspo_version integer NOT NULL DEFAULT 0,
+    preference_vector vector(512),
+    preference_version integer NOT NULL DEFAULT 0,
     created_at timestamp without time zone DEFAULT now(),
     CONSTRAINT users_pkey PRIMARY KEY (id),
     CONSTRAINT users_id_fkey FOREIGN KEY (id) REFERENCES auth.users(id)
@@ -34,6 +42,7 @@ CREATE TABLE IF NOT EXISTS public.products (
     image_url text NOT NULL,
     cloudinary_public_id text,
     embedding vector(512),
+    embedding_b64 text,
     created_at timestamp without time zone DEFAULT now(),
     category text NOT NULL CHECK (category = ANY (ARRAY['top'::text, 'bottom'::text, 'shoes'::text, 'accessory'::text])),
     CONSTRAINT products_pkey PRIMARY KEY (id)
@@ -59,6 +68,7 @@ CREATE TABLE IF NOT EXISTS public.inspo_images (
     image_url text NOT NULL,
     cloudinary_public_id text,
     embedding vector(512),
+    embedding_b64 text,
     created_at timestamp without time zone DEFAULT now(),
     CONSTRAINT inspo_images_pkey PRIMARY KEY (id),
     CONSTRAINT inspo_images_user_id_fkey FOREIGN KEY (user_id) REFERENCES public.users(id)
@@ -89,6 +99,7 @@ WITH (lists = 100);
 CREATE INDEX IF NOT EXISTS user_actions_user_id_idx ON user_actions(user_id);
 CREATE INDEX IF NOT EXISTS user_actions_product_id_idx ON user_actions(product_id);
 CREATE INDEX IF NOT EXISTS inspo_images_user_id_idx ON inspo_images(user_id);
+CREATE INDEX IF NOT EXISTS products_created_at_id_idx ON products(created_at DESC, id DESC);
 
 -- Step 8: Create the similarity search function
 CREATE OR REPLACE FUNCTION match_products(
@@ -131,6 +142,175 @@ AS $$
   LIMIT match_count;
 $$;
 
+-- Embeddings travel as base64 of pgvector's binary format (embedding_b64);
+-- these convert between the two forms and keep both columns in step
+CREATE OR REPLACE FUNCTION vector_to_b64(v vector)
+RETURNS text
+LANGUAGE sql IMMUTABLE STRICT
+AS $$
+  -- encode() wraps base64 output every 76 characters; strip the newlines
+  SELECT translate(encode(vector_send(v), 'base64'), E'\n', '');
+$$;
+
+CREATE OR REPLACE FUNCTION vector_from_b64(data text)
+RETURNS vector
+LANGUAGE sql IMMUTABLE STRICT
+AS $$
+  SELECT array_agg(
+    CASE
+      WHEN bits & 2147483647 = 0 THEN 0::float4
+      WHEN (bits >> 23) & 255 = 0 THEN
+        -- Subnormal
+        ((CASE WHEN bits < 0 THEN -1 ELSE 1 END) * (bits & 8388607) * power(2::numeric, -149))::float4
+      ELSE
+        ((CASE WHEN bits < 0 THEN -1 ELSE 1 END) * (8388608 + (bits & 8388607))
+          * power(2::numeric, ((bits >> 23) & 255) - 150))::float4
+    END
+    ORDER BY i
+  )::vector
+  FROM (
+    SELECT
+      i,
+      (get_byte(raw, 4 + 4 * i) << 24) | (get_byte(raw, 5 + 4 * i) << 16)
+        | (get_byte(raw, 6 + 4 * i) << 8) | get_byte(raw, 7 + 4 * i) AS bits
+    FROM decode(data, 'base64') AS raw,
+         generate_series(0, (get_byte(raw, 0) << 8 | get_byte(raw, 1)) - 1) AS i
+  ) AS f;
+$$;
+
+CREATE OR REPLACE FUNCTION sync_embedding_b64()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.embedding_b64 IS NOT NULL
+     AND (TG_OP = 'INSERT' OR NEW.embedding_b64 IS DISTINCT FROM OLD.embedding_b64) THEN
+    NEW.embedding := vector_from_b64(NEW.embedding_b64);
+  ELSIF TG_OP = 'INSERT' OR NEW.embedding IS DISTINCT FROM OLD.embedding THEN
+    NEW.embedding_b64 := vector_to_b64(NEW.embedding);
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_sync_embedding_b64 ON public.products;
+CREATE TRIGGER products_sync_embedding_b64
+  BEFORE INSERT OR UPDATE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION sync_embedding_b64();
+
+DROP TRIGGER IF EXISTS inspo_images_sync_embedding_b64 ON public.inspo_images;
+CREATE TRIGGER inspo_images_sync_embedding_b64
+  BEFORE INSERT OR UPDATE ON public.inspo_images
+  FOR EACH ROW EXECUTE FUNCTION sync_embedding_b64();
+
+-- Filtered variant: predicates and embedding projection evaluated in the database
+CREATE OR REPLACE FUNCTION match_products_filtered(
+  query_embedding_b64 text,
+  match_count int DEFAULT 5,
+  categories text[] DEFAULT NULL,
+  min_price numeric DEFAULT NULL,
+  max_price numeric DEFAULT NULL,
+  exclude_ids uuid[] DEFAULT NULL,
+  include_embedding boolean DEFAULT true
+)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  price numeric,
+  style text,
+  material text,
+  category text,
+  brand text,
+  image_url text,
+  cloudinary_public_id text,
+  affiliate_link text,
+  embedding_b64 text,
+  distance float
+)
+LANGUAGE sql STABLE
+SET ivfflat.probes = 10
+AS $$
+  SELECT
+    p.id,
+    p.name,
+    p.price,
+    p.style,
+    p.material,
+    p.category,
+    p.brand,
+    p.image_url,
+    p.cloudinary_public_id,
+    p.affiliate_link,
+    CASE WHEN include_embedding THEN p.embedding_b64 END,
+    (p.embedding <-> q.query_embedding) as distance
+  FROM (SELECT vector_from_b64(query_embedding_b64) AS query_embedding) q, products p
+  WHERE p.embedding IS NOT NULL
+    AND (categories IS NULL OR lower(p.category) = ANY(categories))
+    AND (min_price IS NULL OR p.price >= min_price)
+    AND (max_price IS NULL OR p.price <= max_price)
+    AND (exclude_ids IS NULL OR NOT (p.id = ANY(exclude_ids)))
+  ORDER BY p.embedding <-> q.query_embedding
+  LIMIT match_count;
+$$;
+
+-- Batched variant: one nearest-neighbour list per query vector, fused by the caller
+CREATE OR REPLACE FUNCTION match_products_batch(
+  query_embeddings_b64 text[],
+  match_count int DEFAULT 5,
+  categories text[] DEFAULT NULL,
+  min_price numeric DEFAULT NULL,
+  max_price numeric DEFAULT NULL,
+  exclude_ids uuid[] DEFAULT NULL,
+  include_embedding boolean DEFAULT true
+)
+RETURNS TABLE (
+  query_index int,
+  id uuid,
+  name text,
+  price numeric,
+  style text,
+  material text,
+  category text,
+  brand text,
+  image_url text,
+  cloudinary_public_id text,
+  affiliate_link text,
+  embedding_b64 text,
+  distance float
+)
+LANGUAGE sql STABLE
+SET ivfflat.probes = 10
+AS $$
+  SELECT
+    (q.ordinality - 1)::int,
+    m.*
+  FROM unnest(query_embeddings_b64) WITH ORDINALITY AS q(query_embedding_b64, ordinality)
+  CROSS JOIN LATERAL (SELECT vector_from_b64(q.query_embedding_b64) AS query_embedding) v
+  CROSS JOIN LATERAL (
+    SELECT
+      p.id,
+      p.name,
+      p.price,
+      p.style,
+      p.material,
+      p.category,
+      p.brand,
+      p.image_url,
+      p.cloudinary_public_id,
+      p.affiliate_link,
+      CASE WHEN include_embedding THEN p.embedding_b64 END,
+      (p.embedding <-> v.query_embedding) as distance
+    FROM products p
+    WHERE p.embedding IS NOT NULL
+      AND (categories IS NULL OR lower(p.category) = ANY(categories))
+      AND (min_price IS NULL OR p.price >= min_price)
+      AND (max_price IS NULL OR p.price <= max_price)
+      AND (exclude_ids IS NULL OR NOT (p.id = ANY(exclude_ids)))
+    ORDER BY p.embedding <-> v.query_embedding
+    LIMIT match_count
+  ) m;
+$$;
+
 -- Step 9: Enable Row Level Security (RLS)
 ALTER TABLE public.users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.products ENABLE ROW LEVEL SECURITY;
@@ -173,5 +353,7 @@ GRANT ALL ON public.user_actions TO authenticated;
 GRANT ALL ON public.inspo_images TO authenticated;
 GRANT ALL ON public.outfits TO authenticated;
 GRANT EXECUTE ON FUNCTION match_products TO authenticated;
+GRANT EXECUTE ON FUNCTION match_products_filtered TO authenticated;
+GRANT EXECUTE ON FUNCTION match_products_batch TO authenticated;
 
 
@@ -0,0 +1,23 @@
+import json
+import base64
+from typing import Dict
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+
+
+def encode_payload(payload: Dict) -> str:
+    """Opaque, URL-safe cursor carrying a small JSON payload"""
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_payload(cursor: str) -> Dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+    if not isinstance(payload, dict):
+        raise InvalidCursorError("Invalid cursor")
+    return payload
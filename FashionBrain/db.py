@@ -0,0 +1,95 @@
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+from supabase import Client, ClientOptions, create_client
+
+load_dotenv()
+
+# Maximum open connections to Supabase per worker, and how many stay alive idle
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_KEEPALIVE_CONNECTIONS", "10"))
+
+# Per-call timeouts in seconds
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "15"))
+SUPABASE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONNECT_TIMEOUT_SECONDS", "5"))
+
+
+class DatabaseConfigError(RuntimeError):
+    """Supabase credentials are missing"""
+
+
+class DatabaseConnectionError(RuntimeError):
+    """The Supabase client could not be created"""
+
+
+class DatabaseUnreachableError(DatabaseConnectionError):
+    """The Supabase host could not be resolved"""
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _is_dns_error(error: Exception) -> bool:
+    error_str = str(error).lower()
+    return "nodename" in error_str or "servname" in error_str or "getaddrinfo" in error_str
+
+
+def _build_http_client() -> httpx.Client:
+    """Shared HTTP session with a bounded keep-alive connection pool"""
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT_SECONDS, connect=SUPABASE_CONNECT_TIMEOUT_SECONDS)
+    )
+
+
+def get_supabase_client() -> Client:
+    """Return the process-wide Supabase client.
+
+    The client is created once and reuses one pooled HTTP session, so callers
+    don't pay client construction or TLS handshakes on every request.
+
+    Raises:
+        DatabaseConfigError: SUPABASE_URL or SUPABASE_KEY is not set
+        DatabaseUnreachableError: the Supabase host could not be resolved
+        DatabaseConnectionError: the client could not be created
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is not None:
+            return _client
+
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_KEY")
+        if not supabase_url or not supabase_key:
+            raise DatabaseConfigError(
+                "Supabase credentials not configured. Please set SUPABASE_URL and SUPABASE_KEY environment variables."
+            )
+
+        # Ensure URL is properly formatted
+        if not supabase_url.startswith('http'):
+            supabase_url = f'https://{supabase_url}'
+
+        options = ClientOptions(
+            postgrest_client_timeout=httpx.Timeout(
+                SUPABASE_TIMEOUT_SECONDS, connect=SUPABASE_CONNECT_TIMEOUT_SECONDS
+            ),
+            httpx_client=_build_http_client()
+        )
+        try:
+            _client = create_client(supabase_url, supabase_key, options=options)
+        except Exception as e:
+            if _is_dns_error(e):
+                raise DatabaseUnreachableError(
+                    "Database connection failed. Please check your SUPABASE_URL in .env file and internet connection."
+                ) from e
+            raise DatabaseConnectionError(f"Failed to initialize database connection: {str(e)}") from e
+        return _client
@@ -0,0 +1,99 @@
+import os
+import asyncio
+from typing import List, Optional
+
+from PIL import Image
+
+from clip_model import generate_embeddings
+from executors import run_cpu
+
+# Flush a batch once it has this many items...
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+
+# ...or once the oldest item has waited this long
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items: List = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """Collects concurrent single embedding calls into one forward pass.
+
+    Callers await embed_text / embed_image as if they were single calls.
+    Items queue per kind and are flushed to generate_embeddings on the CPU
+    executor when max_batch_size is reached or max_wait_ms after the first
+    item arrived, whichever comes first.
+    """
+
+    def __init__(self, max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = {"texts": _PendingBatch(), "images": _PendingBatch()}
+        # The event loop only holds weak references to tasks; keep flushes alive until they finish
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+
+    async def embed_text(self, text: str) -> list:
+        return await self._submit("texts", text)
+
+    async def embed_image(self, image: Image.Image) -> list:
+        return await self._submit("images", image)
+
+    async def _submit(self, kind: str, item) -> list:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self._pending[kind]
+        batch.items.append(item)
+        batch.futures.append(future)
+
+        if len(batch.items) >= self.max_batch_size:
+            self._flush(kind)
+        elif batch.timer is None:
+            batch.timer = loop.call_later(self.max_wait, self._flush, kind)
+
+        return await future
+
+    def _flush(self, kind: str):
+        batch = self._pending[kind]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self._pending[kind] = _PendingBatch()
+        if batch.items:
+            self.batches += 1
+            self.items += len(batch.items)
+            task = asyncio.ensure_future(self._run(kind, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, kind: str, batch: _PendingBatch):
+        try:
+            result = await run_cpu(generate_embeddings, **{kind: batch.items})
+            embeddings = result[kind]
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, embedding in zip(batch.futures, embeddings):
+            if not future.done():
+                future.set_result(embedding.tolist())
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+
+embedding_batcher = MicroBatcher()
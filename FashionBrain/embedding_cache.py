@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from clip_model import EMBEDDING_BACKEND, CLIP_MODEL_NAME
+
+# Entries kept in memory (about 2 KB each for 512 float32 values)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# Optional SQLite file backing the memory tier so restarts come back warm; empty disables it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+
+def text_cache_key(text: str) -> str:
+    """Cache key for a text query: lower-cased with whitespace collapsed"""
+    return "text:" + " ".join(text.lower().split())
+
+
+def image_cache_key(contents: bytes) -> str:
+    """Cache key for an uploaded image: SHA-256 of the raw bytes"""
+    return "image:" + hashlib.sha256(contents).hexdigest()
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of embeddings with an optional on-disk tier.
+
+    Keys are namespaced by the embedding backend name, so switching
+    EMBEDDING_BACKEND never serves vectors from a different model.
+
+    The memory tier (get_memory / put_memory) never blocks. The SQLite tier
+    (get_disk / put_disk) does file I/O, so async callers run it on the I/O
+    pool; get() and put() combine both for synchronous callers.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH,
+                 namespace: str = ""):
+        self.max_size = max_size
+        self.namespace = namespace
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+            self._db.commit()
+
+    def _full_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    @property
+    def disk_tier(self) -> bool:
+        return self._db is not None
+
+    def get_memory(self, key: str) -> Optional[np.ndarray]:
+        """Memory-tier lookup; a miss isn't counted until get_disk() has been tried"""
+        key = self._full_key(key)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return embedding
+
+    def get_disk(self, key: str) -> Optional[np.ndarray]:
+        """Disk-tier lookup (blocking); a hit is promoted to the memory tier"""
+        key = self._full_key(key)
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            embedding = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, embedding)
+            self.disk_hits += 1
+            return embedding
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        embedding = self.get_memory(key)
+        if embedding is None:
+            embedding = self.get_disk(key)
+        return embedding
+
+    def put_memory(self, key: str, embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(self._full_key(key), embedding)
+        return embedding
+
+    def put_disk(self, key: str, embedding):
+        """Write through to the disk tier (blocking); failures only cost a future disk hit"""
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+                    (self._full_key(key), np.asarray(embedding, dtype=np.float32).tobytes())
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not write embedding cache entry: {e}")
+
+    def put(self, key: str, embedding):
+        self.put_disk(key, self.put_memory(key, embedding))
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_tier": self._db is not None
+            }
+
+
+embedding_cache = EmbeddingCache(
+    namespace=EMBEDDING_BACKEND if EMBEDDING_BACKEND != "clip" else f"clip/{CLIP_MODEL_NAME}"
+)
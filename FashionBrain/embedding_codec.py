@@ -0,0 +1,39 @@
+import base64
+import struct
+import binascii
+from typing import Optional
+
+import numpy as np
+
+# pgvector's binary format (what vector_send produces): dimension and an
+# unused field as big-endian uint16, then the values as big-endian float32
+_HEADER = struct.Struct(">HH")
+_VALUES = np.dtype(">f4")
+
+
+def encode_embedding(embedding) -> str:
+    """Base64 of an embedding in pgvector binary format, for embedding_b64 columns and RPC arguments.
+
+    About 2.7 KB for 512 dimensions (against ~10 KB as a decimal list), and
+    exact: every float32 round-trips bit for bit.
+    """
+    vector = np.asarray(embedding, dtype=_VALUES).reshape(-1)
+    return base64.b64encode(_HEADER.pack(len(vector), 0) + vector.tobytes()).decode("ascii")
+
+
+def decode_embedding(value: str, dim: Optional[int] = None) -> Optional[np.ndarray]:
+    """float32 vector from encode_embedding() output; None if malformed or not dim long.
+
+    base64 decoding plus one np.frombuffer, with no per-value parsing.
+    Newlines (Postgres encode() wraps base64 output) are ignored.
+    """
+    try:
+        data = base64.b64decode(value)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    length, _ = _HEADER.unpack_from(data)
+    if len(data) != _HEADER.size + 4 * length or (dim is not None and length != dim):
+        return None
+    return np.frombuffer(data, dtype=_VALUES, offset=_HEADER.size).astype(np.float32)
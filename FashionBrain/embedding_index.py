@@ -0,0 +1,707 @@
+import os
+import json
+import mmap
+import time
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ann_index import IVFIndex, ANN_MIN_INDEX_SIZE
+from embedding_codec import decode_embedding
+from product_cache import PRODUCT_COLUMNS
+from quantization import ANN_ENCODING, ANN_RERANK_FACTOR, ANN_SPILL_DIR, ENCODE_CHUNK_ROWS, TRAIN_SAMPLE_SIZE, make_codec
+
+EMBEDDING_DIM = 512
+
+# How long a snapshot may serve searches before it pulls newly added products
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "60"))
+
+# How often the snapshot is checked for products deleted by other workers (or
+# while this process was down), which the created_at watermark can't see
+CATALOG_RECONCILE_SECONDS = float(os.getenv("CATALOG_RECONCILE_SECONDS", "600"))
+
+# PostgREST caps a single response at 1000 rows by default
+CATALOG_PAGE_SIZE = 1000
+
+# Catalog rows carry the embedding only in its compact binary form
+CATALOG_COLUMNS = PRODUCT_COLUMNS + ",cloudinary_public_id,embedding_b64"
+
+# Row fields holding an embedding; stripped from cached product metadata
+EMBEDDING_FIELDS = ("embedding", "embedding_b64")
+
+# Loads product metadata by id for search hits restored without it: ids -> {id: product}
+MetadataFetcher = Callable[[List[str]], Dict[str, Dict]]
+
+
+def parse_embedding(value, dim: int = EMBEDDING_DIM) -> Optional[np.ndarray]:
+    """Convert an embedding as returned by Supabase into a float32 vector.
+
+    Supabase may return embeddings as lists, JSON strings ("[1.0,2.0]") or
+    PostgreSQL array strings ("{1.0,2.0}"). Returns None if the value can't
+    be parsed or has the wrong dimension.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("{") and text.endswith("}"):
+            text = "[" + text[1:-1] + "]"
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+    try:
+        vector = np.asarray(value, dtype=np.float32)
+    except (ValueError, TypeError):
+        return None
+
+    if vector.shape != (dim,):
+        return None
+    return vector
+
+
+def row_embedding(row: Dict, dim: int = EMBEDDING_DIM) -> Optional[np.ndarray]:
+    """A row's embedding, decoded from embedding_b64 when present, else parsed from embedding"""
+    encoded = row.get("embedding_b64")
+    if encoded:
+        return decode_embedding(encoded, dim)
+    return parse_embedding(row.get("embedding"), dim)
+
+
+class CatalogSnapshot:
+    """Process-wide copy of the product embeddings for local similarity search.
+
+    Embeddings live in one contiguous float32 (N, dim) matrix with a parallel
+    array of product ids, so a query is a single matrix-vector product plus an
+    argpartition instead of a Python loop over every product.
+
+    Once the catalog reaches ANN_MIN_INDEX_SIZE products an IVF index is built
+    over the matrix. Later inserts are appended to it and deletes only clear
+    the row's alive flag, so the index is never rebuilt.
+
+    With ANN_ENCODING=float16 or int8, candidates are scored against a
+    compressed copy of the matrix and only the best top_k * ANN_RERANK_FACTOR
+    per query are re-ranked with the full-precision rows. The matrix itself
+    is then file-backed (the persisted store, or a scratch file in
+    ANN_SPILL_DIR), so only the codes and the re-ranked rows stay resident.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, encoding: str = ANN_ENCODING):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        # (fd, offset) of the file behind a file-backed matrix, for re-ranking reads
+        self._matrix_file = None
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        # Filterable columns kept beside the matrix so predicates are evaluated as array masks
+        self._prices = np.empty(0, dtype=np.float64)
+        self._category_codes = np.empty(0, dtype=np.int32)
+        self._category_ids: Dict[str, int] = {}
+        self._products: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._size = 0
+        self._live_count = 0
+        self._ivf: Optional[IVFIndex] = None
+        # Optional compressed copy of the matrix (see quantization.py), retrained as the catalog doubles
+        self._codec = make_codec(encoding)
+        self._codes: Optional[np.ndarray] = None
+        self._codes_trained_on = 0
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.last_reconcile = 0.0
+        self._reconciling = False
+        self.watermark: Optional[str] = None
+        # Set when the snapshot has changed since it was last saved to disk
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    @property
+    def encoding(self) -> str:
+        return self._codec.name if self._codec is not None else "float32"
+
+    def _new_matrix(self, rows: int):
+        """Backing array (and file) for the full-precision rows; file-backed when the codes are what gets scanned"""
+        if self._codec is None:
+            return np.empty((rows, self.dim), dtype=np.float32), None
+        # Unlinked on creation; the space is freed once the map and descriptor are dropped
+        with tempfile.TemporaryFile(dir=ANN_SPILL_DIR or None) as spill:
+            spill.truncate(rows * self.dim * 4)
+            matrix = np.memmap(spill, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+            return matrix, (os.dup(spill.fileno()), 0)
+
+    def _set_matrix_file(self, matrix_file):
+        """Replace the re-ranking file descriptor. Called with _lock held"""
+        if self._matrix_file is not None:
+            os.close(self._matrix_file[0])
+        self._matrix_file = matrix_file
+
+    def _rows(self, positions: np.ndarray) -> np.ndarray:
+        """Full-precision rows for re-ranking. Called with _lock held.
+
+        A file-backed matrix is read with pread rather than through the map:
+        a page fault maps tens of KB around the row into the process, so a
+        few thousand re-ranks would pull the whole matrix into the resident
+        set. Reads go through the same page cache as the map.
+        """
+        if self._matrix_file is None:
+            return self._matrix[positions]
+        fd, offset = self._matrix_file
+        row_bytes = self.dim * 4
+        data = b"".join(os.pread(fd, row_bytes, offset + int(position) * row_bytes) for position in positions)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(positions), self.dim)
+
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays (doubling) so appends stay amortised O(1)."""
+        if capacity <= self._matrix.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._matrix.shape[0], 64)
+
+        matrix, matrix_file = self._new_matrix(new_capacity)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        ids = np.empty(new_capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        prices = np.full(new_capacity, np.nan)
+        prices[:self._size] = self._prices[:self._size]
+        category_codes = np.full(new_capacity, -1, dtype=np.int32)
+        category_codes[:self._size] = self._category_codes[:self._size]
+
+        self._matrix, self._sq_norms, self._ids, self._alive = matrix, sq_norms, ids, alive
+        self._set_matrix_file(matrix_file)
+        self._prices, self._category_codes = prices, category_codes
+        if self._codes is not None:
+            codes = np.empty((new_capacity, self.dim), dtype=self._codes.dtype)
+            codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+
+    def _category_code(self, category) -> int:
+        """Integer code for a lowercased category, assigned on first sight; -1 for none"""
+        if not category:
+            return -1
+        key = str(category).lower()
+        code = self._category_ids.get(key)
+        if code is None:
+            code = self._category_ids[key] = len(self._category_ids)
+        return code
+
+    def _set_columns(self, position: int, product: Dict):
+        try:
+            self._prices[position] = float(product.get("price"))
+        except (TypeError, ValueError):
+            self._prices[position] = np.nan
+        self._category_codes[position] = self._category_code(product.get("category"))
+
+    def add_products(self, products: List[Dict]) -> int:
+        """Insert or replace products in the snapshot.
+
+        Products without a usable embedding are skipped. The embedding is kept
+        only in the matrix; the stored product dict omits it. A product that is
+        already present with a different embedding is tombstoned and appended
+        again, so its index list assignment always matches its embedding.
+
+        Returns:
+            Number of products added or updated
+        """
+        added = 0
+        with self._lock:
+            first_new = self._size
+            for product in products:
+                product_id = product.get("id")
+                vector = row_embedding(product, self.dim)
+                if product_id is None or vector is None:
+                    continue
+
+                product_id = str(product_id)
+                metadata = {k: v for k, v in product.items() if k not in EMBEDDING_FIELDS}
+
+                position = self._positions.get(product_id)
+                if position is not None and np.array_equal(self._matrix[position], vector):
+                    # Unchanged embedding: update metadata without touching the
+                    # matrix (which may be a read-only memory map)
+                    self._products[position] = metadata
+                    self._set_columns(position, metadata)
+                    added += 1
+                    continue
+
+                self._tombstone(product_id)
+                self._reserve(self._size + 1)
+                position = self._size
+                self._size += 1
+                self._live_count += 1
+                self._positions[product_id] = position
+                self._products.append(metadata)
+
+                self._matrix[position] = vector
+                self._sq_norms[position] = float(vector @ vector)
+                self._ids[position] = product_id
+                self._alive[position] = True
+                self._set_columns(position, metadata)
+
+                created_at = product.get("created_at")
+                if created_at and (self.watermark is None or str(created_at) > self.watermark):
+                    self.watermark = str(created_at)
+                added += 1
+                self.dirty = True
+
+            if self._ivf is not None and self._size > first_new:
+                new_positions = np.arange(first_new, self._size)
+                self._ivf.add(new_positions, self._matrix[first_new:self._size])
+            if self._codec is not None and self._size > first_new:
+                if self._live_count >= 2 * self._codes_trained_on:
+                    self._train_codes()
+                else:
+                    self._codes[first_new:self._size] = self._codec.encode(self._matrix[first_new:self._size])
+        return added
+
+    def _train_codes(self):
+        """Fit the codec to (a sample of) the live rows and re-encode every row. Called with _lock held"""
+        live = np.flatnonzero(self._alive[:self._size])
+        if len(live) == 0:
+            return
+        if len(live) > TRAIN_SAMPLE_SIZE:
+            live = np.sort(np.random.default_rng(0).choice(live, TRAIN_SAMPLE_SIZE, replace=False))
+        self._codec.train(self._matrix[live])
+        codes = np.empty((self._matrix.shape[0], self.dim), dtype=self._codec.dtype)
+        for start in range(0, self._size, ENCODE_CHUNK_ROWS):
+            stop = min(start + ENCODE_CHUNK_ROWS, self._size)
+            codes[start:stop] = self._codec.encode(self._matrix[start:stop])
+        self._codes = codes
+        self._codes_trained_on = self._live_count
+
+    def memory_bytes(self) -> Dict:
+        """Bytes held by the embedding matrix and the compressed codes (if any).
+
+        resident counts what has to stay in memory to serve searches: the
+        matrix only when it is in process memory or scanned directly, since
+        with an encoding a file-backed matrix is only read for re-ranking.
+        """
+        with self._lock:
+            matrix = int(self._size * self.dim * self._matrix.itemsize)
+            codes = int(self._size * self.dim * self._codes.itemsize) if self._codes is not None else 0
+            mapped = isinstance(self._matrix, np.memmap)
+            return {
+                "encoding": self.encoding,
+                "matrix": matrix,
+                "matrix_mapped": mapped,
+                "codes": codes,
+                "resident": codes + (0 if mapped and self._codes is not None else matrix)
+            }
+
+    def _tombstone(self, product_id: str) -> bool:
+        position = self._positions.pop(product_id, None)
+        if position is None:
+            return False
+        self._alive[position] = False
+        self._products[position] = None
+        self._live_count -= 1
+        self.dirty = True
+        return True
+
+    def get_embeddings(self, product_ids: List) -> np.ndarray:
+        """Embeddings for the given product ids; zero rows for products not in the snapshot"""
+        result = np.zeros((len(product_ids), self.dim), dtype=np.float32)
+        with self._lock:
+            for i, product_id in enumerate(product_ids):
+                position = self._positions.get(str(product_id))
+                if position is not None:
+                    result[i] = self._matrix[position]
+        return result
+
+    def remove_product(self, product_id) -> bool:
+        """Tombstone a product so it no longer appears in search results.
+
+        Returns:
+            True if the product was present
+        """
+        with self._lock:
+            return self._tombstone(str(product_id))
+
+    def build_index(self, force: bool = False):
+        """Train the IVF index over the live rows once the catalog is large enough."""
+        with self._lock:
+            if self._ivf is not None and not force:
+                return
+            if self._live_count < ANN_MIN_INDEX_SIZE and not force:
+                return
+            positions = np.flatnonzero(self._alive[:self._size])
+            if len(positions) == 0:
+                return
+            ivf = IVFIndex()
+            ivf.train(self._matrix[positions])
+            ivf.add(positions, self._matrix[positions])
+            self._ivf = ivf
+
+    def _filter_mask(self, filters: Dict) -> np.ndarray:
+        """Boolean mask over rows [0, size) that are alive and satisfy filters. Called with _lock held"""
+        mask = self._alive[:self._size].copy()
+        categories = filters.get("categories")
+        if categories is not None:
+            codes = [self._category_ids[c] for c in {str(c).lower() for c in categories} if c in self._category_ids]
+            mask &= np.isin(self._category_codes[:self._size], codes)
+        prices = self._prices[:self._size]
+        with np.errstate(invalid="ignore"):
+            # NaN (unknown) prices fail both comparisons, as NULL does in SQL
+            if filters.get("min_price") is not None:
+                mask &= prices >= float(filters["min_price"])
+            if filters.get("max_price") is not None:
+                mask &= prices <= float(filters["max_price"])
+        for product_id in filters.get("exclude_ids") or ():
+            position = self._positions.get(str(product_id))
+            if position is not None:
+                mask[position] = False
+        return mask
+
+    def search(self, embedding, top_k: int = 5, nprobe: Optional[int] = None, exact: bool = False,
+               filters: Optional[Dict] = None, fetch_metadata: Optional[MetadataFetcher] = None) -> List[Dict]:
+        """Return the top_k products closest to embedding by L2 distance.
+
+        Args:
+            embedding: Query embedding as numpy array or list
+            top_k: Number of top results to return
+            nprobe: IVF lists to scan; trades recall for latency (default ANN_NPROBE)
+            exact: Scan every row even when the IVF index is available
+            filters: Optional predicates applied before ranking: "categories"
+                (iterable, matched case-insensitively), "min_price", "max_price"
+                and "exclude_ids". If the probed IVF lists hold fewer than
+                top_k matching rows, every matching row is scanned instead.
+            fetch_metadata: Called with the ids of hits whose metadata isn't
+                loaded (rows restored from the embedding store carry none)
+                and returns {id: product}; the result is kept for later
+                searches. Without it such hits carry only their id.
+
+        Returns:
+            Results with the same shape as search_products results
+        """
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim:
+            return []
+        return self.search_batch(query[None, :], top_k=top_k, nprobe=nprobe, exact=exact, filters=filters,
+                                 fetch_metadata=fetch_metadata)[0]
+
+    def search_batch(self, embeddings, top_k: int = 5, nprobe: Optional[int] = None, exact: bool = False,
+                     filters: Optional[Dict] = None, fetch_metadata: Optional[MetadataFetcher] = None) -> List[List[Dict]]:
+        """search() for several query vectors at once, one result list per query.
+
+        Candidates are scored against every query with a single matrix
+        product. With the IVF index the candidate set is the union of each
+        query's probed lists, so batching never lowers recall.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError(f"Expected a (n, {self.dim}) array of query embeddings, got shape {queries.shape}")
+        if len(queries) == 0 or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        batch = self._rank(queries, top_k, nprobe, exact, filters)
+        self._fill_metadata(batch, fetch_metadata)
+        return batch
+
+    def _fill_metadata(self, batch: List[List[Dict]], fetch_metadata: Optional[MetadataFetcher]):
+        """Replace the id-only placeholders of unhydrated hits, fetching outside the lock"""
+        missing = list(dict.fromkeys(
+            result["product"]["id"] for results in batch for result in results if result.pop("_unhydrated", False)
+        ))
+        if not missing:
+            return
+        found = {}
+        if fetch_metadata is not None:
+            try:
+                found = fetch_metadata(missing) or {}
+            except Exception as e:
+                print(f"Warning: Could not load metadata for {len(missing)} products: {e}")
+        with self._lock:
+            for product_id, product in found.items():
+                position = self._positions.get(str(product_id))
+                if position is not None and self._products[position] is None:
+                    self._products[position] = {k: v for k, v in product.items() if k not in EMBEDDING_FIELDS}
+        for results in batch:
+            for result in results:
+                product = found.get(result["product"]["id"])
+                if product is not None:
+                    result["product"] = {k: v for k, v in product.items() if k not in EMBEDDING_FIELDS}
+
+    def _rank(self, queries: np.ndarray, top_k: int, nprobe: Optional[int], exact: bool,
+              filters: Optional[Dict]) -> List[List[Dict]]:
+        with self._lock:
+            if self._live_count == 0:
+                return [[] for _ in range(len(queries))]
+
+            mask = self._filter_mask(filters) if filters else None
+            positions = None
+            if self._ivf is not None and not exact:
+                probed = [self._ivf.candidates(query, nprobe) for query in queries]
+                positions = probed[0] if len(probed) == 1 else np.unique(np.concatenate(probed))
+                positions = positions[(mask if mask is not None else self._alive)[positions]]
+                if mask is not None and len(positions) < top_k:
+                    positions = None
+
+            # Scored against the compressed codes when an encoding is set, re-ranked exactly below
+            vectors = self._matrix if self._codec is None else self._codes
+            if positions is not None:
+                # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, computed for every candidate and query at once
+                sq_dist = self._sq_norms[positions, None] - 2.0 * self._dot(vectors[positions], queries)
+            elif mask is not None:
+                # Selective filters: only the matching rows are multiplied
+                positions = np.flatnonzero(mask)
+                sq_dist = self._sq_norms[positions, None] - 2.0 * self._dot(vectors[positions], queries)
+            else:
+                positions = np.flatnonzero(self._alive[:self._size])
+                sq_dist = self._sq_norms[:self._size, None] - 2.0 * self._dot(vectors[:self._size], queries)
+                sq_dist = sq_dist[positions]
+            query_sq_norms = np.einsum("ij,ij->i", queries, queries)
+            sq_dist += query_sq_norms[None, :]
+            np.maximum(sq_dist, 0.0, out=sq_dist)
+
+            k = min(top_k if self._codec is None else top_k * ANN_RERANK_FACTOR, len(positions))
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+            if k < len(positions):
+                candidates = np.argpartition(sq_dist, k - 1, axis=0)[:k]
+            else:
+                candidates = np.broadcast_to(np.arange(len(positions))[:, None], (k, len(queries)))
+
+            batch = []
+            for column in range(len(queries)):
+                hits = positions[candidates[:, column]]
+                if self._codec is None:
+                    hit_dist = sq_dist[candidates[:, column], column]
+                else:
+                    # Exact distances for the shortlist only, from the full-precision rows
+                    hit_dist = self._sq_norms[hits] - 2.0 * (self._rows(hits) @ queries[column]) + query_sq_norms[column]
+                    np.maximum(hit_dist, 0.0, out=hit_dist)
+                order = np.argsort(hit_dist, kind="stable")[:top_k]
+                results = []
+                for position, sq in zip(hits[order], hit_dist[order]):
+                    distance = float(np.sqrt(sq))
+                    result = {
+                        "product": self._products[position],
+                        "distance": distance,
+                        "similarity_score": 1 / (1 + distance)
+                    }
+                    if result["product"] is None:
+                        result["product"] = {"id": self._ids[position]}
+                        result["_unhydrated"] = True
+                    results.append(result)
+                batch.append(results)
+            return batch
+
+    def _dot(self, vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if self._codec is None:
+            return vectors @ queries.T
+        return self._codec.dot(vectors, queries)
+
+    def refresh(self, supabase) -> int:
+        """Pull products created since the last refresh (everything on first load).
+
+        Returns:
+            Number of products added or updated
+        """
+        added = 0
+        start = 0
+        full_load = self.watermark is None
+        while True:
+            query = supabase.table("products").select(CATALOG_COLUMNS)
+            if self.watermark is not None:
+                query = query.gte("created_at", self.watermark)
+            response = query.order("created_at").order("id").range(
+                start, start + CATALOG_PAGE_SIZE - 1
+            ).execute()
+
+            rows = response.data or []
+            added += self.add_products(rows)
+            if len(rows) < CATALOG_PAGE_SIZE:
+                break
+            start += CATALOG_PAGE_SIZE
+
+        self.loaded = True
+        self.last_refresh = time.time()
+        if full_load:
+            self.last_reconcile = self.last_refresh
+        self.build_index()
+        return added
+
+    def reconcile(self, supabase) -> int:
+        """Tombstone products deleted from the database since they were loaded.
+
+        Lists every product id (ids only, keyset-paged by id) and drops the
+        local rows missing from it. Rows added locally after the listing
+        started are left alone.
+
+        Returns:
+            Number of products removed
+        """
+        with self._lock:
+            local_ids = set(self._positions)
+        started = time.time()
+
+        remote_ids = set()
+        after = None
+        while True:
+            query = supabase.table("products").select("id")
+            if after is not None:
+                query = query.gt("id", after)
+            rows = query.order("id").limit(CATALOG_PAGE_SIZE).execute().data or []
+            remote_ids.update(str(row["id"]) for row in rows)
+            if len(rows) < CATALOG_PAGE_SIZE:
+                break
+            after = str(rows[-1]["id"])
+
+        removed = 0
+        with self._lock:
+            for product_id in local_ids - remote_ids:
+                removed += self._tombstone(product_id)
+        self.last_reconcile = started
+        return removed
+
+    def _reconcile_in_background(self, supabase):
+        try:
+            removed = self.reconcile(supabase)
+            if removed:
+                print(f"Removed {removed} deleted products from the catalog snapshot")
+        except Exception as e:
+            print(f"Warning: Could not reconcile catalog snapshot: {e}")
+        finally:
+            self._reconciling = False
+
+    def export_state(self) -> Dict:
+        """Return the live rows as compact arrays for persisting to disk and clear dirty.
+
+        With an encoding the codes and codec parameters are included, so a
+        restore doesn't have to re-encode the catalog.
+        """
+        with self._lock:
+            self.dirty = False
+            live = np.flatnonzero(self._alive[:self._size])
+            # Without deletes, views: rows below _size are never rewritten, and a
+            # file-backed matrix is then saved without first being copied into memory
+            rows = slice(0, self._size) if len(live) == self._size else live
+            state = {
+                "matrix": self._matrix[rows],
+                "sq_norms": self._sq_norms[live],
+                "ids": [self._ids[position] for position in live],
+                # Filter columns; product metadata itself is not persisted (see search())
+                "prices": self._prices[live],
+                "category_codes": self._category_codes[live],
+                "category_names": sorted(self._category_ids, key=self._category_ids.get),
+                "watermark": self.watermark,
+                "centroids": None,
+                "assignments": None,
+                "encoding": self.encoding,
+                "codes": None,
+                "codec_params": None,
+                "codes_trained_on": 0
+            }
+            if self._ivf is not None:
+                state["centroids"] = self._ivf.centroids
+                state["assignments"] = self._ivf.assignments(self._size)[live]
+            if self._codes is not None:
+                state["codes"] = self._codes[rows]
+                state["codec_params"] = self._codec.params()
+                state["codes_trained_on"] = self._codes_trained_on
+            return state
+
+    def restore_state(self, matrix: np.ndarray, sq_norms: np.ndarray, ids: List[str],
+                      products: Optional[List[Dict]], watermark: Optional[str],
+                      centroids: Optional[np.ndarray] = None,
+                      assignments: Optional[np.ndarray] = None,
+                      codes: Optional[np.ndarray] = None,
+                      codec_params: Optional[Dict[str, np.ndarray]] = None,
+                      codes_trained_on: int = 0,
+                      prices: Optional[np.ndarray] = None,
+                      category_codes: Optional[np.ndarray] = None,
+                      category_names: Optional[List[str]] = None):
+        """Replace the snapshot contents with previously exported arrays.
+
+        matrix (and codes) may be read-only memory maps; they are only copied
+        once new products are appended. Codes from export_state() are used
+        as they are; without them the catalog is encoded again.
+
+        products may be None when the filter columns are given as prices,
+        category_codes and category_names (as export_state() returns them);
+        metadata is then loaded per hit by search().
+        """
+        with self._lock:
+            size = matrix.shape[0]
+            self._matrix = matrix
+            matrix_file = None
+            # Only a whole mapped file (as np.load returns it); a slice's offset isn't its own
+            if self._codec is not None and isinstance(matrix, np.memmap) and isinstance(matrix.base, mmap.mmap):
+                matrix_file = (os.open(matrix.filename, os.O_RDONLY), matrix.offset)
+            self._set_matrix_file(matrix_file)
+            self._sq_norms = np.asarray(sq_norms, dtype=np.float32)
+            self._ids = np.empty(size, dtype=object)
+            self._ids[:] = ids
+            self._alive = np.ones(size, dtype=bool)
+            self._positions = {product_id: position for position, product_id in enumerate(ids)}
+            if products is not None:
+                self._products = list(products)
+                self._prices = np.full(size, np.nan)
+                self._category_codes = np.full(size, -1, dtype=np.int32)
+                self._category_ids = {}
+                for position, product in enumerate(self._products):
+                    self._set_columns(position, product)
+            else:
+                self._products = [None] * size
+                self._prices = np.asarray(prices, dtype=np.float64)
+                self._category_codes = np.asarray(category_codes, dtype=np.int32)
+                self._category_ids = {name: code for code, name in enumerate(category_names or [])}
+            self._size = size
+            self._live_count = size
+            self.watermark = watermark
+            self._ivf = None
+            if centroids is not None and assignments is not None:
+                self._ivf = IVFIndex.from_assignments(centroids, assignments)
+            self._codes = None
+            self._codes_trained_on = 0
+            if self._codec is not None:
+                if codes is not None and codes.shape == (size, self.dim) and codes.dtype == self._codec.dtype:
+                    self._codec.set_params(codec_params or {})
+                    self._codes = codes
+                    self._codes_trained_on = codes_trained_on or size
+                else:
+                    self._train_codes()
+            self.loaded = True
+            self.dirty = False
+            # Deletes made while the store was on disk are picked up on the next refresh
+            self.last_reconcile = 0.0
+
+    def ensure_fresh(self, supabase, max_age: float = CATALOG_REFRESH_SECONDS):
+        """Load the snapshot on first use and refresh it once it is older than max_age.
+
+        Every CATALOG_RECONCILE_SECONDS a refresh also starts a background
+        reconcile() so deletes made elsewhere are dropped.
+        """
+        if self.loaded and time.time() - self.last_refresh < max_age:
+            return
+        with self._refresh_lock:
+            if self.loaded and time.time() - self.last_refresh < max_age:
+                return
+            self.refresh(supabase)
+            if not self._reconciling and time.time() - self.last_reconcile >= CATALOG_RECONCILE_SECONDS:
+                self._reconciling = True
+                threading.Thread(target=self._reconcile_in_background, args=(supabase,), daemon=True).start()
+
+
+_catalog_snapshot = None
+_catalog_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """Return the process-wide catalog snapshot"""
+    global _catalog_snapshot
+    if _catalog_snapshot is None:
+        with _catalog_snapshot_lock:
+            if _catalog_snapshot is None:
+                _catalog_snapshot = CatalogSnapshot()
+    return _catalog_snapshot
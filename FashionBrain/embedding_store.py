@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import glob
+import fcntl
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from embedding_index import CatalogSnapshot
+
+# Directory holding the persisted catalog snapshot; empty string disables it
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")
+
+# Seconds between a catalog change and the background save that persists it,
+# so a burst of inserts or deletes is written once
+EMBEDDING_STORE_SAVE_DELAY_SECONDS = float(os.getenv("EMBEDDING_STORE_SAVE_DELAY_SECONDS", "30"))
+
+MANIFEST_NAME = "manifest.json"
+
+# Held (flock) while a save runs; the lock file is shared by every worker process
+SAVE_LOCK_NAME = ".save.lock"
+
+_save_lock = threading.Lock()
+_scheduled_save: Optional[threading.Timer] = None
+_schedule_lock = threading.Lock()
+
+
+def _array_path(directory: str, name: str, version: str) -> str:
+    return os.path.join(directory, f"{name}-{version}.npy")
+
+
+def save_snapshot(snapshot: CatalogSnapshot, directory: str = EMBEDDING_STORE_DIR) -> Optional[str]:
+    """Write the snapshot to disk as raw float32 .npy files plus a JSON manifest.
+
+    Array files carry the version stamp in their name and the manifest is
+    swapped in with an atomic rename, so readers always see a matching set.
+    Saves from every worker on the machine are serialised with an flock on
+    a file in the directory, and each save removes only the version its
+    manifest replaced; workers that still have it mapped keep reading it
+    until they reload.
+
+    Product ids are stored as an array, not in the manifest, and product
+    metadata isn't stored at all: only the filter columns (price, category)
+    are, and search hits load their metadata lazily.
+
+    Returns:
+        The version stamp written, or None if the store is disabled or
+        another save is already in progress
+    """
+    if not directory:
+        return None
+    # Another thread is already writing a newer copy; skip rather than queue up
+    if not _save_lock.acquire(blocking=False):
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, SAVE_LOCK_NAME), "a") as lock_file:
+            # Blocks while another worker saves; released when the file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return _write_snapshot(snapshot, directory)
+    finally:
+        _save_lock.release()
+
+
+def schedule_save(snapshot: CatalogSnapshot, directory: str = EMBEDDING_STORE_DIR,
+                  delay: float = EMBEDDING_STORE_SAVE_DELAY_SECONDS):
+    """Persist a dirty snapshot on a background thread after delay seconds.
+
+    Changes made before the save runs are covered by the same save, so
+    callers on the request path can call this after every change.
+    """
+    global _scheduled_save
+    if not directory or not snapshot.dirty:
+        return
+    with _schedule_lock:
+        if _scheduled_save is not None:
+            return
+        timer = threading.Timer(delay, _background_save, args=(snapshot, directory))
+        timer.daemon = True
+        _scheduled_save = timer
+    timer.start()
+
+
+def _background_save(snapshot: CatalogSnapshot, directory: str):
+    global _scheduled_save
+    with _schedule_lock:
+        _scheduled_save = None
+    try:
+        save_snapshot(snapshot, directory)
+    except Exception as e:
+        print(f"Warning: Could not persist catalog snapshot: {e}")
+
+
+def _write_snapshot(snapshot: CatalogSnapshot, directory: str) -> str:
+    state = snapshot.export_state()
+    try:
+        return _write_state(snapshot, state, directory)
+    except Exception:
+        # Nothing was persisted; the next schedule_save() tries again
+        snapshot.dirty = True
+        raise
+
+
+def _write_state(snapshot: CatalogSnapshot, state: Dict, directory: str) -> str:
+    version = f"{int(time.time() * 1000)}-{os.getpid()}"
+
+    arrays = {
+        "embeddings": state["matrix"],
+        "sq_norms": state["sq_norms"],
+        # Fixed-width bytes: ids are ASCII, and np.load then needs no pickle
+        "ids": np.array(state["ids"], dtype=bytes),
+        "prices": state["prices"],
+        "category_codes": state["category_codes"]
+    }
+    if state["centroids"] is not None:
+        arrays["centroids"] = state["centroids"]
+        arrays["assignments"] = state["assignments"]
+    if state["codes"] is not None:
+        arrays["codes"] = state["codes"]
+        for name, param in state["codec_params"].items():
+            arrays[f"codec_{name}"] = param
+    for name, array in arrays.items():
+        np.save(_array_path(directory, name, version), np.ascontiguousarray(array))
+
+    manifest = {
+        "version": version,
+        "dim": snapshot.dim,
+        "count": len(state["ids"]),
+        "watermark": state["watermark"],
+        "encoding": state["encoding"],
+        "codes_trained_on": state["codes_trained_on"],
+        "arrays": sorted(arrays),
+        "category_names": state["category_names"]
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    superseded = _read_manifest(manifest_path)
+    manifest_tmp = os.path.join(directory, f"{MANIFEST_NAME}.{version}.tmp")
+    with open(manifest_tmp, "w") as f:
+        json.dump(manifest, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_tmp, manifest_path)
+
+    if superseded is not None and superseded.get("version") != version:
+        for path in glob.glob(os.path.join(directory, f"*-{superseded['version']}.npy")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return version
+
+
+def _read_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(snapshot: CatalogSnapshot, directory: str = EMBEDDING_STORE_DIR) -> Optional[Dict]:
+    """Restore the snapshot from disk, memory-mapping the embedding matrix.
+
+    The matrix is opened read-only with mmap, so every worker on the machine
+    shares the same physical pages through the OS page cache. Codes saved
+    with the snapshot's ANN_ENCODING are mapped the same way; a store saved
+    with another encoding is re-encoded on load.
+
+    Returns:
+        The manifest, or None if nothing was loaded
+    """
+    if not directory:
+        return None
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if "ids" not in manifest.get("arrays", []):
+            print("Embedding store predates the ids array, ignoring")
+            return None
+        if manifest.get("dim") != snapshot.dim:
+            print(f"Embedding store dimension {manifest.get('dim')} does not match {snapshot.dim}, ignoring")
+            return None
+
+        version = manifest["version"]
+        matrix = np.load(_array_path(directory, "embeddings", version), mmap_mode="r")
+        sq_norms = np.load(_array_path(directory, "sq_norms", version))
+        ids = np.load(_array_path(directory, "ids", version)).astype(str).tolist()
+        prices = np.load(_array_path(directory, "prices", version))
+        category_codes = np.load(_array_path(directory, "category_codes", version))
+        centroids = assignments = None
+        if "centroids" in manifest.get("arrays", []):
+            centroids = np.load(_array_path(directory, "centroids", version))
+            assignments = np.load(_array_path(directory, "assignments", version))
+        codes, codec_params = None, {}
+        if manifest.get("encoding") == snapshot.encoding and "codes" in manifest.get("arrays", []):
+            codes = np.load(_array_path(directory, "codes", version), mmap_mode="r")
+            for name in manifest["arrays"]:
+                if name.startswith("codec_"):
+                    codec_params[name[len("codec_"):]] = np.load(_array_path(directory, name, version))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Failed to load embedding store: {e}")
+        return None
+
+    snapshot.restore_state(
+        matrix,
+        sq_norms,
+        ids,
+        None,
+        manifest.get("watermark"),
+        centroids=centroids,
+        assignments=assignments,
+        codes=codes,
+        codec_params=codec_params,
+        codes_trained_on=manifest.get("codes_trained_on", 0),
+        prices=prices,
+        category_codes=category_codes,
+        category_names=manifest.get("category_names", [])
+    )
+    return manifest
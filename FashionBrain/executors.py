@@ -0,0 +1,31 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Threads for blocking network calls (Supabase, Cloudinary). These spend most
+# of their time waiting, so the pool can be larger than the core count.
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+
+# Threads for embedding generation, image decoding and outfit generation.
+# Kept near the core count so CPU work can't starve the I/O pool.
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(os.cpu_count() or 2)))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="io")
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu")
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking I/O call on the I/O pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Run CPU-bound work (embeddings, PIL, outfit generation) on the CPU pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, functools.partial(func, *args, **kwargs))
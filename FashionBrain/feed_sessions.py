@@ -0,0 +1,132 @@
+import os
+import time
+import secrets
+import threading
+import itertools
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from cursors import InvalidCursorError, encode_payload, decode_payload
+
+# How long an idle feed session keeps its place before "Load more" has to rebuild it
+FEED_SESSION_TTL_SECONDS = int(os.getenv("FEED_SESSION_TTL_SECONDS", "900"))
+
+# Feed sessions kept in memory (least recently used are evicted)
+FEED_SESSION_MAX = int(os.getenv("FEED_SESSION_MAX", "5000"))
+
+
+def encode_cursor(session_id: str, offset: int) -> str:
+    """Opaque cursor naming a feed session and how far into it the client has read"""
+    return encode_payload({"s": session_id, "o": offset})
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    payload = decode_payload(cursor)
+    session_id, offset = payload.get("s"), payload.get("o")
+    if not isinstance(session_id, str) or not isinstance(offset, int) or offset < 0:
+        raise InvalidCursorError("Invalid feed cursor")
+    return session_id, offset
+
+
+class FeedSession:
+    """One user's lazily generated feed and how far into it they have read.
+
+    Pages are taken from the outfit iterator as they are requested, so
+    earlier pages are never recomputed. The last page is kept so a retried
+    request (same cursor) gets the same outfits back.
+
+    continuation, if given, is awaited once the outfits run out and returns
+    the iterator the session continues with (see continue_with()).
+    """
+
+    def __init__(self, user_id: str, outfits: Iterator[Dict],
+                 continuation: Optional[Callable[[], Awaitable[Iterator[Dict]]]] = None):
+        self.id = secrets.token_urlsafe(12)
+        self.user_id = user_id
+        self.offset = 0
+        self.exhausted = False
+        self.last_used = time.monotonic()
+        self.continuation = continuation
+        self._outfits = outfits
+        self._last_offset = None
+        self._last_page: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def page(self, offset: int, num_outfits: int) -> Optional[List[Dict]]:
+        """Outfits starting at offset, or None if this session can't serve that offset"""
+        with self._lock:
+            self.last_used = time.monotonic()
+            if offset == self._last_offset and offset != self.offset:
+                return list(self._last_page)
+            if offset != self.offset:
+                return None
+
+            page = list(itertools.islice(self._outfits, max(num_outfits, 0)))
+            self._last_offset, self._last_page = offset, page
+            self.offset += len(page)
+            self.exhausted = len(page) < num_outfits
+            return page
+
+    def continue_with(self, outfits: Iterator[Dict], num_outfits: int) -> List[Dict]:
+        """Switch an exhausted session to outfits and top the last page up to num_outfits from it"""
+        with self._lock:
+            self.continuation = None
+            self._outfits = outfits
+            more = list(itertools.islice(self._outfits, max(num_outfits - len(self._last_page), 0)))
+            self._last_page = self._last_page + more
+            self.offset += len(more)
+            self.exhausted = len(self._last_page) < num_outfits
+            return list(self._last_page)
+
+    def skip(self, count: int):
+        """Advance past count outfits without returning them (used when resuming an evicted session)"""
+        with self._lock:
+            skipped = sum(1 for _ in itertools.islice(self._outfits, count))
+            self.offset += skipped
+            self.exhausted = skipped < count
+
+
+class FeedSessionStore:
+    """Feed sessions by id, bounded in number and expired after FEED_SESSION_TTL_SECONDS idle"""
+
+    def __init__(self, max_sessions: int = FEED_SESSION_MAX, ttl_seconds: float = FEED_SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, FeedSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, user_id: str, outfits: Iterator[Dict],
+               continuation: Optional[Callable[[], Awaitable[Iterator[Dict]]]] = None) -> FeedSession:
+        session = FeedSession(user_id, outfits, continuation)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str, user_id: str) -> Optional[FeedSession]:
+        """The user's live session with this id, or None if it expired, was evicted or isn't theirs"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.user_id != user_id:
+                return None
+            if time.monotonic() - session.last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+feed_sessions = FeedSessionStore()
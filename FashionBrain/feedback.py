@@ -1,17 +1,261 @@
+import os
+import time
+import uuid
+import bisect
+import threading
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from db import get_supabase_client
+from action_log import ActionLog, open_action_log
+
+# Queue actions in process and insert them in batches instead of on the request path
+ACTION_WRITE_BEHIND = os.getenv("ACTION_WRITE_BEHIND", "false").lower() == "true"
+
+# How often the write-behind queue is flushed, and the most rows sent per insert
+ACTION_FLUSH_INTERVAL_MS = float(os.getenv("ACTION_FLUSH_INTERVAL_MS", "250"))
+ACTION_FLUSH_BATCH_SIZE = int(os.getenv("ACTION_FLUSH_BATCH_SIZE", "500"))
+
+# Longest wait between retries while the database is unavailable
+ACTION_FLUSH_MAX_BACKOFF_SECONDS = 30.0
+
+
+def action_rows(user_id, product_ids: Iterable, action_type, outfit_id=None) -> List[Dict]:
+    """user_actions rows for one action on one or more products"""
+    created_at = datetime.utcnow().isoformat()
+    # Every row carries the same keys so batches from different requests can share one insert.
+    # The id is fixed here so a batch written twice (a retry, a log replay) is stored once.
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "product_id": product_id,
+            "action": action_type,
+            "outfit_id": outfit_id,
+            "created_at": created_at
+        }
+        for product_id in product_ids
+    ]
+
+
+def insert_actions(rows: List[Dict], supabase=None):
+    """Insert user_actions rows with one bulk statement; rows whose id already exists are skipped"""
+    if supabase is None:
+        supabase = get_supabase_client()
+    return supabase.table("user_actions").upsert(rows, ignore_duplicates=True).execute()
+
+
+class ActionWriter:
+    """Write-behind queue for user_actions rows.
+
+    enqueue() returns without touching the database; a background thread
+    inserts queued rows every flush_interval_ms, up to batch_size rows per
+    statement. If an insert fails the rows go back to the front of the
+    queue and the flusher backs off, so a database brownout delays actions
+    instead of dropping them.
+
+    With an ActionLog attached, enqueue() first appends the rows to the
+    local log (fsync'd), each successful insert acks them, and rows left
+    unacked by a crash are replayed into the queue on the next start.
+    Concurrent enqueues can reach the queue out of log order, so entries
+    are kept sorted by seq and the log is only acked up to the highest seq
+    below which every record has been written.
+    """
+
+    def __init__(self, flush_interval_ms: float = ACTION_FLUSH_INTERVAL_MS,
+                 batch_size: int = ACTION_FLUSH_BATCH_SIZE, insert=insert_actions):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self._insert = insert
+        self._pending: List = []
+        self._log: Optional[ActionLog] = None
+        # Highest seq with every record up to it written, and written seqs above it
+        self._written_through = 0
+        self._written_seqs = set()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._listeners = []
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def add_listener(self, callback):
+        """Call callback(rows) after each batch of rows has been written"""
+        self._listeners.append(callback)
+
+    def attach_log(self, log: ActionLog):
+        """Log every enqueued batch to log, and queue whatever it still holds unacked"""
+        replayed = log.replay()
+        with self._condition:
+            self._log = log
+            self._written_through = log.acked
+            # Records lost to corruption leave gaps that would otherwise hold back every later ack
+            replayed_seqs = {seq for seq, _ in replayed}
+            last = max(replayed_seqs, default=log.acked)
+            self._written_seqs = set(range(log.acked + 1, last)) - replayed_seqs
+            self._queue(replayed)
+        if replayed:
+            print(f"Replaying {sum(len(rows) for _, rows in replayed)} user actions from {log.directory}")
+            self._start()
+
+    def enqueue(self, rows: List[Dict]):
+        # Blocks for the log fsync only; call from a worker thread, not the event loop
+        seq = self._log.append(rows) if self._log is not None else None
+        with self._condition:
+            self._queue([(seq, rows)])
+        self._start()
+
+    def _queue(self, entries: List):
+        """Queue (seq, rows) entries in seq order. Called with _condition held"""
+        for entry in entries:
+            if entry[0] is None:
+                self._pending.append(entry)
+            else:
+                bisect.insort(self._pending, entry, key=lambda pending: pending[0])
+
+    def _start(self):
+        with self._condition:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="action-writer", daemon=True)
+                self._thread.start()
+
+    def _take(self) -> List:
+        """Queued (seq, rows) entries adding up to about batch_size rows"""
+        with self._condition:
+            count, rows = 0, 0
+            while count < len(self._pending) and (rows == 0 or rows + len(self._pending[count][1]) <= self.batch_size):
+                rows += len(self._pending[count][1])
+                count += 1
+            entries = self._pending[:count]
+            del self._pending[:count]
+            return entries
+
+    def _requeue(self, entries: List):
+        with self._condition:
+            if self._log is None:
+                self._pending[:0] = entries
+            else:
+                self._queue(entries)
+
+    def _written(self, entries: List) -> Optional[int]:
+        """Mark entries written; the new contiguous written seq to ack, or None if it didn't move"""
+        with self._condition:
+            self._written_seqs.update(seq for seq, _ in entries if seq is not None)
+            through = self._written_through
+            while through + 1 in self._written_seqs:
+                through += 1
+                self._written_seqs.discard(through)
+            if through == self._written_through:
+                return None
+            self._written_through = through
+            return through
+
+    def flush(self) -> bool:
+        """Insert everything queued; False if an insert failed (those rows stay queued)"""
+        while True:
+            entries = self._take()
+            if not entries:
+                return True
+            batch = [row for _, rows in entries for row in rows]
+            try:
+                self._insert(batch)
+            except Exception as e:
+                self._requeue(entries)
+                self.failures += 1
+                print(f"Warning: Could not write {len(batch)} user actions: {e}")
+                return False
+            if self._log is not None:
+                through = self._written(entries)
+                if through is not None:
+                    self._log.ack(through)
+            self.written += len(batch)
+            self.batches += 1
+            for callback in self._listeners:
+                try:
+                    callback(batch)
+                except Exception as e:
+                    print(f"Warning: User action listener failed: {e}")
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                self._condition.wait(backoff)
+                if self._stopping:
+                    return
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                backoff = min(backoff * 2, ACTION_FLUSH_MAX_BACKOFF_SECONDS)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the flusher and write what is still queued"""
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline and not self.flush():
+            time.sleep(0.1)
+        if self._log is not None:
+            # Whatever is still pending stays in the log for the next start
+            self._log.close()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            pending = sum(len(rows) for _, rows in self._pending)
+        return {
+            "pending": pending,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "batch_size": self.batch_size,
+            "log": self._log.stats() if self._log is not None else None
+        }
+
+
+action_writer = ActionWriter()
+
+
+def start_action_writer():
+    """Attach the crash-safe action log in write-behind mode and replay what it holds"""
+    if ACTION_WRITE_BEHIND:
+        log = open_action_log()
+        if log is not None:
+            action_writer.attach_log(log)
+
+
+def log_user_actions(user_id, product_ids: Iterable, action_type, outfit_id=None, supabase=None):
+    """Record one action on one or more products with a single insert.
+
+    With ACTION_WRITE_BEHIND the rows are queued for the background writer
+    instead, and the call returns without waiting for the database.
+    """
+    rows = action_rows(user_id, product_ids, action_type, outfit_id)
+
+    if ACTION_WRITE_BEHIND:
+        action_writer.enqueue(rows)
+        return {
+            "success": True,
+            "message": "Action queued",
+            "data": rows
+        }
+
+    response = insert_actions(rows, supabase)
 
-def log_user_action(user_id, product_id, action_type, supabase):
-    data = {
-        "user_id": user_id,
-        "product_id": product_id,
-        "action_type": action_type,
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    response = supabase.table("user_actions").insert(data).execute()
-    
     return {
         "success": True,
         "message": "Action logged successfully",
         "data": response.data
     }
+
+
+def log_user_action(user_id, product_id, action_type, supabase=None):
+    return log_user_actions(user_id, [product_id], action_type, supabase=supabase)
@@ -10,6 +10,7 @@ export default function Feed() {
   const [selectedOutfit, setSelectedOutfit] = useState(null);
   const [loading, setLoading] = useState(true);
   const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
   const { user, token, signout } = useAuth();
   const navigate = useNavigate();
 
@@ -35,7 +36,10 @@ export default function Feed() {
       }
 
       const authToken = token || localStorage.getItem('token');
-      const data = await api.get('/feed?num_outfits=10', authToken);
+      // The cursor resumes the feed where the last page stopped
+      const cursorParam = append && nextCursor ? `&cursor=${encodeURIComponent(nextCursor)}` : '';
+      const data = await api.get(`/feed?num_outfits=10${cursorParam}`, authToken);
+      setNextCursor(data.next_cursor || null);
       
       if (append) {
         setOutfits(prev => [...prev, ...(data.outfits || [])]);
@@ -129,7 +133,7 @@ export default function Feed() {
             <div className="mt-12 text-center">
               <button
                 onClick={handleLoadMore}
-                disabled={loadingMore}
+                disabled={loadingMore || !nextCursor}
                 className="btn btn-primary px-12 py-4 text-lg disabled:opacity-50 disabled:cursor-not-allowed"
               >
                 {loadingMore ? (
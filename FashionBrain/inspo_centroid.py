@@ -0,0 +1,206 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_index import EMBEDDING_DIM, parse_embedding, row_embedding
+
+# Half-life in days for weighting recent inspiration higher; 0 uses the plain mean
+INSPO_HALF_LIFE_DAYS = float(os.getenv("INSPO_HALF_LIFE_DAYS", "0"))
+
+# Most recent inspo images searched as separate feed queries (fused), so
+# distinct styles aren't averaged away; 0 searches with the centroid only
+INSPO_FEED_QUERIES = int(os.getenv("INSPO_FEED_QUERIES", "20"))
+
+# Compare-and-set attempts before a centroid update gives up (concurrent uploads by one user)
+CENTROID_UPDATE_RETRIES = 5
+
+CENTROID_COLUMNS = "inspo_sum,inspo_count,inspo_decayed_sum,inspo_decayed_weight,inspo_updated_at,inspo_version"
+
+
+def _timestamp(value) -> float:
+    """Epoch seconds for a Supabase timestamp; naive timestamps are UTC"""
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class InspoCentroid:
+    """Running sum and count of a user's inspo embeddings.
+
+    The centroid is sum / count, so adding or removing an image is one
+    vector addition instead of refetching every embedding. With
+    INSPO_HALF_LIFE_DAYS set, a second sum is kept in which each image is
+    weighted by 2^(-age / half_life); both sum and weight are expressed
+    relative to updated_at and rescaled to the current time on each update.
+    Rescaling both by the same factor doesn't change their ratio, so reads
+    never need to decay anything.
+    """
+
+    def __init__(self, total=None, count: int = 0, decayed=None, weight: float = 0.0,
+                 updated_at: Optional[float] = None, version: int = 0, half_life_days: float = INSPO_HALF_LIFE_DAYS):
+        self.total = np.zeros(EMBEDDING_DIM, dtype=np.float64) if total is None else np.asarray(total, dtype=np.float64)
+        self.count = count
+        self.half_life = half_life_days * 86400
+        self.decayed = None
+        self.weight = 0.0
+        if self.half_life > 0:
+            self.decayed = np.zeros(EMBEDDING_DIM, dtype=np.float64) if decayed is None else np.asarray(decayed, dtype=np.float64)
+            self.weight = weight
+        self.updated_at = time.time() if updated_at is None else updated_at
+        self.version = version
+
+    @classmethod
+    def from_row(cls, user: Dict) -> Optional["InspoCentroid"]:
+        """Centroid stored on a users row, or None if it was never computed (or lacks the decayed sum)"""
+        count = user.get("inspo_count")
+        if count is None:
+            return None
+
+        total = parse_embedding(user.get("inspo_sum"))
+        decayed = parse_embedding(user.get("inspo_decayed_sum"))
+        if count > 0 and (total is None or (INSPO_HALF_LIFE_DAYS > 0 and decayed is None)):
+            return None
+
+        updated_at = user.get("inspo_updated_at")
+        return cls(
+            total=total,
+            count=count,
+            decayed=decayed,
+            weight=float(user.get("inspo_decayed_weight") or 0.0),
+            updated_at=_timestamp(updated_at) if updated_at else None,
+            version=user.get("inspo_version") or 0
+        )
+
+    @classmethod
+    def from_images(cls, images: List[Dict], version: int = 0) -> "InspoCentroid":
+        """Centroid of inspo_images rows (embedding_b64, created_at)"""
+        centroid = cls(version=version)
+        for image in images:
+            embedding = row_embedding(image)
+            if embedding is not None:
+                centroid.add(embedding, created_at=image.get("created_at"))
+        return centroid
+
+    def _advance(self, now: float):
+        if self.decayed is not None and now > self.updated_at:
+            factor = 2.0 ** (-(now - self.updated_at) / self.half_life)
+            self.decayed *= factor
+            self.weight *= factor
+        self.updated_at = max(self.updated_at, now)
+
+    def add(self, embedding, created_at=None, sign: int = 1):
+        """Add an image's embedding (sign=-1 removes one added earlier with the same created_at)"""
+        embedding = np.asarray(embedding, dtype=np.float64)
+        self.total += sign * embedding
+        self.count = max(self.count + sign, 0)
+        if self.decayed is not None:
+            self._advance(time.time())
+            weight = 2.0 ** (-max(self.updated_at - _timestamp(created_at), 0.0) / self.half_life)
+            self.decayed += sign * weight * embedding
+            self.weight = max(self.weight + sign * weight, 0.0)
+        if self.count == 0:
+            # Start again from exact zeros rather than accumulated rounding error
+            self.total[:] = 0
+            if self.decayed is not None:
+                self.decayed[:] = 0
+                self.weight = 0.0
+
+    def remove(self, embedding, created_at=None):
+        self.add(embedding, created_at=created_at, sign=-1)
+
+    def vector(self) -> Optional[np.ndarray]:
+        """The (time-weighted, if enabled) mean inspo embedding, or None without images"""
+        if self.count <= 0:
+            return None
+        if self.decayed is not None and self.weight > 0:
+            return (self.decayed / self.weight).astype(np.float32)
+        return (self.total / self.count).astype(np.float32)
+
+    def to_row(self) -> Dict:
+        return {
+            "inspo_sum": self.total.astype(np.float32).tolist(),
+            "inspo_count": self.count,
+            "inspo_decayed_sum": self.decayed.astype(np.float32).tolist() if self.decayed is not None else None,
+            "inspo_decayed_weight": self.weight if self.decayed is not None else None,
+            "inspo_updated_at": datetime.fromtimestamp(self.updated_at, tz=timezone.utc).isoformat(),
+            "inspo_version": self.version + 1
+        }
+
+
+def _fetch_images(supabase, user_id: str) -> List[Dict]:
+    response = supabase.table("inspo_images").select("embedding_b64,created_at").eq("user_id", user_id).execute()
+    return response.data or []
+
+
+def _save(supabase, user_id: str, centroid: InspoCentroid) -> bool:
+    """Write the centroid if nobody else has since the version was read"""
+    response = supabase.table("users").update(centroid.to_row()).eq(
+        "id", user_id
+    ).eq("inspo_version", centroid.version).execute()
+    return bool(response.data)
+
+
+def update_centroid(supabase, user_id: str, embedding, created_at=None, sign: int = 1) -> Optional[np.ndarray]:
+    """Add (sign=1) or remove (sign=-1) one inspo embedding from the user's stored centroid.
+
+    Users whose centroid was never computed get it rebuilt from inspo_images,
+    which already reflects the insert or delete. Returns the new centroid.
+    """
+    for _ in range(CENTROID_UPDATE_RETRIES):
+        response = supabase.table("users").select(CENTROID_COLUMNS).eq("id", user_id).execute()
+        if not response.data:
+            return None
+
+        user = response.data[0]
+        centroid = InspoCentroid.from_row(user)
+        if centroid is None:
+            centroid = InspoCentroid.from_images(_fetch_images(supabase, user_id), version=user.get("inspo_version") or 0)
+        else:
+            centroid.add(embedding, created_at=created_at, sign=sign)
+
+        if _save(supabase, user_id, centroid):
+            return centroid.vector()
+
+    print(f"Warning: Could not update inspo centroid for user {user_id}: too many concurrent updates")
+    return None
+
+
+def load_centroid(supabase, user_id: str, user: Optional[Dict] = None) -> Optional[np.ndarray]:
+    """The user's inspo centroid, from the users row when stored there.
+
+    Rows from before the centroid columns existed are backfilled from
+    inspo_images once.
+    """
+    if user is not None:
+        centroid = InspoCentroid.from_row(user)
+        if centroid is not None:
+            return centroid.vector()
+
+    centroid = InspoCentroid.from_images(
+        _fetch_images(supabase, user_id), version=(user or {}).get("inspo_version") or 0
+    )
+    if user is not None:
+        try:
+            _save(supabase, user_id, centroid)
+        except Exception as e:
+            print(f"Warning: Could not backfill inspo centroid for user {user_id}: {e}")
+    return centroid.vector()
+
+
+def load_inspo_embeddings(supabase, user_id: str, limit: int = INSPO_FEED_QUERIES) -> List[np.ndarray]:
+    """Embeddings of the user's most recent inspo images, newest first"""
+    if limit <= 0:
+        return []
+    response = supabase.table("inspo_images").select("embedding_b64").eq(
+        "user_id", user_id
+    ).order("created_at", desc=True).limit(limit).execute()
+    embeddings = [row_embedding(image) for image in response.data or []]
+    return [embedding for embedding in embeddings if embedding is not None]
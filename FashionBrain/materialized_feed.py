@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from clip_model import LatencyStats
+
+# Outfits precomputed per user; past these the feed continues from a live build
+FEED_MATERIALIZED_SIZE = int(os.getenv("FEED_MATERIALIZED_SIZE", "200"))
+
+# Users whose precomputed feeds stay in memory (least recently used are evicted)
+FEED_MATERIALIZED_USERS = int(os.getenv("FEED_MATERIALIZED_USERS", "10000"))
+
+# Longest a precomputed feed is served; bounds staleness from changes made on
+# other workers that this one never hears about (e.g. product deletes)
+FEED_MATERIALIZED_TTL_SECONDS = float(os.getenv("FEED_MATERIALIZED_TTL_SECONDS", "600"))
+
+# How often a served feed's inputs are re-read from the users table, to catch
+# changes made through other workers; local changes rebuild the feed directly
+FEED_MATERIALIZED_RECHECK_SECONDS = float(os.getenv("FEED_MATERIALIZED_RECHECK_SECONDS", "60"))
+
+# Swipes rebuild a feed once this many have accumulated, or on the first one
+# after FEED_REBUILD_MIN_INTERVAL_SECONDS; the seen-set hides swiped products meanwhile
+FEED_REBUILD_AFTER_ACTIONS = int(os.getenv("FEED_REBUILD_AFTER_ACTIONS", "10"))
+FEED_REBUILD_MIN_INTERVAL_SECONDS = float(os.getenv("FEED_REBUILD_MIN_INTERVAL_SECONDS", "60"))
+
+# User columns a feed is built from; a feed built from different values is stale
+FEED_INPUT_COLUMNS = "inspo_version,preference_version,min_price,max_price"
+
+
+def load_feed_inputs(supabase, user_id: str) -> Optional[Tuple]:
+    """Version stamp of everything on the user row that shapes their feed"""
+    response = supabase.table("users").select(FEED_INPUT_COLUMNS).eq("id", user_id).execute()
+    if not response.data:
+        return None
+    user = response.data[0]
+    return tuple(user.get(column) for column in FEED_INPUT_COLUMNS.split(","))
+
+
+class MaterializedFeed:
+    """A user's precomputed outfits, best first, with the seen-set used to hide products on read.
+
+    inputs is load_feed_inputs() as read before the build started.
+    """
+
+    def __init__(self, outfits: List[Dict], seen=None, inputs: Optional[Tuple] = None):
+        self.outfits = outfits
+        self.seen = seen
+        self.inputs = inputs
+        self.product_ids = frozenset(str(item.get("id")) for outfit in outfits for item in outfit["items"])
+        self.built_at = time.time()
+        # When inputs were last confirmed against the users table
+        self.checked_at = time.monotonic()
+
+    @property
+    def truncated(self) -> bool:
+        """True if the build had more outfits than were kept"""
+        return len(self.outfits) >= FEED_MATERIALIZED_SIZE
+
+    def needs_check(self, interval: float = FEED_MATERIALIZED_RECHECK_SECONDS) -> bool:
+        return time.monotonic() - self.checked_at >= interval
+
+
+class MaterializedFeedStore:
+    """Per-user precomputed feeds, rebuilt in the background when their inputs change.
+
+    Routes that change what a user's feed should contain (a new inspo image,
+    a new budget, an action) call invalidate(). That marks the feed stale and
+    starts at most one background rebuild per user; events arriving while a
+    rebuild runs trigger one more rebuild once it finishes. /feed just reads
+    the last built feed, so the request path never runs the vector search or
+    outfit generation while a feed is available.
+
+    Swipes go through record_action(), which only rebuilds once enough
+    have accumulated (or enough time has passed), and only for users who
+    have a feed here.
+
+    Events on other workers never reach this store, so a feed expires after
+    ttl_seconds, and every FEED_MATERIALIZED_RECHECK_SECONDS /feed compares
+    its inputs with the user row (see load_feed_inputs) and rejects it if
+    they differ. Deleting a product drops every feed that contains it.
+
+    Freshness lag is the time from the first event a rebuild incorporates to
+    the moment the rebuilt feed is stored.
+    """
+
+    def __init__(self, max_users: int = FEED_MATERIALIZED_USERS, ttl_seconds: float = FEED_MATERIALIZED_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._feeds: "OrderedDict[str, MaterializedFeed]" = OrderedDict()
+        self._stale_since: Dict[str, float] = {}
+        self._events: Dict[str, int] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._pending_actions: Dict[str, int] = {}
+        self._last_build: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.freshness_lag = LatencyStats()
+        self.read_latency = LatencyStats()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.rejected = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.deferred_actions = 0
+
+    def get(self, user_id: str) -> Optional[MaterializedFeed]:
+        with self._lock:
+            feed = self._feeds.get(user_id)
+            if feed is not None and time.time() - feed.built_at >= self.ttl_seconds:
+                del self._feeds[user_id]
+                self.expired += 1
+                feed = None
+            if feed is None:
+                self.misses += 1
+                return None
+            self._feeds.move_to_end(user_id)
+            self.hits += 1
+            return feed
+
+    def reject(self, user_id: str, feed: MaterializedFeed):
+        """Drop a feed the caller found stale (it is counted as a miss rather than a hit)"""
+        with self._lock:
+            if self._feeds.get(user_id) is feed:
+                del self._feeds[user_id]
+            self.hits -= 1
+            self.misses += 1
+            self.rejected += 1
+
+    def discard_product(self, product_id) -> int:
+        """Drop every feed containing a deleted product; returns how many were dropped"""
+        product_id = str(product_id)
+        with self._lock:
+            stale = [user_id for user_id, feed in self._feeds.items() if product_id in feed.product_ids]
+            for user_id in stale:
+                del self._feeds[user_id]
+        return len(stale)
+
+    async def build_now(self, user_id: str, build: Callable[[str], Awaitable[MaterializedFeed]]) -> Optional[MaterializedFeed]:
+        """Build the user's feed (joining a rebuild already in flight) and return it; None if the build failed"""
+        self.invalidate(user_id, build)
+        await asyncio.shield(self._refreshing[user_id])
+        with self._lock:
+            return self._feeds.get(user_id)
+
+    def record_action(self, user_id: str, build: Callable[[str], Awaitable[MaterializedFeed]]):
+        """A like or skip: rebuild after FEED_REBUILD_AFTER_ACTIONS of them or once the interval has passed.
+
+        Must be called from the event loop.
+        """
+        with self._lock:
+            if user_id not in self._feeds:
+                # Nothing to refresh; the next /feed builds from scratch anyway
+                self._pending_actions.pop(user_id, None)
+                return
+        pending = self._pending_actions.get(user_id, 0) + 1
+        since_build = time.monotonic() - self._last_build.get(user_id, 0.0)
+        if pending < FEED_REBUILD_AFTER_ACTIONS and since_build < FEED_REBUILD_MIN_INTERVAL_SECONDS:
+            self._pending_actions[user_id] = pending
+            self.deferred_actions += 1
+            return
+        self.invalidate(user_id, build)
+
+    def _store(self, user_id: str, feed: MaterializedFeed):
+        with self._lock:
+            self._feeds[user_id] = feed
+            self._feeds.move_to_end(user_id)
+            while len(self._feeds) > self.max_users:
+                evicted, _ = self._feeds.popitem(last=False)
+                self._last_build.pop(evicted, None)
+                self._pending_actions.pop(evicted, None)
+
+    def invalidate(self, user_id: str, build: Callable[[str], Awaitable[MaterializedFeed]]):
+        """Mark the user's feed stale and rebuild it in the background with build(user_id).
+
+        Must be called from the event loop.
+        """
+        # The rebuild takes in any swipes record_action() held back
+        self._pending_actions.pop(user_id, None)
+        self._events[user_id] = self._events.get(user_id, 0) + 1
+        self._stale_since.setdefault(user_id, time.monotonic())
+        if user_id not in self._refreshing:
+            self._refreshing[user_id] = asyncio.ensure_future(self._refresh(user_id, build))
+
+    async def _refresh(self, user_id: str, build: Callable[[str], Awaitable[MaterializedFeed]]):
+        try:
+            while user_id in self._stale_since:
+                events = self._events[user_id]
+                try:
+                    feed = await build(user_id)
+                except Exception as e:
+                    self.failures += 1
+                    print(f"Warning: Could not refresh feed for user {user_id}: {e}")
+                    # The next invalidate() starts over; a stale mark would only skew the lag stats
+                    self._stale_since.pop(user_id, None)
+                    self._events.pop(user_id, None)
+                    return
+
+                self._store(user_id, feed)
+                self._last_build[user_id] = time.monotonic()
+                self.refreshes += 1
+                if self._events[user_id] == events:
+                    # Nothing changed while building, so the feed is current
+                    self.freshness_lag.record(time.monotonic() - self._stale_since.pop(user_id))
+                    del self._events[user_id]
+        finally:
+            del self._refreshing[user_id]
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            users = len(self._feeds)
+        reads = self.hits + self.misses
+        return {
+            "users": users,
+            "max_users": self.max_users,
+            "outfits_per_user": FEED_MATERIALIZED_SIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / reads, 4) if reads else 0.0,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "ttl_seconds": self.ttl_seconds,
+            "recheck_seconds": FEED_MATERIALIZED_RECHECK_SECONDS,
+            "refreshes": self.refreshes,
+            "deferred_actions": self.deferred_actions,
+            "failures": self.failures,
+            "stale_users": len(self._stale_since),
+            "oldest_stale_seconds": round(now - min(self._stale_since.values()), 3) if self._stale_since else 0.0,
+            "freshness_lag": self.freshness_lag.summary(),
+            "read_latency": self.read_latency.summary()
+        }
+
+
+materialized_feeds = MaterializedFeedStore()
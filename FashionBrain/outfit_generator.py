@@ -1,119 +1,270 @@
+import heapq
 import numpy as np
-from typing import List, Dict, Optional
+from typing import Container, Dict, Iterator, List, Optional
 import random
 
-def generate_outfits(products: List[Dict], user_budget: Optional[Dict] = None, num_outfits: int = 10) -> List[Dict]:
+from embedding_index import EMBEDDING_DIM, row_embedding
+
+CATEGORY_ALIASES = {
+    'tops': ['top', 'tops', 'shirt', 'blouse', 'sweater', 't-shirt'],
+    'bottoms': ['bottom', 'bottoms', 'pants', 'jeans', 'shorts', 'skirt'],
+    'dresses': ['dress', 'dresses', 'jumpsuit', 'romper'],
+    'shoes': ['shoes', 'shoe', 'footwear', 'sneakers', 'boots', 'heels'],
+    'accessories': ['accessory', 'accessories', 'bag', 'jewelry', 'hat', 'belt', 'scarf']
+}
+
+# Accessories tried (after "no accessory") to bring an outfit into budget
+DRESS_ACCESSORY_OPTIONS = 3
+SEPARATES_ACCESSORY_OPTIONS = 2
+
+# Slack for float rounding when pruning with precomputed price sums; every
+# emitted outfit is still checked exactly against the budget
+_PRUNE_EPSILON = 1e-9
+
+# Weights of the two ranking terms: similarity of each item to the user's
+# query/inspo vector, and pairwise compatibility between the outfit's items
+QUERY_SCORE_WEIGHT = 1.0
+COMPATIBILITY_SCORE_WEIGHT = 1.0
+
+
+_CATEGORY_GROUPS = {alias: group for group, aliases in CATEGORY_ALIASES.items() for alias in aliases}
+
+# Every (lowercased) product category an outfit can use; others are never picked
+OUTFIT_CATEGORIES = frozenset(_CATEGORY_GROUPS)
+
+
+def _categorize(products: List[Dict]) -> Dict[str, List[Dict]]:
+    """Split products into outfit categories in one pass, keeping catalog order"""
+    categories = {group: [] for group in CATEGORY_ALIASES}
+    for p in products:
+        group = _CATEGORY_GROUPS.get(p.get('category', '').lower())
+        if group is not None:
+            categories[group].append(p)
+    return categories
+
+
+def _prices(items: List[Dict]) -> np.ndarray:
+    return np.array([float(item.get('price', 0)) for item in items], dtype=np.float64)
+
+
+def _has_sum_in_range(sorted_sums: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """For each (low, high) pair, whether some value of sorted_sums lies in [low, high]"""
+    idx = np.searchsorted(sorted_sums, low - _PRUNE_EPSILON, side='left')
+    found = idx < len(sorted_sums)
+    idx = np.minimum(idx, len(sorted_sums) - 1)
+    return found & (sorted_sums[idx] <= high + _PRUNE_EPSILON)
+
+
+class _Completions:
+    """Shoe and accessory choices that can complete an outfit base.
+
+    Holds the shoe price vector, the accessory option prices (0 for "no
+    accessory") and every shoe + accessory sum sorted, so a base price can be
+    tested for any feasible completion with a binary search.
+    """
+
+    def __init__(self, shoes: List[Dict], accessories: List[Dict], accessory_options: int):
+        self.shoes = shoes if shoes else [None]
+        self.shoe_prices = _prices(shoes) if shoes else np.zeros(1)
+        self.accessories = [None] + accessories[:accessory_options]
+        self.accessory_prices = np.concatenate([[0.0], _prices(accessories[:accessory_options])])
+        self.sorted_sums = np.sort((self.shoe_prices[:, None] + self.accessory_prices[None, :]).ravel())
+        self.min_sum = self.sorted_sums[0]
+        self.max_sum = self.sorted_sums[-1]
+
+    def feasible(self, base_prices: np.ndarray, min_price: float, max_price: float) -> np.ndarray:
+        """Mask of base prices that at least one shoe/accessory choice brings into budget"""
+        return _has_sum_in_range(self.sorted_sums, min_price - base_prices, max_price - base_prices)
+
+    def complete(self, base_items: List[Dict], base_price: float, min_price: float, max_price: float,
+                 outfit_type: str) -> Iterator[Dict]:
+        """Yield one outfit per shoe (in catalog order) with the first accessory option that fits the budget"""
+        with_shoe = base_price + self.shoe_prices
+        totals = with_shoe[:, None] + self.accessory_prices[None, :]
+        fits = (totals >= min_price) & (totals <= max_price)
+        for shoe_idx in np.flatnonzero(fits.any(axis=1)):
+            accessory_idx = int(np.argmax(fits[shoe_idx]))
+            items = list(base_items)
+            if self.shoes[shoe_idx] is not None:
+                items.append(self.shoes[shoe_idx])
+            if self.accessories[accessory_idx] is not None:
+                items.append(self.accessories[accessory_idx])
+            yield {
+                'items': items,
+                'total_price': float(totals[shoe_idx, accessory_idx]),
+                'outfit_type': outfit_type
+            }
+
+
+def _iter_outfits(categories: Dict[str, List[Dict]], min_price: float, max_price: float) -> Iterator[Dict]:
+    """Enumerate budget-feasible outfits: dress outfits first, then separates.
+
+    Candidates whose cheapest and priciest completions both miss the budget
+    are pruned with binary searches over price-sorted arrays before any
+    combination is built, so a tight budget no longer walks every dead
+    dress x shoe x accessory or top x bottom x shoe x accessory combination.
+    """
+    dresses = categories['dresses']
+    tops = categories['tops']
+    bottoms = categories['bottoms']
+    shoes = categories['shoes']
+    accessories = categories['accessories']
+
+    # Dress + shoe (+ accessory)
+    if dresses:
+        completions = _Completions(shoes, accessories, DRESS_ACCESSORY_OPTIONS)
+        dress_prices = _prices(dresses)
+        for dress_idx in np.flatnonzero(completions.feasible(dress_prices, min_price, max_price)):
+            yield from completions.complete(
+                [dresses[dress_idx]], float(dress_prices[dress_idx]), min_price, max_price, 'dress'
+            )
+
+    # Top + bottom + shoe (+ accessory)
+    if tops and bottoms:
+        completions = _Completions(shoes, accessories, SEPARATES_ACCESSORY_OPTIONS)
+        top_prices = _prices(tops)
+        bottom_prices = _prices(bottoms)
+        bottom_order = np.argsort(bottom_prices, kind='stable')
+        sorted_bottom_prices = bottom_prices[bottom_order]
+
+        # Tops that can't reach the budget even with the cheapest/priciest bottom and completion
+        min_bottom, max_bottom = sorted_bottom_prices[0], sorted_bottom_prices[-1]
+        live_tops = (
+            (top_prices + min_bottom + completions.min_sum <= max_price + _PRUNE_EPSILON)
+            & (top_prices + max_bottom + completions.max_sum >= min_price - _PRUNE_EPSILON)
+        )
+
+        for top_idx in np.flatnonzero(live_tops):
+            top_price = top_prices[top_idx]
+            # Bottoms whose price window can still reach the budget, found by bisection
+            low = np.searchsorted(
+                sorted_bottom_prices, min_price - top_price - completions.max_sum - _PRUNE_EPSILON, side='left'
+            )
+            high = np.searchsorted(
+                sorted_bottom_prices, max_price - top_price - completions.min_sum + _PRUNE_EPSILON, side='right'
+            )
+            if low >= high:
+                continue
+            # Back to catalog order, then keep bottoms with a feasible completion
+            candidates = np.sort(bottom_order[low:high])
+            base_prices = top_price + bottom_prices[candidates]
+            feasible = completions.feasible(base_prices, min_price, max_price)
+            for bottom_idx, base_price in zip(candidates[feasible], base_prices[feasible]):
+                yield from completions.complete(
+                    [tops[top_idx], bottoms[bottom_idx]], float(base_price), min_price, max_price, 'separates'
+                )
+
+
+def _budget_bounds(budget: Optional[Dict]):
+    min_price = budget.get('min_price', 0) if budget else 0
+    max_price = budget.get('max_price', float('inf')) if budget else float('inf')
+    return min_price, max_price
+
+
+def _take(outfits: Iterator[Dict], num_outfits: int) -> List[Dict]:
+    result = []
+    if num_outfits <= 0:
+        return result
+    for outfit in outfits:
+        result.append(outfit)
+        if len(result) >= num_outfits:
+            break
+    return result
+
+
+def iter_outfits(
+    products: List[Dict],
+    user_budget: Optional[Dict] = None,
+    exclude: Optional[Container] = None
+) -> Iterator[Dict]:
+    """
+    Lazily enumerate outfit combinations in the same order as generate_outfits.
+
+    Args:
+        products: List of product dictionaries with category, price, etc.
+        user_budget: Dict with min_price and max_price for total outfit
+        exclude: Product ids to leave out, e.g. the user's seen-set
+
+    Returns:
+        Generator of outfit dictionaries; each outfit is built only when requested
+    """
+
+    if exclude:
+        products = [p for p in products if p.get('id') not in exclude]
+
+    min_price, max_price = _budget_bounds(user_budget)
+    return _iter_outfits(_categorize(products), min_price, max_price)
+
+
+def generate_outfits(
+    products: List[Dict],
+    user_budget: Optional[Dict] = None,
+    num_outfits: int = 10,
+    exclude: Optional[Container] = None
+) -> List[Dict]:
     """
     Generate outfit combinations from products.
-    
+
     Args:
         products: List of product dictionaries with category, price, etc.
         user_budget: Dict with min_price and max_price for total outfit
         num_outfits: Number of outfits to generate
-    
+        exclude: Product ids to leave out, e.g. the user's seen-set
+
     Returns:
         List of outfit dictionaries, each containing multiple products
     """
-    
-    # Categorize products
-    tops = [p for p in products if p.get('category', '').lower() in ['top', 'tops', 'shirt', 'blouse', 'sweater', 't-shirt']]
-    bottoms = [p for p in products if p.get('category', '').lower() in ['bottom', 'bottoms', 'pants', 'jeans', 'shorts', 'skirt']]
-    dresses = [p for p in products if p.get('category', '').lower() in ['dress', 'dresses', 'jumpsuit', 'romper']]
-    shoes = [p for p in products if p.get('category', '').lower() in ['shoes', 'shoe', 'footwear', 'sneakers', 'boots', 'heels']]
-    accessories = [p for p in products if p.get('category', '').lower() in ['accessory', 'accessories', 'bag', 'jewelry', 'hat', 'belt', 'scarf']]
-    
-    outfits = []
-    min_price = user_budget.get('min_price', 0) if user_budget else 0
-    max_price = user_budget.get('max_price', float('inf')) if user_budget else float('inf')
-    
-    # Generate dress-based outfits
-    for dress in dresses:
-        if len(outfits) >= num_outfits:
-            break
-            
-        for shoe in (shoes if shoes else [None]):
-            if len(outfits) >= num_outfits:
-                break
-                
-            outfit_items = [dress]
-            outfit_price = float(dress.get('price', 0))
-            
-            if shoe:
-                outfit_items.append(shoe)
-                outfit_price += float(shoe.get('price', 0))
-            
-            # Try with and without accessory
-            accessory_options = [None] + (accessories[:3] if accessories else [])
-            for accessory in accessory_options:
-                temp_items = outfit_items.copy()
-                temp_price = outfit_price
-                
-                if accessory:
-                    temp_items.append(accessory)
-                    temp_price += float(accessory.get('price', 0))
-                
-                # Check budget constraints
-                if min_price <= temp_price <= max_price:
-                    outfits.append({
-                        'items': temp_items,
-                        'total_price': temp_price,
-                        'outfit_type': 'dress'
-                    })
-                    break
-    
-    # Generate top + bottom outfits
-    for top in tops:
-        if len(outfits) >= num_outfits:
-            break
-            
-        for bottom in bottoms:
-            if len(outfits) >= num_outfits:
-                break
-                
-            base_price = float(top.get('price', 0)) + float(bottom.get('price', 0))
-            
-            for shoe in (shoes if shoes else [None]):
-                if len(outfits) >= num_outfits:
-                    break
-                    
-                outfit_items = [top, bottom]
-                outfit_price = base_price
-                
-                if shoe:
-                    outfit_items.append(shoe)
-                    outfit_price += float(shoe.get('price', 0))
-                
-                # Try with and without accessory
-                accessory_options_sep = [None] + (accessories[:2] if accessories else [])
-                for accessory in accessory_options_sep:
-                    temp_items = outfit_items.copy()
-                    temp_price = outfit_price
-                    
-                    if accessory:
-                        temp_items.append(accessory)
-                        temp_price += float(accessory.get('price', 0))
-                    
-                    # Check budget constraints
-                    if min_price <= temp_price <= max_price:
-                        outfits.append({
-                            'items': temp_items,
-                            'total_price': temp_price,
-                            'outfit_type': 'separates'
-                        })
-                        break
-    
-    return outfits[:num_outfits]
+
+    return _take(iter_outfits(products, user_budget=user_budget, exclude=exclude), num_outfits)
+
+
+def iter_outfits_with_advanced_filter(
+    products: List[Dict],
+    total_budget: Optional[Dict] = None,
+    category_budgets: Optional[Dict] = None,
+    exclude: Optional[Container] = None
+) -> Iterator[Dict]:
+    """
+    Lazily enumerate outfits with per-category price filtering.
+
+    Takes the same arguments as generate_outfits_with_advanced_filter, minus
+    num_outfits; the caller decides how many outfits to read.
+    """
+
+    if exclude:
+        products = [p for p in products if p.get('id') not in exclude]
+
+    def filter_by_price(items: List[Dict], category_key: str) -> List[Dict]:
+        """Filter items by category budget if specified."""
+        if not category_budgets or category_key not in category_budgets:
+            return items
+
+        budget = category_budgets[category_key]
+        return [
+            item for item in items
+            if budget.get('min', 0) <= float(item.get('price', 0)) <= budget.get('max', float('inf'))
+        ]
+
+    # Categorize and filter products by category budgets
+    categories = {
+        group: filter_by_price(items, group)
+        for group, items in _categorize(products).items()
+    }
+
+    min_price, max_price = _budget_bounds(total_budget)
+    return _iter_outfits(categories, min_price, max_price)
 
 
 def generate_outfits_with_advanced_filter(
-    products: List[Dict], 
+    products: List[Dict],
     total_budget: Optional[Dict] = None,
     category_budgets: Optional[Dict] = None,
-    num_outfits: int = 10
+    num_outfits: int = 10,
+    exclude: Optional[Container] = None
 ) -> List[Dict]:
     """
     Generate outfit combinations with advanced per-category price filtering.
-    
+
     Args:
         products: List of product dictionaries
         total_budget: Dict with min_price and max_price for total outfit
@@ -125,122 +276,285 @@ def generate_outfits_with_advanced_filter(
                 'accessories': {'min': 0, 'max': 30}
             }
         num_outfits: Number of outfits to generate
-    
+        exclude: Product ids to leave out, e.g. the user's seen-set
+
     Returns:
         List of outfit dictionaries
     """
-    
-    def filter_by_price(items: List[Dict], category_key: str) -> List[Dict]:
-        """Filter items by category budget if specified."""
-        if not category_budgets or category_key not in category_budgets:
-            return items
-        
-        budget = category_budgets[category_key]
-        return [
-            item for item in items 
-            if budget.get('min', 0) <= float(item.get('price', 0)) <= budget.get('max', float('inf'))
-        ]
-    
-    # Categorize and filter products by category budgets
-    tops = filter_by_price(
-        [p for p in products if p.get('category', '').lower() in ['top', 'tops', 'shirt', 'blouse', 'sweater', 't-shirt']],
-        'tops'
-    )
-    bottoms = filter_by_price(
-        [p for p in products if p.get('category', '').lower() in ['bottom', 'bottoms', 'pants', 'jeans', 'shorts', 'skirt']],
-        'bottoms'
-    )
-    dresses = filter_by_price(
-        [p for p in products if p.get('category', '').lower() in ['dress', 'dresses', 'jumpsuit', 'romper']],
-        'dresses'
-    )
-    shoes = filter_by_price(
-        [p for p in products if p.get('category', '').lower() in ['shoes', 'shoe', 'footwear', 'sneakers', 'boots', 'heels']],
-        'shoes'
-    )
-    accessories = filter_by_price(
-        [p for p in products if p.get('category', '').lower() in ['accessory', 'accessories', 'bag', 'jewelry', 'hat', 'belt', 'scarf']],
-        'accessories'
+
+    return _take(
+        iter_outfits_with_advanced_filter(products, total_budget, category_budgets, exclude=exclude),
+        num_outfits
     )
-    
-    outfits = []
-    min_price = total_budget.get('min_price', 0) if total_budget else 0
-    max_price = total_budget.get('max_price', float('inf')) if total_budget else float('inf')
-    
-    # Generate dress-based outfits
-    for dress in dresses:
-        if len(outfits) >= num_outfits:
-            break
-            
-        for shoe in (shoes if shoes else [None]):
-            if len(outfits) >= num_outfits:
-                break
-                
-            outfit_items = [dress]
-            outfit_price = float(dress.get('price', 0))
-            
-            if shoe:
-                outfit_items.append(shoe)
-                outfit_price += float(shoe.get('price', 0))
-            
-            # Try with and without accessory
-            accessory_options = [None] + (accessories[:3] if accessories else [])
-            for accessory in accessory_options:
-                temp_items = outfit_items.copy()
-                temp_price = outfit_price
-                
-                if accessory:
-                    temp_items.append(accessory)
-                    temp_price += float(accessory.get('price', 0))
-                
-                # Check budget constraints
-                if min_price <= temp_price <= max_price:
-                    outfits.append({
-                        'items': temp_items,
-                        'total_price': temp_price,
-                        'outfit_type': 'dress'
-                    })
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class _CategoryBlock:
+    """Items of one category with their unit embeddings, prices and query similarity"""
+
+    def __init__(self, items: List[Dict], vectors: np.ndarray, query: Optional[np.ndarray]):
+        self.items = items
+        self.vectors = vectors
+        self.prices = _prices(items)
+        self.query_scores = vectors @ query if query is not None else np.zeros(len(items), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class OutfitRanker:
+    """Scores outfits by embedding compatibility and keeps only the best ones.
+
+    Items are grouped into per-category blocks of unit embeddings, and every
+    pairwise compatibility needed (top x bottom, top x shoe, bottom x shoe,
+    dress x shoe) is one matrix product. Candidate outfits are scored a whole
+    block at a time, and a heap bounded to num_outfits keeps the best, so
+    cost stays linear in the number of candidates and memory stays constant.
+
+    An outfit's score is QUERY_SCORE_WEIGHT times the mean similarity of its
+    items to the query plus COMPATIBILITY_SCORE_WEIGHT times the mean
+    similarity between its item pairs. Accessories are added, as in
+    generate_outfits, only when an outfit needs one to reach the minimum
+    budget; the most compatible affordable accessory is chosen.
+    """
+
+    def __init__(self, products: List[Dict], embeddings: Optional[np.ndarray] = None,
+                 query_embedding=None, user_budget: Optional[Dict] = None):
+        if embeddings is None:
+            embeddings = np.zeros((len(products), EMBEDDING_DIM), dtype=np.float32)
+            for i, product in enumerate(products):
+                vector = row_embedding(product)
+                if vector is not None:
+                    embeddings[i] = vector
+        embeddings = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+
+        query = None
+        if query_embedding is not None:
+            query = _unit_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
+        self.min_price, self.max_price = _budget_bounds(user_budget)
+
+        positions = {id(product): i for i, product in enumerate(products)}
+        self.blocks = {}
+        for group, items in _categorize(products).items():
+            rows = [positions[id(item)] for item in items]
+            vectors = embeddings[rows] if rows else np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self.blocks[group] = _CategoryBlock(items, vectors, query)
+
+        accessories = self.blocks['accessories']
+        self._accessory_order = np.argsort(accessories.prices, kind='stable')
+        self._sorted_accessory_prices = accessories.prices[self._accessory_order]
+
+    def _affordable(self, prices: np.ndarray) -> np.ndarray:
+        """Mask of outfit prices within budget on their own or with one accessory"""
+        fits = (prices >= self.min_price) & (prices <= self.max_price)
+        if len(self._sorted_accessory_prices):
+            short = prices < self.min_price
+            fits |= short & _has_sum_in_range(
+                self._sorted_accessory_prices, self.min_price - prices, self.max_price - prices
+            )
+        return fits
+
+    def _candidates(self) -> Iterator:
+        """Yield (scores, prices, make_indices) for blocks of candidate outfits"""
+        blocks = self.blocks
+        shoes = blocks['shoes']
+        query_weight, compat_weight = QUERY_SCORE_WEIGHT, COMPATIBILITY_SCORE_WEIGHT
+
+        if len(blocks['dresses']):
+            dresses = blocks['dresses']
+            if len(shoes):
+                scores = (query_weight * (dresses.query_scores[:, None] + shoes.query_scores[None, :]) / 2
+                          + compat_weight * (dresses.vectors @ shoes.vectors.T))
+                prices = dresses.prices[:, None] + shoes.prices[None, :]
+                yield 'dress', scores, prices, lambda i, j: (i, j)
+            else:
+                yield ('dress', query_weight * dresses.query_scores[:, None], dresses.prices[:, None],
+                       lambda i, j: (i, None))
+
+        tops, bottoms = blocks['tops'], blocks['bottoms']
+        if len(tops) and len(bottoms):
+            top_bottom = tops.vectors @ bottoms.vectors.T
+            if len(shoes):
+                top_shoe = tops.vectors @ shoes.vectors.T
+                bottom_shoe = bottoms.vectors @ shoes.vectors.T
+                base_query = bottoms.query_scores[:, None] + shoes.query_scores[None, :]
+                base_prices = bottoms.prices[:, None] + shoes.prices[None, :]
+                for t in range(len(tops)):
+                    scores = (query_weight * (tops.query_scores[t] + base_query) / 3
+                              + compat_weight * (top_bottom[t][:, None] + top_shoe[t][None, :] + bottom_shoe) / 3)
+                    yield ('separates', scores, tops.prices[t] + base_prices,
+                           lambda i, j, t=t: (t, i, j))
+            else:
+                scores = (query_weight * (tops.query_scores[:, None] + bottoms.query_scores[None, :]) / 2
+                          + compat_weight * top_bottom)
+                prices = tops.prices[:, None] + bottoms.prices[None, :]
+                yield 'separates', scores, prices, lambda i, j: (i, j, None)
+
+    def _top_entries(self, num_outfits: int, below: Optional[float] = None, skip=frozenset()) -> List:
+        """Best (score, -sequence, outfit_type, indices) entries, best first.
+
+        With below set, only outfits scoring at most below are considered,
+        and those scoring exactly below whose (outfit_type, indices) key is in
+        skip are left out. This is how iter_outfits resumes after a page.
+        """
+        if num_outfits <= 0:
+            return []
+
+        heap = []
+        sequence = 0
+        for outfit_type, scores, prices, make_indices in self._candidates():
+            flat_scores = np.where(self._affordable(prices), scores, -np.inf).ravel()
+            if below is not None:
+                flat_scores[flat_scores > below] = -np.inf
+            k = min(num_outfits + len(skip), flat_scores.size)
+            if k < flat_scores.size:
+                # Keep the earliest of any candidates tied at the cut-off, so
+                # the selection (and paging through it) is deterministic
+                kth = -np.partition(-flat_scores, k - 1)[k - 1]
+                above = np.flatnonzero(flat_scores > kth)
+                best = np.concatenate([above, np.flatnonzero(flat_scores == kth)[:k - len(above)]])
+            else:
+                best = np.arange(flat_scores.size)
+            # Visit in score order, ties in enumeration order, so results are deterministic
+            best = best[np.lexsort((best, -flat_scores[best]))]
+            width = scores.shape[1]
+            for flat_index in best:
+                score = flat_scores[flat_index]
+                if score == -np.inf:
                     break
-    
-    # Generate top + bottom outfits
-    for top in tops:
-        if len(outfits) >= num_outfits:
-            break
-            
-        for bottom in bottoms:
-            if len(outfits) >= num_outfits:
-                break
-                
-            base_price = float(top.get('price', 0)) + float(bottom.get('price', 0))
-            
-            for shoe in (shoes if shoes else [None]):
-                if len(outfits) >= num_outfits:
+                indices = make_indices(int(flat_index // width), int(flat_index % width))
+                if skip and score == below and (outfit_type, indices) in skip:
+                    continue
+                # Earlier candidates win ties: larger -sequence ranks higher in the min-heap
+                entry = (float(score), -sequence, outfit_type, indices)
+                sequence += 1
+                if len(heap) < num_outfits:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                else:
                     break
-                    
-                outfit_items = [top, bottom]
-                outfit_price = base_price
-                
-                if shoe:
-                    outfit_items.append(shoe)
-                    outfit_price += float(shoe.get('price', 0))
-                
-                # Try with and without accessory
-                accessory_options_sep = [None] + (accessories[:2] if accessories else [])
-                for accessory in accessory_options_sep:
-                    temp_items = outfit_items.copy()
-                    temp_price = outfit_price
-                    
-                    if accessory:
-                        temp_items.append(accessory)
-                        temp_price += float(accessory.get('price', 0))
-                    
-                    # Check budget constraints
-                    if min_price <= temp_price <= max_price:
-                        outfits.append({
-                            'items': temp_items,
-                            'total_price': temp_price,
-                            'outfit_type': 'separates'
-                        })
-                        break
-    
-    return outfits[:num_outfits]
+
+        return sorted(heap, reverse=True)
+
+    def top_outfits(self, num_outfits: int = 10) -> List[Dict]:
+        """Return the num_outfits best-scoring affordable outfits, best first"""
+        return [self._build(outfit_type, indices, score)
+                for score, _, outfit_type, indices in self._top_entries(num_outfits)]
+
+    def iter_outfits(self, page_size: int = 10) -> Iterator[Dict]:
+        """Lazily yield all affordable outfits, best first, computing one page at a time.
+
+        Each page rescans the candidates for the best outfits ranked below the
+        previous page, so the cost of a page doesn't grow with how deep the
+        caller has already read.
+        """
+        below, skip = None, set()
+        while True:
+            entries = self._top_entries(page_size, below=below, skip=skip)
+            if not entries:
+                return
+            for score, _, outfit_type, indices in entries:
+                yield self._build(outfit_type, indices, score)
+
+            last_score = entries[-1][0]
+            if last_score != below:
+                skip = set()
+            below = last_score
+            skip.update((outfit_type, indices) for score, _, outfit_type, indices in entries if score == last_score)
+
+    def _build(self, outfit_type: str, indices, score: float) -> Dict:
+        blocks = self.blocks
+        if outfit_type == 'dress':
+            parts = [(blocks['dresses'], indices[0]), (blocks['shoes'], indices[1])]
+        else:
+            parts = [(blocks['tops'], indices[0]), (blocks['bottoms'], indices[1]), (blocks['shoes'], indices[2])]
+        parts = [(block, int(i)) for block, i in parts if i is not None]
+
+        items = [block.items[i] for block, i in parts]
+        total_price = 0.0
+        for block, i in parts:
+            total_price += float(block.prices[i])
+
+        if total_price < self.min_price:
+            accessory = self._best_accessory(parts, total_price)
+            if accessory is not None:
+                items.append(self.blocks['accessories'].items[accessory])
+                total_price += float(self.blocks['accessories'].prices[accessory])
+
+        return {
+            'items': items,
+            'total_price': total_price,
+            'outfit_type': outfit_type,
+            'score': score
+        }
+
+    def _best_accessory(self, parts, total_price: float) -> Optional[int]:
+        """Most compatible accessory that brings total_price into budget"""
+        low = np.searchsorted(self._sorted_accessory_prices, self.min_price - total_price - _PRUNE_EPSILON, side='left')
+        high = np.searchsorted(self._sorted_accessory_prices, self.max_price - total_price + _PRUNE_EPSILON, side='right')
+        candidates = self._accessory_order[low:high]
+        if len(candidates) == 0:
+            return None
+        accessories = self.blocks['accessories']
+        outfit_vector = sum(block.vectors[i] for block, i in parts)
+        compatibility = accessories.vectors[candidates] @ outfit_vector
+        return int(candidates[int(np.argmax(compatibility))])
+
+
+def generate_ranked_outfits(
+    products: List[Dict],
+    query_embedding=None,
+    user_budget: Optional[Dict] = None,
+    num_outfits: int = 10,
+    exclude: Optional[Container] = None,
+    embeddings: Optional[np.ndarray] = None
+) -> List[Dict]:
+    """
+    Generate the best-scoring outfits instead of the first ones found.
+
+    Args:
+        products: List of product dictionaries with category, price, etc.
+        query_embedding: User's query or inspo centroid embedding, if any
+        user_budget: Dict with min_price and max_price for total outfit
+        num_outfits: Number of outfits to generate
+        exclude: Product ids to leave out, e.g. the user's seen-set
+        embeddings: Optional (len(products), 512) array aligned with products;
+            otherwise each product's 'embedding' field is used
+
+    Returns:
+        List of outfit dictionaries with a 'score', best first
+    """
+    return _ranker(products, query_embedding, user_budget, exclude, embeddings).top_outfits(num_outfits)
+
+
+def iter_ranked_outfits(
+    products: List[Dict],
+    query_embedding=None,
+    user_budget: Optional[Dict] = None,
+    exclude: Optional[Container] = None,
+    embeddings: Optional[np.ndarray] = None,
+    page_size: int = 10
+) -> Iterator[Dict]:
+    """
+    Lazily enumerate outfits best first, in the order generate_ranked_outfits uses.
+
+    Takes the same arguments as generate_ranked_outfits; page_size is how
+    many outfits are scored per pass over the candidates.
+    """
+    return _ranker(products, query_embedding, user_budget, exclude, embeddings).iter_outfits(page_size)
+
+
+def _ranker(products, query_embedding, user_budget, exclude, embeddings) -> OutfitRanker:
+    if exclude:
+        keep = [i for i, p in enumerate(products) if p.get('id') not in exclude]
+        products = [products[i] for i in keep]
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings)[keep]
+
+    return OutfitRanker(products, embeddings=embeddings, query_embedding=query_embedding, user_budget=user_budget)
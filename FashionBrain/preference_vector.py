@@ -0,0 +1,98 @@
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from embedding_index import EMBEDDING_DIM, get_catalog_snapshot, parse_embedding, row_embedding
+
+# Rocchio step sizes: how far a like pulls the preference vector toward the
+# product, and how far a skip pushes it away
+PREFERENCE_LIKE_RATE = float(os.getenv("PREFERENCE_LIKE_RATE", "0.1"))
+PREFERENCE_SKIP_RATE = float(os.getenv("PREFERENCE_SKIP_RATE", "0.05"))
+
+# Share of the feed query taken by the preference vector; the rest is the inspo centroid
+PREFERENCE_QUERY_WEIGHT = float(os.getenv("PREFERENCE_QUERY_WEIGHT", "0.3"))
+
+# Compare-and-set attempts before an update gives up (concurrent actions by one user)
+PREFERENCE_UPDATE_RETRIES = 5
+
+
+def _unit(vector: np.ndarray) -> Optional[np.ndarray]:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+def rocchio_update(preference: Optional[np.ndarray], embeddings: Iterable, action_type: str) -> Optional[np.ndarray]:
+    """Move the preference vector toward liked products or away from skipped ones.
+
+    Each product costs O(512): a like blends its unit embedding in as an
+    exponential moving average, a skip subtracts a fraction of it. Other
+    actions leave the vector unchanged.
+    """
+    if action_type not in ("like", "skip"):
+        return preference
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32) if preference is None else np.array(preference, dtype=np.float32)
+    for embedding in embeddings:
+        direction = _unit(np.asarray(embedding, dtype=np.float32))
+        if direction is None:
+            continue
+        if action_type == "like":
+            vector = (1 - PREFERENCE_LIKE_RATE) * vector + PREFERENCE_LIKE_RATE * direction
+        else:
+            vector = vector - PREFERENCE_SKIP_RATE * direction
+    return vector if np.any(vector) else None
+
+
+def combine_query(inspo_centroid: Optional[np.ndarray], preference: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """Feed query vector from the inspo centroid and the learned preference, either of which may be missing"""
+    inspo = _unit(np.asarray(inspo_centroid, dtype=np.float32)) if inspo_centroid is not None else None
+    learned = _unit(np.asarray(preference, dtype=np.float32)) if preference is not None else None
+    if inspo is None:
+        return learned
+    if learned is None:
+        return inspo
+    return ((1 - PREFERENCE_QUERY_WEIGHT) * inspo + PREFERENCE_QUERY_WEIGHT * learned).astype(np.float32)
+
+
+def preference_from_row(user: Optional[Dict]) -> Optional[np.ndarray]:
+    return parse_embedding((user or {}).get("preference_vector"))
+
+
+def _product_embeddings(supabase, product_ids: List[str]) -> List[np.ndarray]:
+    """Embeddings from the local catalog snapshot, falling back to one products query for the rest"""
+    embeddings = get_catalog_snapshot().get_embeddings(product_ids)
+    missing = [pid for pid, row in zip(product_ids, embeddings) if not row.any()]
+    if missing:
+        response = supabase.table("products").select("id,embedding_b64").in_("id", missing).execute()
+        fetched = {str(p["id"]): row_embedding(p) for p in response.data or []}
+        for i, pid in enumerate(product_ids):
+            if fetched.get(str(pid)) is not None:
+                embeddings[i] = fetched[str(pid)]
+    return [row for row in embeddings if row.any()]
+
+
+def update_preference(supabase, user_id: str, product_ids: List[str], action_type: str) -> Optional[np.ndarray]:
+    """Apply one like or skip to the preference vector stored on the user"""
+    if action_type not in ("like", "skip"):
+        return None
+    embeddings = _product_embeddings(supabase, product_ids)
+    if not embeddings:
+        return None
+
+    for _ in range(PREFERENCE_UPDATE_RETRIES):
+        response = supabase.table("users").select("preference_vector,preference_version").eq("id", user_id).execute()
+        if not response.data:
+            return None
+        user = response.data[0]
+        version = user.get("preference_version") or 0
+
+        preference = rocchio_update(preference_from_row(user), embeddings, action_type)
+        written = supabase.table("users").update({
+            "preference_vector": preference.tolist() if preference is not None else None,
+            "preference_version": version + 1
+        }).eq("id", user_id).eq("preference_version", version).execute()
+        if written.data:
+            return preference
+
+    print(f"Warning: Could not update preference vector for user {user_id}: too many concurrent updates")
+    return None
@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Product metadata cached in memory; embeddings are never cached here
+PRODUCT_COLUMNS = "id,name,brand,price,description,style,material,category,size,color,image_url,affiliate_link,created_at"
+
+# How long a cached product or listing is served before it is read again
+PRODUCT_CACHE_TTL_SECONDS = float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "300"))
+
+# Products kept in memory (least recently used are evicted)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "50000"))
+
+# Product ids per products query when filling misses
+PRODUCT_FETCH_CHUNK_SIZE = 200
+
+# Listing queries remembered (least recently stored are dropped first)
+MAX_LISTINGS = 256
+
+
+def _metadata(product: Dict) -> Dict:
+    return {key: value for key, value in product.items() if key not in ("embedding", "embedding_b64")}
+
+
+class ProductCache:
+    """Shared cache of product metadata keyed by product id.
+
+    get_many() serves what it can from memory and fetches the rest with
+    one in_() query per PRODUCT_FETCH_CHUNK_SIZE ids. Listings (for example
+    "the first 100 products") are cached with the rows their query
+    returned, apart from the id entries: listing queries select their own
+    columns, and a /list-products cursor needs created_at from its last
+    row. Entries expire after ttl_seconds, which bounds
+    staleness across worker processes; within a process /add-product and
+    /delete-product update the cache directly.
+    """
+
+    def __init__(self, max_size: int = PRODUCT_CACHE_SIZE, ttl_seconds: float = PRODUCT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._listings: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.listing_hits = 0
+        self.listing_misses = 0
+
+    def _lookup(self, product_id: str, now: float) -> Optional[Dict]:
+        """Cached product if fresh; called with _lock held"""
+        entry = self._entries.get(product_id)
+        if entry is None:
+            return None
+        product, expires_at = entry
+        if now >= expires_at:
+            del self._entries[product_id]
+            return None
+        self._entries.move_to_end(product_id)
+        return product
+
+    def put_many(self, products: Iterable[Dict]):
+        """Store full product rows (every PRODUCT_COLUMNS column); an entry replaces what was cached for its id"""
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for product in products:
+                if product.get("id") is None:
+                    continue
+                product_id = str(product["id"])
+                self._entries[product_id] = (_metadata(product), expires_at)
+                self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, supabase, product_ids: Iterable, chunk_size: int = PRODUCT_FETCH_CHUNK_SIZE) -> Dict[str, Dict]:
+        """Products by id (missing ids are left out), fetching only what isn't cached"""
+        unique_ids = list(dict.fromkeys(str(product_id) for product_id in product_ids))
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for product_id in unique_ids:
+                product = self._lookup(product_id, now)
+                if product is None:
+                    missing.append(product_id)
+                else:
+                    found[product_id] = product
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            response = supabase.table("products").select(PRODUCT_COLUMNS).in_("id", chunk).execute()
+            fetched = response.data or []
+            self.put_many(fetched)
+            for product in fetched:
+                found[str(product["id"])] = _metadata(product)
+        return found
+
+    def get_listing(self, key: str, fetch: Callable[[], List[Dict]]) -> List[Dict]:
+        """Products of a listing query, exactly as fetch() returned them; fetch() runs on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None and now < listing[1]:
+                self._listings.move_to_end(key)
+                self.listing_hits += 1
+                return listing[0]
+            self.listing_misses += 1
+
+        products = [_metadata(product) for product in fetch()]
+        with self._lock:
+            self._listings[key] = (products, now + self.ttl_seconds)
+            self._listings.move_to_end(key)
+            while len(self._listings) > MAX_LISTINGS:
+                self._listings.popitem(last=False)
+        return products
+
+    def invalidate(self, product_id=None):
+        """Drop one product (or all of them) and every cached listing"""
+        with self._lock:
+            if product_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(product_id), None)
+            self._listings.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            listing_lookups = self.listing_hits + self.listing_misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "listings": len(self._listings),
+                "listing_hits": self.listing_hits,
+                "listing_misses": self.listing_misses,
+                "listing_hit_ratio": round(self.listing_hits / listing_lookups, 4) if listing_lookups else 0.0
+            }
+
+
+product_cache = ProductCache()
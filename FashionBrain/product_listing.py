@@ -0,0 +1,68 @@
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cursors import InvalidCursorError, encode_payload, decode_payload
+
+# Columns returned by /list-products; embeddings are never listed
+LIST_PRODUCTS_COLUMNS = "id,name,price,description,category,brand,size,color,image_url,affiliate_link,created_at"
+
+# Largest page a client may ask for, and the page size used when streaming
+LIST_PRODUCTS_MAX_LIMIT = 1000
+STREAM_PAGE_SIZE = 1000
+
+
+def encode_keyset(product: Dict) -> str:
+    """Cursor pointing just past product in (created_at, id) order"""
+    return encode_payload({"c": product.get("created_at"), "i": str(product.get("id"))})
+
+
+def decode_keyset(cursor: str) -> Tuple[str, str]:
+    payload = decode_payload(cursor)
+    created_at, product_id = payload.get("c"), payload.get("i")
+    if not isinstance(created_at, str) or not isinstance(product_id, str):
+        raise InvalidCursorError("Invalid product cursor")
+    return created_at, product_id
+
+
+def _quote(value: str) -> str:
+    # PostgREST logic trees need values containing reserved characters (":", ",") double-quoted
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def fetch_page(supabase, filters: Dict, after: Optional[Tuple[str, str]], limit: int) -> List[Dict]:
+    """One page of products, newest first, with the filters evaluated by the database.
+
+    after is the (created_at, id) of the last row of the previous page; the
+    page continues strictly below it, so pages cost the same however deep
+    the caller has paged.
+    """
+    query = supabase.table("products").select(LIST_PRODUCTS_COLUMNS)
+    if filters.get("category"):
+        query = query.eq("category", filters["category"])
+    if filters.get("brand"):
+        query = query.eq("brand", filters["brand"])
+    if filters.get("min_price") is not None:
+        query = query.gte("price", filters["min_price"])
+    if filters.get("max_price") is not None:
+        query = query.lte("price", filters["max_price"])
+    if after is not None:
+        created_at, product_id = _quote(after[0]), _quote(after[1])
+        query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{product_id})")
+    response = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+    return response.data or []
+
+
+def iter_pages(supabase, filters: Dict, after: Optional[Tuple[str, str]] = None,
+               page_size: int = STREAM_PAGE_SIZE) -> Iterator[List[Dict]]:
+    """Pages of products until the catalog (after the cursor) is exhausted"""
+    while True:
+        page = fetch_page(supabase, filters, after, page_size)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = (page[-1]["created_at"], str(page[-1]["id"]))
+
+
+def ndjson_lines(products: List[Dict]) -> str:
+    return "".join(json.dumps(product, default=str) + "\n" for product in products)
@@ -0,0 +1,115 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# Compressed copy of the embeddings scanned by local search: "float32" (none),
+# "float16" (half the memory) or "int8" (a quarter). Shortlists are re-ranked
+# with the full-precision vectors, so only the shortlist rows are read at 2 KB each.
+# float16 scans several times slower than float32 (see Float16Codec); int8 does not
+ANN_ENCODING = os.getenv("ANN_ENCODING", "float32").lower()
+
+# With an encoding set, the full-precision matrix is kept in a file-backed
+# memory map in this directory (default: the system temp dir) rather than in
+# process memory, so only the codes and the re-ranked rows stay resident. Put
+# it on disk, not tmpfs
+ANN_SPILL_DIR = os.getenv("ANN_SPILL_DIR", "")
+
+# Candidates re-ranked exactly per requested result when an encoding is used
+ANN_RERANK_FACTOR = int(os.getenv("ANN_RERANK_FACTOR", "4"))
+
+# Rows decoded at a time while scoring, so the float32 temporary stays cache sized
+SCORE_CHUNK_ROWS = 4096
+
+# Rows encoded at a time when the whole matrix is (re-)encoded
+ENCODE_CHUNK_ROWS = 65536
+
+# Rows sampled to fit the int8 ranges
+TRAIN_SAMPLE_SIZE = 65536
+
+
+class Float16Codec:
+    """Half-precision copy of each vector; needs no training.
+
+    Scoring is slower than a float32 scan, not faster: numpy has no
+    half-precision BLAS, so each chunk is cast to float32 first, and that
+    cast is a scalar loop costing about ten times the matrix product
+    itself. Pick float16 only when int8 recall is not good enough.
+    """
+
+    name = "float16"
+    dtype = np.float16
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def params(self) -> Dict[str, np.ndarray]:
+        """Trained parameters, persisted beside the codes"""
+        return {}
+
+    def set_params(self, params: Dict[str, np.ndarray]):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).astype(np.float16)
+
+    def _dot_chunk(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) @ queries.T
+
+    def dot(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Approximate (len(codes), len(queries)) inner products with the encoded vectors"""
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            stop = start + SCORE_CHUNK_ROWS
+            scores[start:stop] = self._dot_chunk(codes[start:stop], queries)
+        return scores
+
+
+class Int8Codec(Float16Codec):
+    """Scalar quantization: each dimension's [low, high] range mapped onto 256 levels.
+
+    x ~= low + scale * (code + 128), so x.q = code.(scale * q) + (low + 128 * scale).q;
+    queries are rescaled once and the per-query offset added after the product.
+    Values outside the trained range (products added later) are clipped.
+    """
+
+    name = "int8"
+    dtype = np.int8
+
+    def __init__(self):
+        self.low: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def train(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        scale = (high - low) / 255.0
+        scale[scale == 0] = 1.0
+        self.low, self.scale = low, scale.astype(np.float32)
+
+    def params(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+    def set_params(self, params: Dict[str, np.ndarray]):
+        self.low = np.asarray(params["low"], dtype=np.float32)
+        self.scale = np.asarray(params["scale"], dtype=np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale) - 128
+        return np.clip(levels, -128, 127).astype(np.int8)
+
+    def _dot_chunk(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        offset = queries @ (self.low + 128 * self.scale)
+        return codes.astype(np.float32) @ (queries * self.scale).T + offset[None, :]
+
+
+CODECS = {"float16": Float16Codec, "int8": Int8Codec}
+
+
+def make_codec(encoding: str = ANN_ENCODING):
+    """Codec for an encoding name, or None for plain float32"""
+    if encoding in ("", "float32"):
+        return None
+    if encoding not in CODECS:
+        raise ValueError(f"Unknown ANN_ENCODING {encoding!r}; expected one of float32, {', '.join(CODECS)}")
+    return CODECS[encoding]()
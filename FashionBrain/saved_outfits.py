@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from product_cache import product_cache, PRODUCT_COLUMNS
+
+# Users whose saved outfits stay cached (least recently used are evicted)
+SAVED_CACHE_USERS = int(os.getenv("SAVED_CACHE_USERS", "5000"))
+
+# Likes and deletes on other workers don't reach this process's cache, so
+# entries are also dropped after this long
+SAVED_CACHE_TTL_SECONDS = float(os.getenv("SAVED_CACHE_TTL_SECONDS", "60"))
+
+
+def load_saved_outfits(supabase, user_id: str) -> List[Dict]:
+    """The user's liked outfits with their products, in one round trip however many there are.
+
+    The products come embedded in the user_actions rows through the
+    product_id foreign key, so no second query is needed.
+    """
+    saved_actions = supabase.table("user_actions").select(f"product_id,outfit_id,products({PRODUCT_COLUMNS})").eq(
+        "user_id", user_id
+    ).eq("action", "like").execute()
+
+    # Group by outfit_id, falling back to the product itself for single-item likes
+    outfits_dict: "OrderedDict[str, List[str]]" = OrderedDict()
+    products: Dict[str, Dict] = {}
+    for action in saved_actions.data or []:
+        outfit_id = action.get("outfit_id") or action["product_id"]
+        outfits_dict.setdefault(outfit_id, []).append(str(action["product_id"]))
+        # Null when the product has since been deleted
+        if action.get("products"):
+            products[str(action["product_id"])] = action["products"]
+    product_cache.put_many(products.values())
+
+    saved_outfits = []
+    for outfit_id, product_ids in outfits_dict.items():
+        items = [products[pid] for pid in dict.fromkeys(product_ids) if pid in products]
+        saved_outfits.append({
+            "outfit_id": outfit_id,
+            "items": items,
+            "total_price": sum(float(p.get('price') or 0) for p in items),
+            "item_count": len(items)
+        })
+    return saved_outfits
+
+
+class SavedOutfitsCache:
+    """Per-user cache of /saved results; a like or a deleted product invalidates it, and entries expire after ttl_seconds"""
+
+    def __init__(self, max_users: int = SAVED_CACHE_USERS, ttl_seconds: float = SAVED_CACHE_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[List[Dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id: str, saved: List[Dict]):
+        with self._lock:
+            self._entries[user_id] = (saved, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+saved_outfits_cache = SavedOutfitsCache()
@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Users whose seen-sets are kept in memory (least recently used are evicted)
+SEEN_CACHE_USERS = int(os.getenv("SEEN_CACHE_USERS", "10000"))
+
+# How often a cached seen-set picks up actions recorded since its last read
+# (by other workers); actions on this worker are added straight away
+SEEN_CACHE_REFRESH_SECONDS = float(os.getenv("SEEN_CACHE_REFRESH_SECONDS", "60"))
+
+# Actions that hide a product from the user's feed
+SEEN_ACTIONS = ("like", "skip")
+
+PAGE_SIZE = 1000
+
+
+class ProductOrdinals:
+    """Assigns each product id a small dense integer so seen-sets can be bitmaps"""
+
+    def __init__(self):
+        self._ordinals: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def get(self, product_id) -> int:
+        product_id = str(product_id)
+        ordinal = self._ordinals.get(product_id)
+        if ordinal is None:
+            with self._lock:
+                ordinal = self._ordinals.get(product_id)
+                if ordinal is None:
+                    ordinal = self._ordinals[product_id] = len(self._ids)
+                    self._ids.append(product_id)
+        return ordinal
+
+    def product_id(self, ordinal: int) -> str:
+        return self._ids[ordinal]
+
+    def lookup(self, product_id) -> int:
+        """Ordinal of a product, or -1 if it has never been assigned one"""
+        return self._ordinals.get(str(product_id), -1)
+
+
+product_ordinals = ProductOrdinals()
+
+
+class SeenSet:
+    """Bitmap over product ordinals: one bit per product, O(1) add and membership
+
+    add() is called from the event loop (/action) and the IO pool (loads),
+    so writes take the lock; membership tests read without it.
+    """
+
+    def __init__(self, ordinals: ProductOrdinals = product_ordinals):
+        self._ordinals = ordinals
+        self._bits = bytearray()
+        self._lock = threading.Lock()
+        self.count = 0
+        # created_at of the newest action read from user_actions, and when
+        # user_actions was last read (monotonic); None until the first load
+        self.watermark: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def add(self, product_id):
+        ordinal = self._ordinals.get(product_id)
+        byte, mask = ordinal >> 3, 1 << (ordinal & 7)
+        with self._lock:
+            if byte >= len(self._bits):
+                self._bits.extend(bytes(byte + 1 - len(self._bits)))
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                self.count += 1
+
+    def __contains__(self, product_id) -> bool:
+        ordinal = self._ordinals.lookup(product_id)
+        if ordinal < 0:
+            return False
+        byte = ordinal >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (ordinal & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        """Product ids in the set, in ordinal order"""
+        for byte, value in enumerate(self._bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield self._ordinals.product_id((byte << 3) | bit)
+
+
+class SeenProductsStore:
+    """Per-user seen-sets, built from user_actions and then updated by /action
+
+    Every refresh_seconds a set re-reads only the actions created since its
+    newest one, so likes and skips made through other workers show up.
+    """
+
+    def __init__(self, max_users: int = SEEN_CACHE_USERS, refresh_seconds: float = SEEN_CACHE_REFRESH_SECONDS):
+        self.max_users = max_users
+        self.refresh_seconds = refresh_seconds
+        self._sets: "OrderedDict[str, SeenSet]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, user_id: str) -> SeenSet:
+        with self._lock:
+            seen = self._sets.get(user_id)
+            if seen is None:
+                seen = SeenSet()
+                self._sets[user_id] = seen
+                while len(self._sets) > self.max_users:
+                    self._sets.popitem(last=False)
+            else:
+                self._sets.move_to_end(user_id)
+            return seen
+
+    def _due(self, seen: SeenSet) -> bool:
+        return seen.loaded_at is None or time.monotonic() - seen.loaded_at >= self.refresh_seconds
+
+    def get(self, user_id: str, supabase) -> SeenSet:
+        """Return the user's seen-set, loading it from user_actions on first use and topping it up when due"""
+        seen = self._entry(user_id)
+        if self._due(seen):
+            with seen.load_lock:
+                if self._due(seen):
+                    self._load(seen, user_id, supabase)
+        return seen
+
+    def _load(self, seen: SeenSet, user_id: str, supabase):
+        """Add the user's actions created at or after seen.watermark (all of them on the first load)"""
+        started = time.monotonic()
+        watermark = seen.watermark
+        start = 0
+        while True:
+            query = supabase.table("user_actions").select("product_id,created_at").eq(
+                "user_id", user_id
+            ).in_("action", list(SEEN_ACTIONS))
+            if seen.watermark is not None:
+                # gte, not gt: actions sharing the newest timestamp may have
+                # landed after the last read; adding one twice is harmless
+                query = query.gte("created_at", seen.watermark)
+            response = query.order("created_at").order("id").range(start, start + PAGE_SIZE - 1).execute()
+            rows = response.data or []
+            for row in rows:
+                if row.get("product_id"):
+                    seen.add(row["product_id"])
+                if row.get("created_at") and (watermark is None or row["created_at"] > watermark):
+                    watermark = row["created_at"]
+            if len(rows) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        seen.watermark = watermark
+        seen.loaded_at = started
+
+    def record(self, user_id: str, product_ids: Iterable, action_type: str):
+        """Mark products as seen after an action.
+
+        Works before the set is loaded too; the later load only adds to it.
+        """
+        if action_type not in SEEN_ACTIONS:
+            return
+        seen = self._entry(user_id)
+        for product_id in product_ids:
+            seen.add(product_id)
+
+
+seen_products = SeenProductsStore()
@@ -0,0 +1,94 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from saved_outfits import load_saved_outfits, SavedOutfitsCache
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.columns = "*"
+        self.filters = {}
+
+    def select(self, columns):
+        self.columns = columns
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def in_(self, column, values):
+        self.filters[column] = set(values)
+        return self
+
+    def execute(self):
+        self.client.queries.append((self.table, self.columns))
+        rows = [row for row in self.client.tables[self.table] if self._matches(row)]
+        if self.table == "user_actions" and "products(" in self.columns:
+            rows = [dict(row, products=self.client.products.get(row["product_id"])) for row in rows]
+        return type("Response", (), {"data": rows})()
+
+    def _matches(self, row):
+        for column, value in self.filters.items():
+            if isinstance(value, set) and row.get(column) not in value:
+                return False
+            if not isinstance(value, set) and row.get(column) != value:
+                return False
+        return True
+
+
+class FakeSupabase:
+    """Just enough of the postgrest client for load_saved_outfits, counting every query"""
+
+    def __init__(self, likes: int):
+        self.queries = []
+        self.products = {}
+        actions = []
+        for i in range(likes):
+            product_id = str(uuid.uuid4())
+            self.products[product_id] = {"id": product_id, "name": f"Product {i}", "price": 10}
+            # Three-item outfits, plus the odd single-item like
+            outfit_id = None if i % 7 == 0 else f"outfit-{i // 3}"
+            actions.append({"user_id": "user", "action": "like", "product_id": product_id, "outfit_id": outfit_id})
+        self.tables = {"user_actions": actions, "products": list(self.products.values())}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+@pytest.mark.parametrize("likes", [5, 200, 1000])
+def test_query_count_does_not_grow_with_likes(likes):
+    supabase = FakeSupabase(likes)
+
+    saved = load_saved_outfits(supabase, "user")
+
+    assert len(supabase.queries) == 1
+    assert sum(outfit["item_count"] for outfit in saved) == likes
+
+
+def test_deleted_products_are_left_out():
+    supabase = FakeSupabase(6)
+    deleted = next(iter(supabase.products))
+    del supabase.products[deleted]
+
+    saved = load_saved_outfits(supabase, "user")
+
+    assert sum(outfit["item_count"] for outfit in saved) == 5
+    assert all(item["id"] != deleted for outfit in saved for item in outfit["items"])
+
+
+def test_cache_entries_expire():
+    cache = SavedOutfitsCache(ttl_seconds=0)
+    cache.put("user", [])
+    assert cache.get("user") is None
+
+    cache = SavedOutfitsCache(ttl_seconds=60)
+    cache.put("user", [])
+    assert cache.get("user") == []
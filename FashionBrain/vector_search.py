@@ -1,57 +1,138 @@
 import numpy as np
-from supabase import create_client
+from db import get_supabase_client
 import os
-import json
 import traceback
 from dotenv import load_dotenv
+from embedding_index import EMBEDDING_FIELDS, get_catalog_snapshot, row_embedding
+from embedding_codec import encode_embedding
+from embedding_store import load_snapshot, schedule_save
+from product_cache import product_cache
 
 load_dotenv()
 
-def get_supabase_client():
-    """Create and return Supabase client"""
-    return create_client(
-        os.getenv("SUPABASE_URL"),
-        os.getenv("SUPABASE_KEY")
-    )
+# "rpc" searches with the match_products function in Supabase; "local" searches
+# the in-process catalog snapshot (IVF index) and skips the network round trip
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "rpc").lower()
 
-def search_products(embedding, top_k=5):
+# Reciprocal rank fusion constant: a product at rank r in one query's results scores 1 / (RRF_K + r)
+RRF_K = 60
+
+def warm_start():
+    """Memory-map the persisted catalog snapshot so local search is ready at startup"""
+    snapshot = get_catalog_snapshot()
+    if snapshot.loaded:
+        return
+    manifest = load_snapshot(snapshot)
+    if manifest:
+        print(f"Loaded {manifest['count']} product embeddings from store version {manifest['version']}")
+
+def _metadata_fetcher(supabase):
+    """Metadata for search hits restored from the embedding store, through the catalog cache"""
+    return lambda product_ids: product_cache.get_many(supabase, product_ids)
+
+def index_product(product):
+    """Add a newly inserted product to the local index if it has been loaded"""
+    snapshot = get_catalog_snapshot()
+    if snapshot.loaded:
+        snapshot.add_products([product])
+        schedule_save(snapshot)
+
+def remove_indexed_product(product_id):
+    """Tombstone a deleted product in the local index"""
+    snapshot = get_catalog_snapshot()
+    if snapshot.remove_product(product_id):
+        schedule_save(snapshot)
+
+def get_product_embeddings(products):
+    """
+    Embeddings for a list of products as a float32 (len(products), 512) array.
+    
+    Uses each product's own embedding when present (match_products_filtered
+    returns it as 'embedding_b64') and otherwise looks the product up in the
+    local catalog snapshot. Products with neither get a zero row.
+    """
+    snapshot = get_catalog_snapshot()
+    embeddings = snapshot.get_embeddings([p.get("id") for p in products])
+    for i, product in enumerate(products):
+        vector = row_embedding(product)
+        if vector is not None:
+            embeddings[i] = vector
+    return embeddings
+
+def has_local_embeddings():
+    """True once the local catalog snapshot can supply embeddings, so searches need not return them"""
+    return get_catalog_snapshot().loaded
+
+def take_product_embeddings(products):
+    """
+    Embeddings for products (as get_product_embeddings) and copies of the
+    products without their embedding fields.
+    
+    The embeddings are only for ranking; left on the products they would be
+    sent to clients inside every outfit (embedding_b64 is ~2.7 KB each).
+    """
+    embeddings = get_product_embeddings(products)
+    return embeddings, [{k: v for k, v in p.items() if k not in EMBEDDING_FIELDS} for p in products]
+
+def _filter_params(filters):
+    """RPC arguments for match_products_filtered; None leaves a predicate off"""
+    filters = filters or {}
+    categories = filters.get("categories")
+    exclude_ids = filters.get("exclude_ids")
+    return {
+        'categories': sorted({str(c).lower() for c in categories}) if categories is not None else None,
+        'min_price': filters.get("min_price"),
+        'max_price': filters.get("max_price"),
+        'exclude_ids': [str(pid) for pid in exclude_ids] if exclude_ids else None
+    }
+
+def search_products(embedding, top_k=5, nprobe=None, filters=None, include_embedding=True):
     """
     Search for similar products using Supabase's native pgvector similarity search.
     Uses the <-> operator for L2 distance calculation directly in the database.
     
+    With VECTOR_SEARCH_BACKEND=local the search runs against the in-process
+    catalog snapshot instead, which is also the fallback when the RPC fails.
+    
     Args:
         embedding: Query embedding as numpy array or list
         top_k: Number of top results to return
+        nprobe: IVF lists scanned by the local index (higher = better recall, slower)
+        filters: Optional dict applied inside the search, so every returned
+            product is usable: "categories" (set of category names, matched
+            case-insensitively), "min_price", "max_price" (per product) and
+            "exclude_ids" (product ids to leave out)
+        include_embedding: Return each product's embedding; pass False when the
+            caller doesn't need it (get_product_embeddings falls back to the
+            local snapshot) to cut the response to the product metadata
         
     Returns:
         List of products with similarity scores
     """
     supabase = get_supabase_client()
     
-    # Convert embedding to list if it's a numpy array
-    if isinstance(embedding, np.ndarray):
-        embedding_list = embedding.tolist()
-    else:
-        embedding_list = embedding
-    
-    # Format embedding as PostgreSQL array string
-    embedding_str = "[" + ",".join(str(x) for x in embedding_list) + "]"
+    if VECTOR_SEARCH_BACKEND == "local":
+        return _search_local(supabase, embedding, top_k, nprobe, filters)
     
     # Use Supabase RPC to perform vector similarity search
-    # The <-> operator calculates L2 distance between vectors
+    # The <-> operator calculates L2 distance between vectors; the query and
+    # the returned embeddings travel base64-encoded instead of as decimal text
     try:
         response = supabase.rpc(
-            'match_products',
+            'match_products_filtered',
             {
-                'query_embedding': embedding_str,
-                'match_threshold': 0.8,  # Optional similarity threshold
-                'match_count': top_k
+                'query_embedding_b64': encode_embedding(embedding),
+                'match_count': top_k,
+                'include_embedding': include_embedding,
+                **_filter_params(filters)
             }
         ).execute()
         
         if response.data:
             results = []
             for item in response.data:
+                if not include_embedding:
+                    item.pop('embedding_b64', None)
                 # Calculate similarity score from distance
                 distance = item.get('distance', 1.0)
                 similarity_score = 1 / (1 + distance)
@@ -64,63 +145,123 @@ def search_products(embedding, top_k=5):
             return results
     except Exception as e:
         # Fallback to direct SQL query if RPC function doesn't exist
-        print(f"RPC search failed, using direct SQL query: {e}")
+        print(f"RPC search failed, using local catalog snapshot: {e}")
         pass
     
-    # Fallback: Use direct SQL query with manual distance calculation
-    # This works if the RPC function isn't set up
+    # Fallback: search the in-process catalog snapshot
+    return _search_local(supabase, embedding, top_k, nprobe, filters)
+
+def _search_local(supabase, embedding, top_k, nprobe=None, filters=None):
+    """Search the in-process catalog snapshot. The snapshot is loaded once per
+    process and afterwards only pulls newly added products."""
     try:
-        # Query using PostgREST to get all products
-        response = supabase.table("products").select("*").execute()
-        
-        if not response.data:
-            print("No products found in database")
-            return []
-        
-        # Calculate distances manually and sort
-        products_with_distance = []
-        query_embedding = np.array(embedding_list, dtype=np.float32)
-        
-        for product in response.data:
-            if product.get("embedding"):
-                # Supabase may return embeddings as strings, lists, or already as arrays
-                embedding_data = product["embedding"]
-                
-                # Parse embedding if it's a string (JSON or PostgreSQL array format)
-                if isinstance(embedding_data, str):
-                    # Try JSON parsing first
-                    try:
-                        embedding_data = json.loads(embedding_data)
-                    except json.JSONDecodeError:
-                        # Handle PostgreSQL array format: "{1.0,2.0,3.0}"
-                        if embedding_data.startswith("{") and embedding_data.endswith("}"):
-                            embedding_data = [float(x) for x in embedding_data.strip("{}").split(",")]
-                        else:
-                            print(f"Failed to parse embedding for product {product.get('id')}")
-                            continue
-                
-                # Convert to numpy array
-                try:
-                    product_embedding = np.array(embedding_data, dtype=np.float32)
-                    # Calculate L2 distance
-                    distance = np.linalg.norm(query_embedding - product_embedding)
-                    products_with_distance.append({
-                        "product": product,
-                        "distance": float(distance),
-                        "similarity_score": float(1 / (1 + distance))
-                    })
-                except (ValueError, TypeError) as e:
-                    print(f"Error converting embedding to array for product {product.get('id')}: {e}")
-                    continue
+        snapshot = get_catalog_snapshot()
+        snapshot.ensure_fresh(supabase)
+        # Persisted later on a background thread, never inside the search
+        schedule_save(snapshot)
         
-        if not products_with_distance:
+        if len(snapshot) == 0:
             print("No valid embeddings found in products")
             return []
         
-        # Sort by distance (ascending) and return top_k
-        products_with_distance.sort(key=lambda x: x["distance"])
-        return products_with_distance[:top_k]
+        return snapshot.search(embedding, top_k=top_k, nprobe=nprobe, filters=filters,
+                               fetch_metadata=_metadata_fetcher(supabase))
+        
+    except Exception as e:
+        print(f"Vector search error: {e}")
+        traceback.print_exc()
+        return []
+
+def fuse_results(result_lists, top_k=5, method="rrf"):
+    """
+    Merge the result lists of several queries into one ranking.
+    
+    method="rrf" scores each product by the sum of 1 / (RRF_K + rank) over the
+    lists it appears in, favouring products several queries agree on;
+    method="max" keeps each product's best similarity, so a close match to
+    any single query wins. Each result keeps its best distance and gains a
+    "fusion_score".
+    """
+    if method not in ("rrf", "max"):
+        raise ValueError(f"Unknown fusion method: {method}")
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            product_id = str(result["product"].get("id"))
+            score = 1 / (RRF_K + rank) if method == "rrf" else result["similarity_score"]
+            entry = fused.get(product_id)
+            if entry is None:
+                fused[product_id] = dict(result, fusion_score=score)
+                continue
+            entry["fusion_score"] = entry["fusion_score"] + score if method == "rrf" else max(entry["fusion_score"], score)
+            if result["distance"] < entry["distance"]:
+                entry.update(product=result["product"], distance=result["distance"], similarity_score=result["similarity_score"])
+    # sorted() is stable, so ties keep first-seen order
+    return sorted(fused.values(), key=lambda r: -r["fusion_score"])[:top_k]
+
+def search_products_batch(embeddings, top_k=5, nprobe=None, filters=None, include_embedding=True, fusion="rrf"):
+    """
+    Search with several query vectors (e.g. one per inspiration image) and fuse the results.
+    
+    All queries go to the database in one match_products_batch call, or are
+    scored against the local snapshot with one matrix product, so 20 query
+    vectors cost about one search. Each query contributes its top_k
+    products; fuse_results() merges them into the top_k overall.
+    
+    Args:
+        embeddings: Query embeddings, shape (n, 512) or a list of vectors
+        top_k: Number of fused results to return
+        nprobe, filters, include_embedding: As for search_products
+        fusion: "rrf" (reciprocal rank fusion) or "max" (best similarity)
         
+    Returns:
+        List of products with similarity and fusion scores
+    """
+    if len(embeddings) == 0:
+        return []
+    queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    if len(queries) == 1:
+        return fuse_results([search_products(queries[0], top_k, nprobe, filters, include_embedding)], top_k, fusion)
+    
+    supabase = get_supabase_client()
+    if VECTOR_SEARCH_BACKEND != "local":
+        try:
+            response = supabase.rpc(
+                'match_products_batch',
+                {
+                    'query_embeddings_b64': [encode_embedding(query) for query in queries],
+                    'match_count': top_k,
+                    'include_embedding': include_embedding,
+                    **_filter_params(filters)
+                }
+            ).execute()
+            
+            if response.data:
+                result_lists = [[] for _ in queries]
+                for item in sorted(response.data, key=lambda row: (row['query_index'], row['distance'])):
+                    query_index = item.pop('query_index')
+                    if not include_embedding:
+                        item.pop('embedding_b64', None)
+                    distance = float(item.get('distance', 1.0))
+                    result_lists[query_index].append({
+                        "product": item,
+                        "distance": distance,
+                        "similarity_score": 1 / (1 + distance)
+                    })
+                return fuse_results(result_lists, top_k, fusion)
+        except Exception as e:
+            print(f"RPC batch search failed, using local catalog snapshot: {e}")
+    
+    return fuse_results(_search_local_batch(supabase, queries, top_k, nprobe, filters), top_k, fusion)
+
+def _search_local_batch(supabase, queries, top_k, nprobe=None, filters=None):
+    try:
+        snapshot = get_catalog_snapshot()
+        snapshot.ensure_fresh(supabase)
+        # Persisted later on a background thread, never inside the search
+        schedule_save(snapshot)
+        return snapshot.search_batch(queries, top_k=top_k, nprobe=nprobe, filters=filters,
+                                     fetch_metadata=_metadata_fetcher(supabase))
     except Exception as e:
         print(f"Vector search error: {e}")
         traceback.print_exc()